@@ -0,0 +1,125 @@
+"""
+Caché con invalidación por versión de modelo.
+
+Cada modelo registrado tiene un contador de versión en la caché que se
+incrementa en post_save / post_delete y en las operaciones masivas de
+`QuerySetVersionado` (update, bulk_create, bulk_update). Las claves de los
+datos cacheados incluyen las versiones de los modelos de los que dependen, de
+modo que un cambio deja huérfanas las entradas anteriores sin tener que
+buscarlas. Las versiones son marcas de tiempo en microsegundos, así que
+también sirven como fecha de última modificación para las peticiones
+condicionales. Con un backend compartido (archivo o base de datos) la invalidación
+llega a todos los workers.
+"""
+import datetime
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+
+_AUSENTE = object()
+
+# Modelos con invalidación conectada (ver conectar_invalidacion).
+MODELOS_VERSIONADOS = set()
+
+
+def _clave_version(modelo):
+    return f'version:{modelo._meta.label_lower}'
+
+
+def _version_inicial():
+    # Si la caché expulsa el contador, el nuevo valor no coincide con ninguno
+    # anterior y no se reutilizan entradas obsoletas.
+    return time.time_ns() // 1000
+
+
+def versiones(*modelos):
+    claves = [_clave_version(modelo) for modelo in modelos]
+    actuales = cache.get_many(claves)
+    for clave in claves:
+        if clave not in actuales:
+            cache.add(clave, _version_inicial(), None)
+            actuales[clave] = cache.get(clave)
+    return [actuales[clave] for clave in claves]
+
+
+def _incrementar(modelo):
+    clave = _clave_version(modelo)
+    anterior = cache.get(clave, 0)
+    cache.set(clave, max(_version_inicial(), anterior + 1), None)
+
+
+def incrementar_version(modelo):
+    """
+    Invalida todo lo cacheado que depende de `modelo`. Se incrementa en el
+    momento (para la propia transacción) y otra vez tras el commit, por si otra
+    petición cacheó entretanto los datos previos al commit.
+    """
+    _incrementar(modelo)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _incrementar(modelo))
+
+
+def ultima_modificacion(*modelos):
+    """Fecha (UTC) del último cambio registrado en cualquiera de `modelos`."""
+    return datetime.datetime.fromtimestamp(max(versiones(*modelos)) / 1_000_000, tz=datetime.timezone.utc)
+
+
+def clave(espacio, modelos, partes=()):
+    version = '.'.join(str(v) for v in versiones(*modelos))
+    resumen = hashlib.md5(repr(partes).encode()).hexdigest()
+    return f'{espacio}:{version}:{resumen}'
+
+
+def cacheado(espacio, modelos, partes, calcular, timeout=None):
+    """Devuelve el valor cacheado para (espacio, versiones, partes) o lo calcula y lo guarda."""
+    if timeout is None:
+        timeout = settings.CACHE_VERSIONADA_SEGUNDOS
+    nombre = clave(espacio, modelos, partes)
+    valor = cache.get(nombre, _AUSENTE)
+    if valor is _AUSENTE:
+        valor = calcular()
+        cache.set(nombre, valor, timeout)
+    return valor
+
+
+class QuerySetVersionado(models.QuerySet):
+    """QuerySet cuyas escrituras masivas (que no emiten señales) invalidan la versión del modelo."""
+
+    def update(self, **kwargs):
+        filas = super().update(**kwargs)
+        if filas:
+            incrementar_version(self.model)
+        return filas
+
+    def bulk_create(self, objs, *args, **kwargs):
+        creados = super().bulk_create(objs, *args, **kwargs)
+        if creados:
+            incrementar_version(self.model)
+        return creados
+
+    def bulk_update(self, objs, *args, **kwargs):
+        filas = super().bulk_update(objs, *args, **kwargs)
+        if filas:
+            incrementar_version(self.model)
+        return filas
+
+
+def _al_cambiar(sender, **kwargs):
+    incrementar_version(sender)
+
+
+def invalidar_todo():
+    """Incrementa la versión de todos los modelos versionados (p. ej. tras sincronizar una réplica)."""
+    for modelo in MODELOS_VERSIONADOS:
+        incrementar_version(modelo)
+
+
+def conectar_invalidacion(*modelos):
+    for modelo in modelos:
+        MODELOS_VERSIONADOS.add(modelo)
+        uid = f'cache_versionada:{modelo._meta.label_lower}'
+        post_save.connect(_al_cambiar, sender=modelo, dispatch_uid=uid)
+        post_delete.connect(_al_cambiar, sender=modelo, dispatch_uid=uid)
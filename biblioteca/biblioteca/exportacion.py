@@ -0,0 +1,169 @@
+"""
+Exportación en streaming de libros, préstamos (activos y archivados) e historial
+a CSV o JSONL.
+
+Las filas se leen con `values_list(...).iterator(chunk_size=...)` y se emiten
+por bloques, opcionalmente comprimidas con gzip, de modo que la memoria no
+depende del número de filas y la cabecera sale antes de ejecutar la consulta.
+La usan las vistas `historial:exportar` y el comando `exportar_datos`.
+"""
+import csv
+import datetime
+import zlib
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+FORMATOS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+TAMANO_BLOQUE = 2000
+
+
+def _exportaciones():
+    from historial.models import Historial
+    from libros.models import Libro
+    from prestamos.models import Prestamo, PrestamoArchivado
+
+    return {
+        'libros': {
+            'modelo': Libro,
+            'campos': [
+                'id', 'titulo', 'autor', 'editorial', 'año_publicacion', 'estado', 'cantidad_total',
+                'categoria__nombre', 'fecha_registro',
+            ],
+            'campo_fecha': 'fecha_registro',
+            'ordenamiento': ('id',),
+            'filtros': {'estado': 'estado', 'categoria': 'categoria_id'},
+        },
+        'prestamos': {
+            'modelo': Prestamo,
+            'campos': [
+                'id', 'usuario_id', 'usuario__username', 'libro_id', 'libro__titulo', 'estado',
+                'fecha_solicitud', 'fecha_aprobacion', 'fecha_devolucion_esperada', 'fecha_devolucion_real',
+                'aprobado_por_id', 'notas',
+            ],
+            'campo_fecha': 'fecha_solicitud',
+            'ordenamiento': ('id',),
+            'filtros': {'estado': 'estado', 'usuario': 'usuario_id', 'libro': 'libro_id'},
+        },
+        'prestamos_archivados': {
+            'modelo': PrestamoArchivado,
+            'campos': [
+                'id', 'usuario_id', 'usuario__username', 'libro_id', 'libro__titulo', 'estado',
+                'fecha_solicitud', 'fecha_aprobacion', 'fecha_devolucion_esperada', 'fecha_devolucion_real',
+                'aprobado_por_id', 'notas', 'fecha_archivado',
+            ],
+            'campo_fecha': 'fecha_solicitud',
+            'ordenamiento': ('id',),
+            'filtros': {'estado': 'estado', 'usuario': 'usuario_id', 'libro': 'libro_id'},
+        },
+        'historial': {
+            'modelo': Historial,
+            'campos': [
+                'id', 'fecha', 'usuario_id', 'usuario__username', 'tipo_entidad', 'tipo_accion', 'entidad_id',
+                'estado_anterior', 'estado_nuevo', 'detalles',
+            ],
+            'campo_fecha': 'fecha',
+            'ordenamiento': ('fecha', 'id'),
+            'filtros': {
+                'tipo_entidad': 'tipo_entidad', 'tipo_accion': 'tipo_accion',
+                'entidad': 'entidad_id', 'usuario': 'usuario_id', 'actor': 'usuario__username',
+            },
+        },
+    }
+
+
+def entidades():
+    return list(_exportaciones())
+
+
+def filtros(entidad):
+    return list(_exportaciones()[entidad]['filtros'])
+
+
+def _dia(texto, parametro):
+    try:
+        fecha = parse_date(texto)
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        raise ValueError(f'"{parametro}" debe ser una fecha AAAA-MM-DD.')
+    return timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.min))
+
+
+def consulta(entidad, parametros):
+    """
+    Devuelve (campos, filas) para `entidad` aplicando `parametros` (desde,
+    hasta y los filtros propios de cada entidad). Lanza ValueError si algún
+    parámetro no es válido.
+    """
+    exportaciones = _exportaciones()
+    if entidad not in exportaciones:
+        raise ValueError(f'Entidad desconocida "{entidad}"; usa {", ".join(exportaciones)}.')
+    configuracion = exportaciones[entidad]
+    filas = configuracion['modelo'].objects.all()
+
+    campo_fecha = configuracion['campo_fecha']
+    if parametros.get('desde'):
+        filas = filas.filter(**{f'{campo_fecha}__gte': _dia(parametros['desde'], 'desde')})
+    if parametros.get('hasta'):
+        hasta = _dia(parametros['hasta'], 'hasta') + datetime.timedelta(days=1)
+        filas = filas.filter(**{f'{campo_fecha}__lt': hasta})
+    for parametro, campo in configuracion['filtros'].items():
+        valor = parametros.get(parametro)
+        if valor:
+            filas = filas.filter(**{campo: valor.upper() if campo in ('estado', 'tipo_entidad', 'tipo_accion') else valor})
+
+    campos = configuracion['campos']
+    filas = filas.order_by(*configuracion['ordenamiento']).values_list(*campos)
+    return campos, filas.iterator(chunk_size=TAMANO_BLOQUE)
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve lo escrito en lugar de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def lineas(campos, filas, formato):
+    """Genera bloques de texto (cabecera primero) con hasta TAMANO_BLOQUE filas cada uno."""
+    if formato == 'csv':
+        escritor = csv.writer(_Eco())
+        yield escritor.writerow(campos)
+        convertir = escritor.writerow
+    elif formato == 'jsonl':
+        codificador = DjangoJSONEncoder(ensure_ascii=False)
+        convertir = lambda fila: codificador.encode(dict(zip(campos, fila))) + '\n'  # noqa: E731
+    else:
+        raise ValueError(f'Formato desconocido "{formato}"; usa {", ".join(FORMATOS)}.')
+
+    bloque = []
+    for fila in filas:
+        bloque.append(convertir(fila))
+        if len(bloque) >= TAMANO_BLOQUE:
+            yield ''.join(bloque)
+            bloque = []
+    if bloque:
+        yield ''.join(bloque)
+
+
+def codificar(bloques, comprimir=False):
+    """Convierte los bloques a bytes UTF-8 y, si se pide, los comprime con gzip sin acumularlos."""
+    if not comprimir:
+        for bloque in bloques:
+            yield bloque.encode('utf-8')
+        return
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for bloque in bloques:
+        # Z_SYNC_FLUSH entrega cada bloque al cliente en cuanto está listo.
+        yield compresor.compress(bloque.encode('utf-8')) + compresor.flush(zlib.Z_SYNC_FLUSH)
+    yield compresor.flush()
+
+
+def nombre_de_archivo(entidad, formato, comprimir=False):
+    nombre = f'{entidad}-{timezone.localdate():%Y%m%d}.{formato}'
+    return nombre + '.gz' if comprimir else nombre
@@ -0,0 +1,167 @@
+"""
+Instrumentación de consultas SQL por petición.
+
+`InstrumentacionSQLMiddleware` registra, para una fracción muestreada de las
+peticiones, cada consulta ejecutada (forma normalizada y duración), detecta
+formas que se repiten más de `SQL_N_MAS_UNO_UMBRAL` veces (patrón N+1), emite
+un log estructurado, añade la cabecera `Server-Timing` y acumula los peores
+casos en `estadisticas` para la página de diagnóstico.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('biblioteca.sql')
+
+_LISTA_PARAMETROS = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+_CADENAS = re.compile(r"'(?:[^']|'')*'")
+_NUMEROS = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+
+
+def normalizar_sql(sql):
+    """Reduce una consulta a su forma: sin literales y con las listas IN colapsadas."""
+    forma = _CADENAS.sub('?', sql)
+    forma = _NUMEROS.sub('?', forma)
+    forma = _LISTA_PARAMETROS.sub('(%s, ...)', forma)
+    return forma.replace('%s', '?')
+
+
+def agregar_server_timing(respuesta, nombre, duracion_ms, descripcion=None):
+    metrica = f'{nombre};dur={duracion_ms:.1f}'
+    if descripcion:
+        metrica += f';desc="{descripcion}"'
+    previa = respuesta.get('Server-Timing')
+    respuesta['Server-Timing'] = f'{previa}, {metrica}' if previa else metrica
+
+
+class RegistroConsultas:
+    """Envoltorio de `execute_wrapper` que anota SQL y duración de cada consulta."""
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append((sql, time.perf_counter() - inicio))
+
+    def resumen(self, umbral):
+        formas = {}
+        for sql, duracion in self.consultas:
+            forma = normalizar_sql(sql)
+            veces, tiempo = formas.get(forma, (0, 0.0))
+            formas[forma] = (veces + 1, tiempo + duracion)
+        repetidas = sorted(
+            ((forma, veces, tiempo * 1000) for forma, (veces, tiempo) in formas.items() if veces >= umbral),
+            key=lambda fila: fila[1], reverse=True,
+        )
+        return {
+            'consultas': len(self.consultas),
+            'tiempo_ms': sum(duracion for _, duracion in self.consultas) * 1000,
+            'formas_distintas': len(formas),
+            'repetidas': repetidas,
+        }
+
+
+class EstadisticasConsultas:
+    """Agregado en memoria (por proceso) de las peticiones muestreadas."""
+
+    MAXIMO_FORMAS = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.desde = time.time()
+            self.por_vista = {}
+            self.repetidas = {}
+
+    def acumular(self, vista, resumen):
+        with self._lock:
+            datos = self.por_vista.setdefault(vista, {
+                'vista': vista, 'peticiones': 0, 'consultas': 0, 'tiempo_ms': 0.0, 'max_consultas': 0,
+            })
+            datos['peticiones'] += 1
+            datos['consultas'] += resumen['consultas']
+            datos['tiempo_ms'] += resumen['tiempo_ms']
+            datos['max_consultas'] = max(datos['max_consultas'], resumen['consultas'])
+
+            for forma, veces, tiempo_ms in resumen['repetidas']:
+                clave = (vista, forma)
+                if clave not in self.repetidas and len(self.repetidas) >= self.MAXIMO_FORMAS:
+                    continue
+                datos = self.repetidas.setdefault(clave, {
+                    'vista': vista, 'forma': forma, 'apariciones': 0, 'max_repeticiones': 0, 'tiempo_ms': 0.0,
+                })
+                datos['apariciones'] += 1
+                datos['max_repeticiones'] = max(datos['max_repeticiones'], veces)
+                datos['tiempo_ms'] += tiempo_ms
+
+    def peores_vistas(self, limite=20):
+        with self._lock:
+            vistas = [dict(datos) for datos in self.por_vista.values()]
+        for datos in vistas:
+            datos['media_consultas'] = datos['consultas'] / datos['peticiones']
+            datos['media_tiempo_ms'] = datos['tiempo_ms'] / datos['peticiones']
+        return sorted(vistas, key=lambda datos: datos['tiempo_ms'], reverse=True)[:limite]
+
+    def peores_repetidas(self, limite=20):
+        with self._lock:
+            repetidas = [dict(datos) for datos in self.repetidas.values()]
+        return sorted(repetidas, key=lambda datos: datos['tiempo_ms'], reverse=True)[:limite]
+
+
+estadisticas = EstadisticasConsultas()
+
+
+class InstrumentacionSQLMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        muestreo = getattr(settings, 'SQL_INSTRUMENTACION_MUESTREO', 0)
+        if not muestreo or random.random() >= muestreo:
+            return self.get_response(request)
+
+        registro = RegistroConsultas()
+        inicio = time.perf_counter()
+        with ExitStack() as pila:
+            for alias in connections:
+                pila.enter_context(connections[alias].execute_wrapper(registro))
+            respuesta = self.get_response(request)
+        total_ms = (time.perf_counter() - inicio) * 1000
+
+        resumen = registro.resumen(getattr(settings, 'SQL_N_MAS_UNO_UMBRAL', 5))
+        vista = request.resolver_match.view_name if request.resolver_match else request.path
+        estadisticas.acumular(vista, resumen)
+
+        agregar_server_timing(respuesta, 'db', resumen['tiempo_ms'], f'{resumen["consultas"]} consultas')
+        agregar_server_timing(respuesta, 'total', total_ms)
+
+        datos = {
+            'vista': vista,
+            'metodo': request.method,
+            'ruta': request.path,
+            'estado': respuesta.status_code,
+            'total_ms': round(total_ms, 2),
+            'consultas': resumen['consultas'],
+            'db_ms': round(resumen['tiempo_ms'], 2),
+            'formas_distintas': resumen['formas_distintas'],
+            'repetidas': [
+                {'forma': forma, 'veces': veces, 'tiempo_ms': round(tiempo_ms, 2)}
+                for forma, veces, tiempo_ms in resumen['repetidas']
+            ],
+        }
+        nivel = logging.WARNING if resumen['repetidas'] else logging.INFO
+        logger.log(nivel, json.dumps(datos, ensure_ascii=False), extra={'sql': datos})
+        return respuesta
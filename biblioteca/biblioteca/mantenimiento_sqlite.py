@@ -0,0 +1,53 @@
+"""
+Mantenimiento periódico de SQLite en modo WAL.
+
+Con conexiones persistentes el WAL sólo se recorta cuando un checkpoint
+encuentra un momento sin lectores, y `PRAGMA optimize` (que SQLite recomienda
+ejecutar al cerrar cada conexión) no llega a correr. Lo hace el comando
+`mantener_sqlite`, pensado para cron; un solo proceso debe ejecutarlo, porque
+varios checkpoints sobre el mismo archivo compiten entre sí.
+`TareaMantenimiento` lo repite cada `SQLITE_MANTENIMIENTO_INTERVALO` segundos
+dentro del proceso web, solo si se activa (desactivado por defecto).
+"""
+import logging
+import threading
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def mantener(alias='default', modo='PASSIVE'):
+    """
+    Ejecuta PRAGMA optimize y un checkpoint del WAL. Devuelve la fila de
+    wal_checkpoint: (bloqueado, páginas en el WAL, páginas copiadas).
+    """
+    conexion = connections[alias]
+    if conexion.vendor != 'sqlite':
+        return None
+    with conexion.cursor() as cursor:
+        cursor.execute('PRAGMA optimize')
+        cursor.execute(f'PRAGMA wal_checkpoint({modo})')
+        return cursor.fetchone()
+
+
+class TareaMantenimiento(threading.Thread):
+    """Ejecuta `mantener` cada `intervalo` segundos dentro del proceso."""
+
+    def __init__(self, intervalo):
+        super().__init__(name='mantenimiento-sqlite', daemon=True)
+        self.intervalo = intervalo
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                resultado = mantener()
+                if resultado and resultado[0]:
+                    logger.info('Checkpoint del WAL incompleto: %s de %s páginas', resultado[2], resultado[1])
+            except Exception:
+                logger.exception('Falló el mantenimiento de SQLite')
+            finally:
+                connections.close_all()
+
+    def detener(self):
+        self._detener.set()
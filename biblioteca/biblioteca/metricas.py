@@ -0,0 +1,285 @@
+"""
+Métricas en formato de exposición de Prometheus.
+
+Cada proceso acumula en memoria contadores e histogramas (latencia por vista,
+consultas SQL y tiempo de renderizado de plantillas) y los vuelca como JSON en
+`METRICAS_DIRECTORIO/<pid>.json` como mucho cada `METRICAS_VOLCADO_SEGUNDOS`.
+El endpoint `/metrics` suma los archivos de todos los procesos, de modo que el
+resultado es el mismo sea cual sea el worker de gunicorn que atiende la
+petición. Los archivos de procesos que ya no existen (workers reiniciados) se
+borran al agregar; Prometheus trata la bajada como un reinicio del contador.
+Los indicadores de negocio se calculan con consultas indexadas y se guardan en
+la caché versionada (como mucho `METRICAS_CONTADORES_SEGUNDOS`).
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates
+from django.utils import timezone
+from biblioteca.cache_versionada import cacheado
+
+LIMITES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PETICIONES = 'biblioteca_peticiones_total'
+DURACION_PETICION = 'biblioteca_peticion_duracion_segundos'
+CONSULTAS = 'biblioteca_consultas_total'
+DURACION_CONSULTAS = 'biblioteca_consultas_duracion_segundos_total'
+DURACION_PLANTILLA = 'biblioteca_plantilla_duracion_segundos'
+
+AYUDA = {
+    PETICIONES: ('counter', 'Peticiones atendidas por vista, método y código de estado.'),
+    DURACION_PETICION: ('histogram', 'Latencia de las peticiones por vista y método.'),
+    CONSULTAS: ('counter', 'Consultas SQL ejecutadas por vista.'),
+    DURACION_CONSULTAS: ('counter', 'Tiempo total en consultas SQL por vista.'),
+    DURACION_PLANTILLA: ('histogram', 'Tiempo de renderizado por plantilla principal.'),
+    'biblioteca_prestamos_pendientes': ('gauge', 'Préstamos pendientes de aprobación.'),
+    'biblioteca_prestamos_activos': ('gauge', 'Préstamos aprobados o vencidos sin devolver.'),
+    'biblioteca_prestamos_vencidos': ('gauge', 'Préstamos sin devolver con la fecha de devolución superada.'),
+    'biblioteca_titulos_disponibles': ('gauge', 'Títulos con al menos un ejemplar disponible.'),
+}
+
+
+class RegistroMetricas:
+    """Contadores e histogramas del proceso actual, indexados por (nombre, etiquetas)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores = {}
+        self.histogramas = {}
+        self._ultimo_volcado = 0.0
+
+    def incrementar(self, nombre, etiquetas, valor=1):
+        clave = (nombre, tuple(etiquetas))
+        with self._lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, etiquetas, valor):
+        clave = (nombre, tuple(etiquetas))
+        with self._lock:
+            # Un contador por intervalo (no acumulado) más +Inf, suma y cuenta.
+            datos = self.histogramas.get(clave)
+            if datos is None:
+                datos = self.histogramas[clave] = [0] * (len(LIMITES) + 3)
+            datos[bisect.bisect_left(LIMITES, valor)] += 1
+            datos[-2] += valor
+            datos[-1] += 1
+
+    def instantanea(self):
+        with self._lock:
+            return {
+                'contadores': [[nombre, list(etiquetas), valor] for (nombre, etiquetas), valor in self.contadores.items()],
+                'histogramas': [[nombre, list(etiquetas), list(datos)] for (nombre, etiquetas), datos in self.histogramas.items()],
+            }
+
+    def volcar(self, forzar=False):
+        directorio = settings.METRICAS_DIRECTORIO
+        ahora = time.monotonic()
+        if not directorio or (not forzar and ahora - self._ultimo_volcado < settings.METRICAS_VOLCADO_SEGUNDOS):
+            return
+        self._ultimo_volcado = ahora
+        directorio = Path(directorio)
+        directorio.mkdir(parents=True, exist_ok=True)
+        temporal = directorio / f'.{os.getpid()}.tmp'
+        temporal.write_text(json.dumps(self.instantanea()))
+        os.replace(temporal, directorio / f'{os.getpid()}.json')
+
+
+registro = RegistroMetricas()
+atexit.register(lambda: registro.volcar(forzar=True))
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def agregar_procesos():
+    """Suma las instantáneas de todos los procesos (o solo la del actual si no hay directorio)."""
+    directorio = settings.METRICAS_DIRECTORIO
+    if directorio:
+        registro.volcar(forzar=True)
+        instantaneas = []
+        for ruta in Path(directorio).glob('*.json'):
+            if ruta.stem.isdigit() and not _proceso_vivo(int(ruta.stem)):
+                ruta.unlink(missing_ok=True)
+                continue
+            try:
+                instantaneas.append(json.loads(ruta.read_text()))
+            except (OSError, ValueError):
+                continue
+    else:
+        instantaneas = [registro.instantanea()]
+
+    contadores = {}
+    histogramas = {}
+    for instantanea in instantaneas:
+        for nombre, etiquetas, valor in instantanea['contadores']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            contadores[clave] = contadores.get(clave, 0) + valor
+        for nombre, etiquetas, datos in instantanea['histogramas']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            acumulado = histogramas.setdefault(clave, [0] * len(datos))
+            for i, valor in enumerate(datos):
+                acumulado[i] += valor
+    return contadores, histogramas
+
+
+def contadores_de_negocio():
+    from libros.models import Libro
+    from prestamos.models import Prestamo
+
+    def calcular():
+        # Un COUNT por estado para que cada uno recorra solo su rango del índice
+        # (estado, -fecha_aprobacion); los aprobados atrasados usan el índice
+        # parcial de vencimientos y los títulos, libros_disponibles_idx.
+        por_estado = {
+            estado: Prestamo.objects.filter(estado=estado).count() for estado in ('PENDIENTE', 'APROBADO', 'VENCIDO')
+        }
+        atrasados = Prestamo.objects.filter(estado='APROBADO', fecha_devolucion_esperada__lt=timezone.now()).count()
+        return {
+            'biblioteca_prestamos_pendientes': por_estado['PENDIENTE'],
+            'biblioteca_prestamos_activos': por_estado['APROBADO'] + por_estado['VENCIDO'],
+            'biblioteca_prestamos_vencidos': por_estado['VENCIDO'] + atrasados,
+            'biblioteca_titulos_disponibles': Libro.objects.filter(cantidad_total__gt=0).count(),
+        }
+
+    return cacheado('metricas', (Prestamo, Libro), (), calcular, settings.METRICAS_CONTADORES_SEGUNDOS)
+
+
+def _etiquetas(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ''
+    valores = ','.join(
+        '{}="{}"'.format(clave, str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for clave, valor in pares
+    )
+    return '{' + valores + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def exposicion():
+    contadores, histogramas = agregar_procesos()
+    lineas = []
+
+    def cabecera(nombre):
+        tipo, ayuda = AYUDA[nombre]
+        lineas.append(f'# HELP {nombre} {ayuda}')
+        lineas.append(f'# TYPE {nombre} {tipo}')
+
+    for nombre in sorted({nombre for nombre, _ in contadores}):
+        cabecera(nombre)
+        for (otro, etiquetas), valor in sorted(contadores.items()):
+            if otro == nombre:
+                lineas.append(f'{nombre}{_etiquetas(etiquetas)} {_numero(valor)}')
+
+    for nombre in sorted({nombre for nombre, _ in histogramas}):
+        cabecera(nombre)
+        for (otro, etiquetas), datos in sorted(histogramas.items()):
+            if otro != nombre:
+                continue
+            acumulado = 0
+            for limite, valor in zip(LIMITES + ('+Inf',), datos):
+                acumulado += valor
+                lineas.append(f'{nombre}_bucket{_etiquetas(etiquetas, [("le", limite)])} {acumulado}')
+            lineas.append(f'{nombre}_sum{_etiquetas(etiquetas)} {_numero(datos[-2])}')
+            lineas.append(f'{nombre}_count{_etiquetas(etiquetas)} {datos[-1]}')
+
+    for nombre, valor in contadores_de_negocio().items():
+        cabecera(nombre)
+        lineas.append(f'{nombre} {valor}')
+
+    return '\n'.join(lineas) + '\n'
+
+
+def ip_del_cliente(request):
+    # Con la cabecera configurada no se recurre a REMOTE_ADDR (sería la del proxy).
+    if settings.METRICAS_CABECERA_IP:
+        return request.META.get(settings.METRICAS_CABECERA_IP, '').split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR')
+
+
+def exponer_metricas(request):
+    if ip_del_cliente(request) not in settings.METRICAS_IPS_PERMITIDAS:
+        return HttpResponseForbidden()
+    return HttpResponse(exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ContadorConsultas:
+    def __init__(self):
+        self.consultas = 0
+        self.duracion = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas += 1
+            self.duracion += time.perf_counter() - inicio
+
+
+class MetricasMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        contador = ContadorConsultas()
+        inicio = time.perf_counter()
+        with ExitStack() as pila:
+            for alias in connections:
+                pila.enter_context(connections[alias].execute_wrapper(contador))
+            respuesta = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+
+        vista = request.resolver_match.view_name if request.resolver_match else 'sin_vista'
+        registro.incrementar(PETICIONES, [('vista', vista), ('metodo', request.method), ('estado', respuesta.status_code)])
+        registro.observar(DURACION_PETICION, [('vista', vista), ('metodo', request.method)], duracion)
+        registro.incrementar(CONSULTAS, [('vista', vista)], contador.consultas)
+        registro.incrementar(DURACION_CONSULTAS, [('vista', vista)], contador.duracion)
+        registro.volcar()
+        return respuesta
+
+
+class PlantillaMedida:
+    """Envuelve una plantilla del backend de Django para medir su renderizado."""
+
+    def __init__(self, plantilla):
+        self._plantilla = plantilla
+
+    def __getattr__(self, nombre):
+        return getattr(self._plantilla, nombre)
+
+    def render(self, context=None, request=None):
+        inicio = time.perf_counter()
+        try:
+            return self._plantilla.render(context, request)
+        finally:
+            nombre = self._plantilla.origin.template_name or 'desde_cadena'
+            registro.observar(DURACION_PLANTILLA, [('plantilla', nombre)], time.perf_counter() - inicio)
+
+
+class PlantillasDjangoMedidas(DjangoTemplates):
+    """Backend DjangoTemplates que registra el tiempo de renderizado de cada plantilla."""
+
+    def from_string(self, template_code):
+        return PlantillaMedida(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return PlantillaMedida(super().get_template(template_name))
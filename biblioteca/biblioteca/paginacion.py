@@ -0,0 +1,228 @@
+"""
+Paginación por cursor (keyset) para listados grandes.
+
+En lugar de OFFSET y COUNT(*), cada página se pide a partir de los valores
+de ordenamiento del último (o primer) registro de la página anterior, de modo
+que la página N cuesta lo mismo que la primera mientras exista un índice que
+cubra el ordenamiento.
+"""
+import base64
+import datetime
+import functools
+import heapq
+import json
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+PARAM_DESPUES = 'despues'
+PARAM_ANTES = 'antes'
+
+
+class _CodificadorCursor(DjangoJSONEncoder):
+    # DjangoJSONEncoder recorta las fechas a milisegundos; el cursor necesita
+    # la precisión completa para no repetir ni saltar filas.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def codificar_cursor(valores):
+    datos = json.dumps(valores, cls=_CodificadorCursor, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (ValueError, TypeError):
+        return None
+    return valores if isinstance(valores, list) else None
+
+
+def _campo_de_orden(queryset, nombre):
+    """Campo (o campo de salida de la anotación) por el que se ordena."""
+    if nombre in queryset.query.annotations:
+        return queryset.query.annotations[nombre].output_field
+    modelo = queryset.model
+    *relaciones, campo = nombre.split('__')
+    for relacion in relaciones:
+        modelo = modelo._meta.get_field(relacion).related_model
+    return modelo._meta.get_field(campo)
+
+
+def _valores_del_cursor(queryset, ordenamiento, valores):
+    """
+    Convierte los valores del cursor al tipo de cada campo del ordenamiento.
+    Devuelve None si no corresponden (cursor manipulado o de otro listado):
+    se trata igual que una petición sin cursor.
+    """
+    if valores is None or len(valores) != len(ordenamiento):
+        return None
+    convertidos = []
+    for orden, valor in zip(ordenamiento, valores):
+        if valor is None or isinstance(valor, (list, dict)):
+            return None
+        try:
+            convertidos.append(_campo_de_orden(queryset, _campo(orden)[0]).to_python(valor))
+        except (ValidationError, TypeError, ValueError):
+            return None
+    return convertidos
+
+
+def _campo(orden):
+    return (orden[1:], True) if orden.startswith('-') else (orden, False)
+
+
+def _invertir(orden):
+    return orden[1:] if orden.startswith('-') else f'-{orden}'
+
+
+def _filtro_cursor(ordenamiento, valores, hacia_adelante):
+    """
+    Construye `(a, b, c) > (va, vb, vc)` respetando la dirección de cada campo.
+    El primer campo se acota además con >= / <= para que el índice pueda usarse.
+    """
+    operadores = []
+    for orden in ordenamiento:
+        _, descendente = _campo(orden)
+        operadores.append('lt' if descendente == hacia_adelante else 'gt')
+
+    nombre, _ = _campo(ordenamiento[-1])
+    condicion = Q(**{f'{nombre}__{operadores[-1]}': valores[-1]})
+    for i in range(len(ordenamiento) - 2, -1, -1):
+        nombre, _ = _campo(ordenamiento[i])
+        condicion = Q(**{f'{nombre}__{operadores[i]}': valores[i]}) | (Q(**{nombre: valores[i]}) & condicion)
+
+    nombre, _ = _campo(ordenamiento[0])
+    return Q(**{f'{nombre}__{operadores[0]}e': valores[0]}) & condicion
+
+
+class PaginaCursor:
+    def __init__(self, objetos, ordenamiento, hay_anterior, hay_siguiente, prefijo=''):
+        self.object_list = objetos
+        self.ordenamiento = ordenamiento
+        self.prefijo = prefijo
+        self.has_previous = hay_anterior
+        self.has_next = hay_siguiente
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _valores(self, objeto):
+        valores = []
+        for orden in self.ordenamiento:
+            nombre, _ = _campo(orden)
+            valores.append(getattr(objeto, nombre))
+        return valores
+
+    @property
+    def cursor_anterior(self):
+        if not self.has_previous or not self.object_list:
+            return None
+        return codificar_cursor(self._valores(self.object_list[0]))
+
+    @property
+    def cursor_siguiente(self):
+        if not self.has_next or not self.object_list:
+            return None
+        return codificar_cursor(self._valores(self.object_list[-1]))
+
+    def enlace(self, request, parametro, cursor, **extra):
+        parametros = request.GET.copy()
+        parametros.pop(self.prefijo + PARAM_ANTES, None)
+        parametros.pop(self.prefijo + PARAM_DESPUES, None)
+        parametros[self.prefijo + parametro] = cursor
+        for clave, valor in extra.items():
+            parametros[clave] = valor
+        return f'?{parametros.urlencode()}'
+
+    def enlaces(self, request, **extra):
+        """Devuelve las URLs relativas (anterior, siguiente), conservando los filtros actuales."""
+        anterior = self.cursor_anterior
+        siguiente = self.cursor_siguiente
+        return (
+            self.enlace(request, PARAM_ANTES, anterior, **extra) if anterior else None,
+            self.enlace(request, PARAM_DESPUES, siguiente, **extra) if siguiente else None,
+        )
+
+
+def paginar_por_cursor(queryset, ordenamiento, request, tamano, prefijo=''):
+    """
+    Pagina `queryset` según `ordenamiento` (lista de campos, con '-' para
+    descendente; el último debe ser único, p. ej. 'id'). Lee el cursor de los
+    parámetros `despues` / `antes` de la petición; `prefijo` permite paginar
+    varias tablas independientes en la misma página.
+    """
+    ordenamiento = list(ordenamiento)
+    despues = _valores_del_cursor(queryset, ordenamiento, decodificar_cursor(request.GET.get(prefijo + PARAM_DESPUES)))
+    antes = _valores_del_cursor(queryset, ordenamiento, decodificar_cursor(request.GET.get(prefijo + PARAM_ANTES)))
+
+    if antes is not None:
+        filas = list(
+            queryset.filter(_filtro_cursor(ordenamiento, antes, hacia_adelante=False))
+            .order_by(*[_invertir(orden) for orden in ordenamiento])[:tamano + 1]
+        )
+        hay_anterior = len(filas) > tamano
+        filas = filas[:tamano]
+        filas.reverse()
+        return PaginaCursor(filas, ordenamiento, hay_anterior, True, prefijo)
+
+    hay_anterior = False
+    if despues is not None:
+        queryset = queryset.filter(_filtro_cursor(ordenamiento, despues, hacia_adelante=True))
+        hay_anterior = True
+
+    filas = list(queryset.order_by(*ordenamiento)[:tamano + 1])
+    hay_siguiente = len(filas) > tamano
+    return PaginaCursor(filas[:tamano], ordenamiento, hay_anterior, hay_siguiente, prefijo)
+
+
+def _comparar(ordenamiento):
+    """Compara dos objetos según `ordenamiento` (NULL primero, como SQLite en orden ascendente)."""
+    campos = [_campo(orden) for orden in ordenamiento]
+
+    def comparar(a, b):
+        for nombre, descendente in campos:
+            x, y = getattr(a, nombre), getattr(b, nombre)
+            if x == y:
+                continue
+            menor = y is not None and (x is None or x < y)
+            return (1 if menor else -1) if descendente else (-1 if menor else 1)
+        return 0
+    return functools.cmp_to_key(comparar)
+
+
+def paginar_por_cursor_en_partes(querysets, ordenamiento, request, tamano, prefijo=''):
+    """
+    Como `paginar_por_cursor` sobre la unión de varios querysets disjuntos
+    (p. ej. uno por estado). Cada parte se pagina con el mismo cursor, de modo
+    que recorre su propio rango del índice ya ordenado, y las filas se mezclan;
+    un solo `estado IN (...)` obligaría a SQLite a ordenar en un B-tree temporal.
+    """
+    ordenamiento = list(ordenamiento)
+    paginas = [paginar_por_cursor(queryset, ordenamiento, request, tamano, prefijo) for queryset in querysets]
+    filas = list(heapq.merge(*[pagina.object_list for pagina in paginas], key=_comparar(ordenamiento)))
+    antes = decodificar_cursor(request.GET.get(prefijo + PARAM_ANTES))
+    if _valores_del_cursor(querysets[0], ordenamiento, antes) is not None:
+        hay_anterior = len(filas) > tamano or any(pagina.has_previous for pagina in paginas)
+        return PaginaCursor(filas[-tamano:], ordenamiento, hay_anterior, True, prefijo)
+    hay_siguiente = len(filas) > tamano or any(pagina.has_next for pagina in paginas)
+    hay_anterior = any(pagina.has_previous for pagina in paginas)
+    return PaginaCursor(filas[:tamano], ordenamiento, hay_anterior, hay_siguiente, prefijo)
+
+
+def tamano_de_pagina(request, por_defecto, maximo, prefijo=''):
+    """Lee `por_pagina` de la petición, acotado a [1, maximo]."""
+    try:
+        tamano = int(request.GET.get(prefijo + 'por_pagina', por_defecto))
+    except (TypeError, ValueError):
+        tamano = por_defecto
+    return max(1, min(tamano, maximo))
@@ -0,0 +1,130 @@
+"""
+Perfilado de CPU de peticiones lentas.
+
+`PerfiladorMiddleware` perfila las peticiones cuando `PERFILADO_ACTIVO` está
+activado o cuando un administrador envía la cabecera `X-Perfilar` (cuyo valor,
+si es numérico, sustituye al umbral en ms). Solo se guardan en
+`PERFILADO_DIRECTORIO` los perfiles de peticiones que superan
+`PERFILADO_UMBRAL_MS`, en formato de pilas colapsadas (muestreo periódico de la
+pila del hilo, barato) o pstats (cProfile, exacto pero más costoso).
+El comando `analizar_perfiles` los agrega por vista.
+"""
+import cProfile
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from django.conf import settings
+
+COLAPSADO = 'colapsado'
+PSTATS = 'pstats'
+
+EXTENSIONES = {COLAPSADO: '.collapsed', PSTATS: '.prof'}
+
+CABECERA = 'HTTP_X_PERFILAR'
+
+_CARACTERES_ARCHIVO = re.compile(r'[^\w.-]+')
+_RAIZ_PYTHON = re.compile(r'^.*/lib/python\d+\.\d+/(?:site-packages/)?')
+
+
+def acortar_ruta(archivo):
+    """Ruta relativa al proyecto, a site-packages o a la biblioteca estándar."""
+    raiz = str(settings.BASE_DIR) + '/'
+    if archivo.startswith(raiz):
+        return archivo[len(raiz):]
+    return _RAIZ_PYTHON.sub('', archivo)
+
+
+def etiqueta_de_codigo(codigo):
+    return f'{acortar_ruta(codigo.co_filename)}:{codigo.co_qualname}'
+
+
+class MuestreadorPila(threading.Thread):
+    """Hilo que captura la pila de otro hilo cada `intervalo` segundos."""
+
+    def __init__(self, hilo_id, intervalo):
+        super().__init__(daemon=True)
+        self.hilo_id = hilo_id
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            marco = sys._current_frames().get(self.hilo_id)
+            pila = []
+            while marco is not None:
+                pila.append(etiqueta_de_codigo(marco.f_code))
+                marco = marco.f_back
+            if pila:
+                self.pilas[';'.join(reversed(pila))] += 1
+
+    def detener(self):
+        self._detener.set()
+        self.join()
+
+    def guardar(self, ruta):
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            for pila, muestras in self.pilas.most_common():
+                archivo.write(f'{pila} {muestras}\n')
+
+
+class PerfiladorMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def umbral_ms(self, request):
+        """Umbral aplicable a la petición, o None si no debe perfilarse."""
+        cabecera = request.META.get(CABECERA)
+        usuario = getattr(request, 'user', None)
+        if cabecera is not None and usuario is not None and getattr(usuario, 'rol', None) in ['ADMINISTRADOR', 'SUPERADMINISTRADOR']:
+            try:
+                return float(cabecera)
+            except ValueError:
+                return settings.PERFILADO_UMBRAL_MS
+        if settings.PERFILADO_ACTIVO:
+            return settings.PERFILADO_UMBRAL_MS
+        return None
+
+    def __call__(self, request):
+        umbral = self.umbral_ms(request)
+        if umbral is None:
+            return self.get_response(request)
+
+        formato = settings.PERFILADO_FORMATO
+        if formato == PSTATS:
+            perfilador = cProfile.Profile()
+            inicio = time.perf_counter()
+            perfilador.enable()
+            try:
+                respuesta = self.get_response(request)
+            finally:
+                perfilador.disable()
+        else:
+            perfilador = MuestreadorPila(threading.get_ident(), settings.PERFILADO_INTERVALO)
+            perfilador.start()
+            inicio = time.perf_counter()
+            try:
+                respuesta = self.get_response(request)
+            finally:
+                perfilador.detener()
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+
+        if duracion_ms >= umbral:
+            vista = request.resolver_match.view_name if request.resolver_match else 'sin_vista'
+            directorio = Path(settings.PERFILADO_DIRECTORIO)
+            directorio.mkdir(parents=True, exist_ok=True)
+            nombre = _CARACTERES_ARCHIVO.sub('_', f'{vista.replace(":", ".")}__{time.time():.6f}__{duracion_ms:.0f}ms')
+            ruta = directorio / (nombre + EXTENSIONES[formato])
+            if formato == PSTATS:
+                perfilador.dump_stats(ruta)
+            else:
+                perfilador.guardar(ruta)
+        return respuesta
+
+
+def vista_de_archivo(ruta):
+    """Recupera el nombre de la vista a partir del nombre del archivo de perfil."""
+    return Path(ruta).name.split('__', 1)[0].replace('.', ':')
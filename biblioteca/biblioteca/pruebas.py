@@ -0,0 +1,68 @@
+"""
+Utilidades compartidas por las pruebas de las aplicaciones.
+"""
+import re
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+
+class EjecutorPruebas(DiscoverRunner):
+    """
+    Ejecutor de `manage.py test`: fija los ajustes que deben ser distintos en
+    pruebas (cada prueba puede cambiarlos con override_settings).
+    """
+    ajustes = {'HISTORIAL_ESCRITURA': 'sincrona'}
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._ajustes = override_settings(**self.ajustes)
+        self._ajustes.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._ajustes.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+# "SCAN tabla" sin "USING ... INDEX" es un recorrido completo de la tabla.
+_ESCANEO_COMPLETO = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+# Django usa alias U0, U1... en las subconsultas; el plan muestra el alias.
+_ALIAS = re.compile(r'"(\w+)" (U\d+)')
+
+
+class PlanDeConsultaMixin:
+    """
+    Ejecuta EXPLAIN QUERY PLAN sobre cada SELECT que emite una vista y falla
+    si alguna recorre completa una de las tablas grandes.
+    """
+    tablas_vigiladas = ('libros', 'prestamos', 'historial')
+
+    def plan_de_consulta(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [fila[-1] for fila in cursor.fetchall()]
+
+    def escaneos_completos(self, sql):
+        alias = {alias: tabla for tabla, alias in _ALIAS.findall(sql)}
+        escaneos = []
+        for detalle in self.plan_de_consulta(sql):
+            coincidencia = _ESCANEO_COMPLETO.match(detalle)
+            if coincidencia and alias.get(coincidencia.group(1), coincidencia.group(1)) in self.tablas_vigiladas:
+                escaneos.append(detalle)
+        return escaneos
+
+    def assertSinEscaneoCompleto(self, url):
+        # Sin caché para que la vista ejecute todas sus consultas.
+        cache.clear()
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200, url)
+        for consulta in consultas.captured_queries:
+            sql = consulta['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            escaneos = self.escaneos_completos(sql)
+            self.assertFalse(escaneos, f'{url} recorre tablas completas {escaneos}:\n{sql}')
+        return respuesta
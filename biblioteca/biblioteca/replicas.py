@@ -0,0 +1,76 @@
+"""
+Lecturas en réplicas de solo lectura.
+
+`ReplicasMiddleware` marca como aptas para réplica las peticiones GET/HEAD a
+las vistas de `VISTAS_EN_REPLICA` (listados e informes). Dentro de ellas
+`EnrutadorReplicas` envía las lecturas a una de `REPLICAS`; las escrituras van
+siempre a 'default' y, en cuanto una petición escribe, el resto de sus
+lecturas también. Tras una escritura se fija una cookie para que las
+siguientes peticiones del mismo navegador lean del primario durante
+`REPLICA_RETARDO_SEGUNDOS` y vean sus propios cambios aunque la réplica aún no
+se haya sincronizado (comando `sincronizar_replica`).
+"""
+import contextvars
+import random
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+COOKIE_PRIMARIO = 'leer_primario'
+
+_estado = contextvars.ContextVar('estado_replicas', default=None)
+
+
+class EnrutadorReplicas:
+    def db_for_read(self, model, **hints):
+        estado = _estado.get()
+        if not settings.REPLICAS or estado is None or not estado['activa'] or estado['escrito']:
+            return None
+        # Las relaciones de un objeto ya cargado se leen de su misma base.
+        instancia = hints.get('instance')
+        if instancia is not None and instancia._state.db:
+            return instancia._state.db
+        return random.choice(settings.REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        estado = _estado.get()
+        if estado is not None:
+            estado['escrito'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicasMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        estado = {'activa': False, 'escrito': False}
+        token = _estado.set(estado)
+        try:
+            respuesta = self.get_response(request)
+        finally:
+            _estado.reset(token)
+        if estado['escrito'] and settings.REPLICAS:
+            respuesta.set_cookie(
+                COOKIE_PRIMARIO, '1', max_age=settings.REPLICA_RETARDO_SEGUNDOS, httponly=True, samesite='Lax'
+            )
+        return respuesta
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            settings.REPLICAS
+            and request.method in ('GET', 'HEAD')
+            and request.resolver_match.view_name in settings.VISTAS_EN_REPLICA
+            and COOKIE_PRIMARIO not in request.COOKIES
+        ):
+            # La sesión y el usuario se cargan antes, desde el primario, para
+            # que un inicio de sesión reciente no dependa de la réplica.
+            if hasattr(request, 'user'):
+                request.user.pk
+            _estado.get()['activa'] = True
+        return None
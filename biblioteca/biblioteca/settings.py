@@ -50,10 +50,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'biblioteca.metricas.MetricasMiddleware',
+    'biblioteca.instrumentacion.InstrumentacionSQLMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'biblioteca.replicas.ReplicasMiddleware',
+    'biblioteca.perfilado.PerfiladorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -62,7 +66,8 @@ ROOT_URLCONF = 'biblioteca.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'biblioteca.metricas.PlantillasDjangoMedidas',
+        'NAME': 'django',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -88,6 +93,85 @@ DATABASES = {
     }
 }
 
+# Perfil de SQLite para varios workers: WAL (lectores y un escritor en
+# paralelo), fsync sólo en los checkpoints, espera en lugar de "database is
+# locked", conexiones persistentes y transacciones BEGIN IMMEDIATE (en WAL una
+# transacción diferida que pasa de leer a escribir falla sin esperar;
+# transaction_mode requiere Django 5.1).
+# SQLITE_PERFIL=basico deja los valores por defecto de Django.
+SQLITE_PERFIL = os.environ.get('SQLITE_PERFIL', 'optimizado')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 10000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,
+    'temp_store': 'MEMORY',
+}
+if SQLITE_PERFIL == 'optimizado':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {pragma}={valor}' for pragma, valor in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    })
+
+# Réplica de solo lectura para listados e informes (ver biblioteca/replicas.py).
+# SQLITE_REPLICA es la ruta de una copia que mantiene al día el comando
+# sincronizar_replica; en las pruebas la réplica es un espejo de 'default'.
+SQLITE_REPLICA = os.environ.get('SQLITE_REPLICA')
+if SQLITE_REPLICA:
+    DATABASES['replica'] = {**DATABASES['default'], 'NAME': SQLITE_REPLICA, 'TEST': {'MIRROR': 'default'}}
+REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['biblioteca.replicas.EnrutadorReplicas']
+VISTAS_EN_REPLICA = [
+    'libros:lista',
+    'libros:buscar',
+    'prestamos:lista_prestamos',
+    'prestamos:cliente_historial_prestamos',
+    'historial:lista_historial',
+    'historial:historial_por_entidad',
+    'usuarios:lista_usuarios',
+    'metricas',
+]
+# Tras una escritura, el navegador lee del primario durante este tiempo.
+REPLICA_RETARDO_SEGUNDOS = 30
+
+# Mantenimiento de SQLite (PRAGMA optimize + checkpoint del WAL). Debe correr en
+# un solo proceso: lo normal es programar `manage.py mantener_sqlite` con cron.
+# SQLITE_MANTENIMIENTO_INTERVALO (segundos) lo ejecuta además dentro del proceso
+# web; activarlo solo con un único worker y sin --preload (el hilo arrancaría en
+# el proceso maestro y no pasaría a los workers).
+SQLITE_MANTENIMIENTO_INTERVALO = int(os.environ.get('SQLITE_MANTENIMIENTO_INTERVALO', 0)) or None
+
+# Caché. Con varios workers de gunicorn hace falta un backend compartido
+# ('archivo' o 'base_de_datos', este último requiere `manage.py createcachetable`)
+# para que la invalidación por versión llegue a todos los procesos.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memoria' if DEBUG else 'archivo')
+
+CACHES = {
+    'default': {
+        'memoria': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'biblioteca',
+        },
+        'archivo': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIRECTORIO', BASE_DIR / 'cache'),
+        },
+        'base_de_datos': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache_biblioteca',
+        },
+    }[CACHE_BACKEND] | {'OPTIONS': {'MAX_ENTRIES': 5000}},
+}
+
+# Vida máxima de las entradas de la caché versionada (se invalidan antes si
+# cambian los modelos de los que dependen).
+CACHE_VERSIONADA_SEGUNDOS = 3600
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -136,4 +220,89 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'usuarios.Usuario'
 
 # Custom login URL
-LOGIN_URL = '/usuarios/login/'
\ No newline at end of file
+LOGIN_URL = '/usuarios/login/'
+
+# Paginación por cursor del catálogo de libros
+CATALOGO_POR_PAGINA = 25
+CATALOGO_POR_PAGINA_MAXIMO = 100
+
+# Paginación de cada tabla del panel de préstamos
+PRESTAMOS_POR_PAGINA = 25
+PRESTAMOS_POR_PAGINA_MAXIMO = 100
+# Máximo de préstamos por operación en lote
+PRESTAMOS_LOTE_MAXIMO = 500
+# Los préstamos devueltos o rechazados hace más de estos días se mueven a
+# prestamos_archivados (comando archivar_prestamos).
+PRESTAMOS_ARCHIVO_DIAS = int(os.environ.get('PRESTAMOS_ARCHIVO_DIAS', 180))
+
+# Escritura del historial de auditoría: 'diferida' (bulk_create por lotes
+# tras el commit) o 'sincrona' (un INSERT por registro). Las pruebas usan
+# 'sincrona' (lo fija EjecutorPruebas): TestCase nunca confirma, así que en
+# diferida no se escribiría nada. Un registro que falla HISTORIAL_REINTENTOS
+# veces se descarta (queda en el log), y la cola nunca pasa de
+# HISTORIAL_BUFFER_LIMITE registros.
+HISTORIAL_ESCRITURA = os.environ.get('HISTORIAL_ESCRITURA', 'diferida')
+HISTORIAL_BUFFER_MAXIMO = 200
+HISTORIAL_BUFFER_SEGUNDOS = 2.0
+HISTORIAL_REINTENTOS = 5
+HISTORIAL_BUFFER_LIMITE = 10000
+TEST_RUNNER = 'biblioteca.pruebas.EjecutorPruebas'
+
+# Paginación por cursor del historial. Cuando no se pueden usar los conteos
+# diarios (filtro por actor o por entidad) se cuenta como mucho hasta
+# HISTORIAL_CONTEO_MAXIMO registros.
+HISTORIAL_POR_PAGINA = 20
+HISTORIAL_POR_PAGINA_MAXIMO = 100
+HISTORIAL_CONTEO_MAXIMO = 1000
+
+# Retención del historial: el comando archivar_historial mueve los meses
+# completos anteriores a HISTORIAL_RETENCION_DIAS a segmentos gzip JSONL en
+# HISTORIAL_ARCHIVO_DIRECTORIO (uno por mes, inmutables).
+HISTORIAL_RETENCION_DIAS = int(os.environ.get('HISTORIAL_RETENCION_DIAS', 365))
+HISTORIAL_ARCHIVO_DIRECTORIO = Path(os.environ.get('HISTORIAL_ARCHIVO_DIRECTORIO', BASE_DIR / 'archivo_historial'))
+
+# Segundos entre ejecuciones del marcado de préstamos vencidos dentro de cada
+# proceso web. Vacío lo desactiva (usar el comando marcar_prestamos_vencidos).
+PRESTAMOS_VENCIMIENTOS_INTERVALO = int(os.environ.get('PRESTAMOS_VENCIMIENTOS_INTERVALO', 0)) or None
+
+# Instrumentación SQL por petición: fracción de peticiones muestreadas (0 la
+# desactiva) y repeticiones de una misma forma de consulta que se consideran N+1.
+SQL_INSTRUMENTACION_MUESTREO = float(os.environ.get('SQL_INSTRUMENTACION_MUESTREO', 0.05))
+SQL_N_MAS_UNO_UMBRAL = 5
+
+# Perfilado de CPU de peticiones lentas. Con PERFILADO_ACTIVO se perfilan todas
+# las peticiones; si no, solo las de administradores con la cabecera X-Perfilar.
+# Formato 'colapsado' (muestreo de pila) o 'pstats' (cProfile).
+PERFILADO_ACTIVO = os.environ.get('PERFILADO_ACTIVO', '') == '1'
+PERFILADO_UMBRAL_MS = float(os.environ.get('PERFILADO_UMBRAL_MS', 500))
+PERFILADO_FORMATO = os.environ.get('PERFILADO_FORMATO', 'colapsado')
+PERFILADO_INTERVALO = 0.005
+PERFILADO_DIRECTORIO = Path(os.environ.get('PERFILADO_DIRECTORIO', BASE_DIR / 'perfiles'))
+
+# Endpoint /metrics (formato Prometheus). Con METRICAS_DIRECTORIO cada proceso
+# vuelca sus métricas ahí para que se sumen las de todos los workers de gunicorn;
+# sin él, /metrics solo muestra las del proceso que atiende la petición.
+METRICAS_DIRECTORIO = Path(os.environ['METRICAS_DIRECTORIO']) if os.environ.get('METRICAS_DIRECTORIO') else None
+METRICAS_VOLCADO_SEGUNDOS = 5
+METRICAS_CONTADORES_SEGUNDOS = 30
+# Detrás de un proxy inverso REMOTE_ADDR es siempre la del proxy: en ese caso
+# METRICAS_CABECERA_IP indica la cabecera con la IP del cliente (p. ej.
+# HTTP_X_FORWARDED_FOR) y se usa su último valor, el que añadió el proxy. Solo
+# debe activarse si la aplicación no es accesible salvo a través del proxy.
+METRICAS_IPS_PERMITIDAS = os.environ.get('METRICAS_IPS_PERMITIDAS', '127.0.0.1,::1').split(',')
+METRICAS_CABECERA_IP = os.environ.get('METRICAS_CABECERA_IP') or None
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'consola': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'biblioteca.sql': {
+            'handlers': ['consola'],
+            'level': os.environ.get('SQL_LOG_NIVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,42 @@
+"""
+Una transacción por petición que modifica datos.
+
+`transaccion_por_peticion` envuelve la vista en `transaction.atomic()`, de modo
+que el guardado de la entidad, los ajustes de existencias y el historial se
+confirman juntos con un único COMMIT (un solo fsync) o no se confirman. Con el
+perfil de SQLite optimizado la transacción empieza con BEGIN IMMEDIATE, así que
+el bloqueo de escritura se toma al principio y no falla al pasar de leer a
+escribir. Los efectos secundarios no críticos que registran las vistas con
+`transaction.on_commit` (cola del historial, invalidación de caché) se
+ejecutan sólo si la transacción confirma.
+"""
+from functools import wraps
+from django.db import transaction
+
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+def transaccion_por_peticion(vista=None, incluir_get=False):
+    """
+    Decorador de vistas. Por defecto sólo abre la transacción para métodos que
+    modifican datos; `incluir_get=True` es para vistas que escriben en un GET
+    (p. ej. aprobar o devolver un préstamo desde un enlace).
+
+    El bloqueo de escritura al inicio depende de `transaction_mode='IMMEDIATE'`
+    (perfil optimizado); con SQLITE_PERFIL=basico la transacción es diferida y
+    puede fallar con "database is locked" al pasar de leer a escribir. Los
+    errores que la vista capture deben ir dentro de su propio
+    `transaction.atomic()` (punto de guardado) para no invalidar la petición.
+    """
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(request, *args, **kwargs):
+            if request.method in METODOS_SEGUROS and not incluir_get:
+                return funcion(request, *args, **kwargs)
+            with transaction.atomic():
+                return funcion(request, *args, **kwargs)
+        # wraps() lo copia a los decoradores exteriores (p. ej. benchmark_vistas lo consulta).
+        envoltura.escribe_en_get = incluir_get
+        return envoltura
+
+    return decorador(vista) if vista is not None else decorador
@@ -17,9 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import RedirectView
+from biblioteca.metricas import exponer_metricas
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', exponer_metricas, name='metricas'),
     path('', RedirectView.as_view(url='/libros/', permanent=True)),
     path('usuarios/', include('usuarios.urls')),
     path('libros/', include('libros.urls')),
@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'biblioteca.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.SQLITE_MANTENIMIENTO_INTERVALO:
+    from biblioteca.mantenimiento_sqlite import TareaMantenimiento
+    TareaMantenimiento(settings.SQLITE_MANTENIMIENTO_INTERVALO).start()
+
+if settings.PRESTAMOS_VENCIMIENTOS_INTERVALO:
+    from prestamos.vencimientos import TareaVencimientos
+    TareaVencimientos(settings.PRESTAMOS_VENCIMIENTOS_INTERVALO).start()
@@ -7,3 +7,4 @@ pip install -r requirements.txt
 python manage.py collectstatic --noinput
 python manage.py makemigrations
 python manage.py migrate
+python manage.py createcachetable
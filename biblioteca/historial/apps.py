@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class HistorialConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'historial'
+
+
+    def ready(self):
+        import atexit
+        from django.core.signals import request_finished
+        from .escritura import escritor
+
+        request_finished.connect(escritor.al_terminar_peticion, dispatch_uid='historial_vaciar_buffer')
+        # Un apagado ordenado del worker no debe perder registros encolados.
+        atexit.register(escritor.vaciar)
@@ -0,0 +1,202 @@
+"""
+Archivo en frío del historial.
+
+`archivar_mes` copia los registros de un mes a un segmento gzip JSONL de solo
+lectura en HISTORIAL_ARCHIVO_DIRECTORIO y, en la misma transacción en que
+anota el segmento y las entidades que contiene (SegmentoHistorial y
+EntidadArchivada), los borra de la tabla `historial`. Si algo falla antes del
+commit, el archivo se elimina y los registros siguen en la tabla.
+
+Cada línea del segmento es un registro con las claves de CAMPOS, en ese orden
+y sin espacios; `registros_archivados` aprovecha ese formato fijo para
+descartar líneas sin decodificarlas y solo abre los segmentos que el índice
+señala para la entidad.
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from collections import Counter
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .models import EntidadArchivada, Historial, SegmentoHistorial
+
+CAMPOS = (
+    'id', 'fecha', 'usuario_id', 'tipo_entidad', 'tipo_accion', 'entidad_id',
+    'detalles', 'estado_anterior', 'estado_nuevo',
+)
+
+TAMANO_BLOQUE = 2000
+
+
+def inicio_de_mes(fecha):
+    return fecha.replace(day=1)
+
+
+def mes_siguiente(mes):
+    return (mes + datetime.timedelta(days=32)).replace(day=1)
+
+
+def _limites(mes):
+    inicio = timezone.make_aware(datetime.datetime.combine(mes, datetime.time.min))
+    fin = timezone.make_aware(datetime.datetime.combine(mes_siguiente(mes), datetime.time.min))
+    return inicio, fin
+
+
+def ruta_segmento(segmento):
+    return Path(settings.HISTORIAL_ARCHIVO_DIRECTORIO) / segmento.archivo
+
+
+def limite_de_retencion(dias=None):
+    """Primer día del mes más antiguo que debe seguir en la tabla."""
+    if dias is None:
+        dias = settings.HISTORIAL_RETENCION_DIAS
+    return inicio_de_mes(timezone.now().date() - datetime.timedelta(days=dias))
+
+
+def meses_pendientes(limite):
+    """Meses con registros anteriores a `limite`, del más antiguo al más reciente."""
+    primera = Historial.objects.order_by('fecha', 'id').values_list('fecha', flat=True).first()
+    if primera is None:
+        return []
+    meses = []
+    mes = inicio_de_mes(timezone.localdate(primera))
+    while mes < limite:
+        meses.append(mes)
+        mes = mes_siguiente(mes)
+    return meses
+
+
+def registros_del_mes(mes):
+    inicio, fin = _limites(mes)
+    return Historial.objects.filter(fecha__gte=inicio, fecha__lt=fin)
+
+
+def _linea(fila):
+    datos = dict(zip(CAMPOS, fila))
+    datos['fecha'] = datos['fecha'].isoformat()
+    return json.dumps(datos, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def _escribir_segmento(temporal, filas):
+    """Escribe el segmento y devuelve (registros, ids, fechas, entidades)."""
+    registros = 0
+    ids = [None, None]
+    fechas = [None, None]
+    entidades = Counter()
+    with gzip.open(temporal, 'wt', encoding='utf-8', compresslevel=9) as destino:
+        bloque = []
+        for fila in filas:
+            if registros == 0:
+                ids[0] = fila[0]
+                fechas = [fila[1], fila[1]]
+            else:
+                fechas = [min(fechas[0], fila[1]), max(fechas[1], fila[1])]
+            ids[1] = fila[0]
+            entidades[(fila[3], fila[5])] += 1
+            registros += 1
+            bloque.append(_linea(fila))
+            if len(bloque) >= TAMANO_BLOQUE:
+                destino.write(''.join(bloque))
+                bloque = []
+        destino.write(''.join(bloque))
+    with open(temporal, 'rb') as origen:
+        os.fsync(origen.fileno())
+    return registros, ids, fechas, entidades
+
+
+def archivar_mes(mes):
+    """
+    Mueve los registros de `mes` a un segmento nuevo. Devuelve el
+    SegmentoHistorial creado, o None si el mes no tiene registros.
+    """
+    filas = registros_del_mes(mes).order_by('id').values_list(*CAMPOS).iterator(chunk_size=TAMANO_BLOQUE)
+    directorio = Path(settings.HISTORIAL_ARCHIVO_DIRECTORIO)
+    directorio.mkdir(parents=True, exist_ok=True)
+    # Un mes ya archivado que vuelve a tener registros recibe otra parte.
+    parte = SegmentoHistorial.objects.filter(mes=mes).count() + 1
+    nombre = f'historial-{mes:%Y-%m}-{parte:02d}.jsonl.gz'
+    ruta = directorio / nombre
+    temporal = directorio / f'.{nombre}.tmp'
+
+    try:
+        registros, ids, fechas, entidades = _escribir_segmento(temporal, filas)
+        if not registros:
+            temporal.unlink()
+            return None
+        with open(temporal, 'rb') as origen:
+            resumen = hashlib.file_digest(origen, 'sha256').hexdigest()
+        os.chmod(temporal, 0o444)
+        os.replace(temporal, ruta)
+
+        with transaction.atomic():
+            segmento = SegmentoHistorial.objects.create(
+                mes=mes, archivo=nombre, registros=registros,
+                id_minimo=ids[0], id_maximo=ids[1],
+                fecha_minima=fechas[0], fecha_maxima=fechas[1], sha256=resumen,
+            )
+            EntidadArchivada.objects.bulk_create(
+                [
+                    EntidadArchivada(segmento=segmento, tipo_entidad=tipo, entidad_id=entidad_id, registros=total)
+                    for (tipo, entidad_id), total in entidades.items()
+                ],
+                batch_size=1000,
+            )
+            borrados, _ = registros_del_mes(mes).filter(id__gte=ids[0], id__lte=ids[1]).delete()
+            if borrados != registros:
+                raise RuntimeError(
+                    f'Se archivaron {registros} registros de {mes:%Y-%m} pero se borrarían {borrados}; '
+                    'no se modifica la tabla.'
+                )
+    except BaseException:
+        temporal.unlink(missing_ok=True)
+        if ruta.exists() and not SegmentoHistorial.objects.filter(archivo=nombre).exists():
+            ruta.unlink()
+        raise
+    return segmento
+
+
+def verificar_segmento(segmento):
+    """Comprueba que el archivo existe y conserva el sha256 con que se creó."""
+    try:
+        with open(ruta_segmento(segmento), 'rb') as origen:
+            return hashlib.file_digest(origen, 'sha256').hexdigest() == segmento.sha256
+    except FileNotFoundError:
+        return False
+
+
+def total_archivado(tipo_entidad, entidad_id):
+    return EntidadArchivada.objects.filter(
+        tipo_entidad=tipo_entidad, entidad_id=entidad_id
+    ).aggregate(total=Sum('registros'))['total'] or 0
+
+
+def registros_archivados(tipo_entidad, entidad_id):
+    """
+    Registros archivados de una entidad, de más reciente a más antiguo, como
+    instancias de Historial sin guardar. Solo se leen los segmentos en los que
+    el índice indica que aparece.
+    """
+    segmentos = SegmentoHistorial.objects.filter(
+        entidades__tipo_entidad=tipo_entidad, entidades__entidad_id=entidad_id,
+    ).distinct()
+    marca = f'"tipo_entidad":{json.dumps(tipo_entidad)},'
+    marca_entidad = f',"entidad_id":{int(entidad_id)},'
+
+    registros = []
+    for segmento in segmentos:
+        with gzip.open(ruta_segmento(segmento), 'rt', encoding='utf-8') as origen:
+            for linea in origen:
+                if marca_entidad not in linea or marca not in linea:
+                    continue
+                datos = json.loads(linea)
+                if datos['tipo_entidad'] != tipo_entidad or datos['entidad_id'] != int(entidad_id):
+                    continue
+                datos['fecha'] = datetime.datetime.fromisoformat(datos['fecha'])
+                registros.append(Historial(**datos))
+    registros.sort(key=lambda registro: (registro.fecha, registro.id), reverse=True)
+    return registros
@@ -0,0 +1,133 @@
+"""
+Escritura diferida (write-behind) del historial de auditoría.
+
+En modo 'diferida' los registros se encolan en memoria del proceso y se
+insertan con un único bulk_create. Un registro sólo entra en la cola cuando la
+transacción que lo generó confirma (si se revierte, se descarta). La cola se
+vacía al terminar cada petición, al alcanzar HISTORIAL_BUFFER_MAXIMO registros,
+pasados HISTORIAL_BUFFER_SEGUNDOS, o al salir el proceso. Si el lote falla se
+reintenta registro a registro; los que siguen fallando vuelven a la cola hasta
+HISTORIAL_REINTENTOS veces y la cola se recorta a HISTORIAL_BUFFER_LIMITE.
+
+En modo 'sincrona' cada registro se inserta de inmediato, como antes; es el
+modo que usan las pruebas (ver biblioteca.pruebas.EjecutorPruebas).
+"""
+import logging
+import threading
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+SINCRONA = 'sincrona'
+DIFERIDA = 'diferida'
+
+
+class EscritorHistorial:
+    def __init__(self):
+        self._registros = []
+        self._lock = threading.Lock()
+        self._temporizador = None
+
+    @property
+    def modo(self):
+        return getattr(settings, 'HISTORIAL_ESCRITURA', SINCRONA)
+
+    def pendientes(self):
+        with self._lock:
+            return len(self._registros)
+
+    def registrar(self, registro):
+        if self.modo != DIFERIDA:
+            registro.save()
+            return registro
+        transaction.on_commit(lambda: self._encolar(registro))
+        return registro
+
+    def registrar_lote(self, registros):
+        from .models import Historial
+
+        if not registros:
+            return registros
+        if self.modo != DIFERIDA:
+            return Historial.objects.bulk_create(registros, batch_size=500)
+        transaction.on_commit(lambda: self._encolar(*registros))
+        return registros
+
+    def _encolar(self, *registros):
+        with self._lock:
+            self._registros.extend(registros)
+            lleno = len(self._registros) >= settings.HISTORIAL_BUFFER_MAXIMO
+            if not lleno and self._temporizador is None:
+                self._temporizador = threading.Timer(
+                    settings.HISTORIAL_BUFFER_SEGUNDOS, self._vaciar_por_tiempo
+                )
+                self._temporizador.daemon = True
+                self._temporizador.start()
+        if lleno:
+            self.vaciar()
+
+    def vaciar(self):
+        """Inserta todos los registros encolados con un solo bulk_create."""
+        from .models import Historial
+
+        with self._lock:
+            registros, self._registros = self._registros, []
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+                self._temporizador = None
+        if not registros:
+            return 0
+        try:
+            with transaction.atomic():
+                Historial.objects.bulk_create(registros, batch_size=500)
+            return len(registros)
+        except Exception:
+            logger.exception('No se pudo escribir el lote del historial; se reintenta registro a registro')
+
+        # Uno a uno, para que un registro que nunca podrá escribirse no bloquee al resto.
+        escritos, fallidos = 0, []
+        for registro in registros:
+            try:
+                with transaction.atomic():
+                    Historial.objects.bulk_create([registro])
+                escritos += 1
+            except Exception:
+                fallidos.append(registro)
+        self._reencolar(fallidos)
+        return escritos
+
+    def _reencolar(self, registros):
+        """Devuelve los fallidos al principio de la cola, descartando los agotados y el exceso."""
+        descartados, pendientes = [], []
+        for registro in registros:
+            registro._intentos_escritura = getattr(registro, '_intentos_escritura', 0) + 1
+            agotado = registro._intentos_escritura >= settings.HISTORIAL_REINTENTOS
+            (descartados if agotado else pendientes).append(registro)
+        with self._lock:
+            self._registros[:0] = pendientes
+            exceso = len(self._registros) - settings.HISTORIAL_BUFFER_LIMITE
+            if exceso > 0:
+                descartados += self._registros[:exceso]
+                del self._registros[:exceso]
+        for registro in descartados:
+            logger.error(
+                'Registro de historial descartado: %s %s de %s %s (usuario %s): %s',
+                registro.fecha, registro.tipo_accion, registro.tipo_entidad, registro.entidad_id,
+                registro.usuario_id, registro.detalles,
+            )
+
+    def _vaciar_por_tiempo(self):
+        with self._lock:
+            self._temporizador = None
+        try:
+            self.vaciar()
+        finally:
+            # El temporizador corre en su propio hilo, con su propia conexión.
+            connections.close_all()
+
+    def al_terminar_peticion(self, **kwargs):
+        self.vaciar()
+
+
+escritor = EscritorHistorial()
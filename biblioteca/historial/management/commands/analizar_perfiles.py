@@ -0,0 +1,77 @@
+import pstats
+from collections import Counter, defaultdict
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from biblioteca.perfilado import EXTENSIONES, COLAPSADO, PSTATS, acortar_ruta, vista_de_archivo
+
+
+class Command(BaseCommand):
+    help = 'Agrega los perfiles guardados por PerfiladorMiddleware y muestra las funciones más costosas por vista'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directorio', default=str(settings.PERFILADO_DIRECTORIO))
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument('--vista', help='Limitar a una vista (p. ej. libros:lista)')
+
+    def handle(self, *args, **options):
+        directorio = Path(options['directorio'])
+        if not directorio.is_dir():
+            raise CommandError(f'No existe el directorio de perfiles {directorio}.')
+
+        archivos = defaultdict(lambda: {COLAPSADO: [], PSTATS: []})
+        for formato, extension in EXTENSIONES.items():
+            for ruta in directorio.glob(f'*{extension}'):
+                vista = vista_de_archivo(ruta)
+                if not options['vista'] or vista == options['vista']:
+                    archivos[vista][formato].append(ruta)
+
+        if not archivos:
+            self.stdout.write('No hay perfiles que analizar.')
+            return
+
+        for vista in sorted(archivos):
+            if archivos[vista][COLAPSADO]:
+                self.informe_colapsado(vista, archivos[vista][COLAPSADO], options['top'])
+            if archivos[vista][PSTATS]:
+                self.informe_pstats(vista, archivos[vista][PSTATS], options['top'])
+
+    def informe_colapsado(self, vista, rutas, top):
+        propias = Counter()
+        inclusivas = Counter()
+        total = 0
+        for ruta in rutas:
+            with open(ruta, encoding='utf-8') as archivo:
+                for linea in archivo:
+                    pila, _, muestras = linea.rstrip('\n').rpartition(' ')
+                    if not pila:
+                        continue
+                    muestras = int(muestras)
+                    marcos = pila.split(';')
+                    total += muestras
+                    propias[marcos[-1]] += muestras
+                    for marco in set(marcos):
+                        inclusivas[marco] += muestras
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{vista}: {len(rutas)} perfiles muestreados, {total} muestras'
+        ))
+        self.stdout.write(f'{"propio %":>9} {"incl. %":>8}  función')
+        for marco, muestras in propias.most_common(top):
+            self.stdout.write(
+                f'{100 * muestras / total:>8.1f}% {100 * inclusivas[marco] / total:>7.1f}%  {marco}'
+            )
+
+    def informe_pstats(self, vista, rutas, top):
+        estadisticas = pstats.Stats(*[str(ruta) for ruta in rutas])
+        total = estadisticas.total_tt or 1
+        filas = sorted(estadisticas.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{vista}: {len(rutas)} perfiles cProfile, {total * 1000:.1f} ms en total'
+        ))
+        self.stdout.write(f'{"propio ms":>10} {"acum. ms":>10} {"llamadas":>9}  función')
+        for (archivo, linea, funcion), (_, llamadas, propio, acumulado, _) in filas:
+            self.stdout.write(
+                f'{propio * 1000:>10.1f} {acumulado * 1000:>10.1f} {llamadas:>9}  {acortar_ruta(archivo)}:{linea}({funcion})'
+            )
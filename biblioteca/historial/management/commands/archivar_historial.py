@@ -0,0 +1,64 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from historial import archivo
+from historial.models import SegmentoHistorial
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve los meses completos del historial anteriores a la retención a segmentos '
+        'gzip JSONL inmutables, uno por mes, con su índice de entidades'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help='Retención en días (por defecto HISTORIAL_RETENCION_DIAS)')
+        parser.add_argument('--simular', action='store_true', help='Solo muestra los meses y registros a archivar')
+        parser.add_argument('--vacuum', action='store_true', help='Ejecuta VACUUM al terminar para devolver el espacio')
+        parser.add_argument('--verificar', action='store_true', help='Comprueba el sha256 de los segmentos existentes')
+
+    def handle(self, *args, **options):
+        if options['verificar']:
+            self.verificar()
+            return
+
+        limite = archivo.limite_de_retencion(options['dias'])
+        meses = archivo.meses_pendientes(limite)
+        if not meses:
+            self.stdout.write(f'No hay registros anteriores a {limite:%Y-%m-%d}.')
+            return
+
+        archivados = 0
+        for mes in meses:
+            if options['simular']:
+                registros = archivo.registros_del_mes(mes).count()
+                if registros:
+                    self.stdout.write(f'{mes:%Y-%m}: {registros} registros')
+                continue
+            segmento = archivo.archivar_mes(mes)
+            if segmento is None:
+                continue
+            archivados += segmento.registros
+            self.stdout.write(
+                f'{mes:%Y-%m}: {segmento.registros} registros, {segmento.entidades.count()} entidades -> {segmento.archivo}'
+            )
+
+        if options['simular']:
+            return
+        self.stdout.write(self.style.SUCCESS(f'{archivados} registros archivados anteriores a {limite:%Y-%m-%d}.'))
+        if options['vacuum'] and archivados and connection.vendor == 'sqlite':
+            # El espacio liberado ya se reutiliza sin VACUUM; esto además encoge el archivo.
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+            call_command('mantener_sqlite', stdout=self.stdout)
+
+    def verificar(self):
+        errores = 0
+        for segmento in SegmentoHistorial.objects.order_by('mes', 'id'):
+            if archivo.verificar_segmento(segmento):
+                self.stdout.write(f'{segmento.archivo}: correcto ({segmento.registros} registros)')
+            else:
+                errores += 1
+                self.stdout.write(self.style.ERROR(f'{segmento.archivo}: no existe o no coincide el sha256'))
+        if errores:
+            raise CommandError(f'{errores} segmento(s) dañados o ausentes.')
@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+PERFILES = ('basico', 'optimizado')
+
+ESQUEMA = """
+CREATE TABLE libros (id INTEGER PRIMARY KEY, titulo TEXT NOT NULL, cantidad_total INTEGER NOT NULL);
+CREATE TABLE historial (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, fecha TEXT NOT NULL, entidad_id INTEGER NOT NULL, detalles TEXT NOT NULL
+);
+CREATE INDEX historial_entidad_idx ON historial (entidad_id, fecha);
+"""
+
+
+def conectar(ruta, perfil):
+    if perfil == 'basico':
+        # Valores por defecto de Django: diario de rollback, synchronous=FULL y
+        # el timeout de 5 s del módulo sqlite3.
+        return sqlite3.connect(ruta, timeout=5, isolation_level=None)
+    conexion = sqlite3.connect(ruta, timeout=settings.SQLITE_PRAGMAS['busy_timeout'] / 1000, isolation_level=None)
+    for pragma, valor in settings.SQLITE_PRAGMAS.items():
+        conexion.execute(f'PRAGMA {pragma}={valor}')
+    return conexion
+
+
+def escritor(ruta, perfil, libros, hasta, semilla, resultados):
+    """
+    Repite la transacción típica de una aprobación (leer existencias, descontar
+    un ejemplar y anotar el historial). En el perfil básico abre una conexión
+    por transacción, como hace Django con CONN_MAX_AGE=0.
+    """
+    rng = random.Random(semilla)
+    latencias, bloqueos = [], 0
+    persistente = conectar(ruta, perfil) if perfil == 'optimizado' else None
+    inicio_transaccion = 'BEGIN IMMEDIATE' if perfil == 'optimizado' else 'BEGIN'
+    while time.monotonic() < hasta:
+        inicio = time.perf_counter()
+        conexion = persistente or conectar(ruta, perfil)
+        libro_id = rng.randint(1, libros)
+        try:
+            conexion.execute(inicio_transaccion)
+            cantidad = conexion.execute('SELECT cantidad_total FROM libros WHERE id = ?', (libro_id,)).fetchone()[0]
+            conexion.execute('UPDATE libros SET cantidad_total = ? WHERE id = ?', (cantidad + 1, libro_id))
+            conexion.execute(
+                'INSERT INTO historial (fecha, entidad_id, detalles) VALUES (?, ?, ?)',
+                (time.time(), libro_id, 'Aprobación del préstamo'),
+            )
+            conexion.execute('COMMIT')
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        except sqlite3.OperationalError:
+            bloqueos += 1
+            if conexion.in_transaction:
+                conexion.execute('ROLLBACK')
+        finally:
+            if persistente is None:
+                conexion.close()
+    resultados.put((latencias, bloqueos))
+
+
+def lector(ruta, perfil, libros, hasta, semilla, resultados):
+    rng = random.Random(semilla)
+    conexion = conectar(ruta, perfil)
+    lecturas, bloqueos = 0, 0
+    while time.monotonic() < hasta:
+        try:
+            conexion.execute(
+                'SELECT count(*) FROM historial WHERE entidad_id = ?', (rng.randint(1, libros),)
+            ).fetchone()
+            lecturas += 1
+        except sqlite3.OperationalError:
+            bloqueos += 1
+    resultados.put((lecturas, bloqueos))
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el rendimiento de escritura de SQLite con varios procesos concurrentes '
+        'con el perfil básico (valores por defecto de Django) y el optimizado de settings'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escritores', type=int, default=4)
+        parser.add_argument('--lectores', type=int, default=2)
+        parser.add_argument('--segundos', type=float, default=10)
+        parser.add_argument('--libros', type=int, default=1000)
+        parser.add_argument('--perfil', choices=PERFILES + ('ambos',), default='ambos')
+
+    def handle(self, *args, **options):
+        perfiles = PERFILES if options['perfil'] == 'ambos' else (options['perfil'],)
+        for perfil in perfiles:
+            with tempfile.TemporaryDirectory() as directorio:
+                self.medir(os.path.join(directorio, 'benchmark.sqlite3'), perfil, options)
+
+    def preparar(self, ruta, perfil, libros):
+        conexion = conectar(ruta, perfil)
+        conexion.executescript(ESQUEMA)
+        conexion.execute('BEGIN')
+        conexion.executemany(
+            'INSERT INTO libros (id, titulo, cantidad_total) VALUES (?, ?, ?)',
+            ((i, f'Libro {i}', 10) for i in range(1, libros + 1)),
+        )
+        conexion.execute('COMMIT')
+        conexion.close()
+
+    def medir(self, ruta, perfil, options):
+        self.preparar(ruta, perfil, options['libros'])
+        contexto = multiprocessing.get_context('fork')
+        escrituras, lecturas = contexto.Queue(), contexto.Queue()
+        hasta = time.monotonic() + options['segundos']
+        procesos = [
+            contexto.Process(target=escritor, args=(ruta, perfil, options['libros'], hasta, i, escrituras))
+            for i in range(options['escritores'])
+        ] + [
+            contexto.Process(target=lector, args=(ruta, perfil, options['libros'], hasta, 1000 + i, lecturas))
+            for i in range(options['lectores'])
+        ]
+        for proceso in procesos:
+            proceso.start()
+        resultados_escritura = [escrituras.get() for _ in range(options['escritores'])]
+        resultados_lectura = [lecturas.get() for _ in range(options['lectores'])]
+        for proceso in procesos:
+            proceso.join()
+
+        latencias = [latencia for parcial, _ in resultados_escritura for latencia in parcial]
+        bloqueos = sum(bloqueos for _, bloqueos in resultados_escritura)
+        total_lecturas = sum(leidas for leidas, _ in resultados_lectura)
+        bloqueos_lectura = sum(bloqueos for _, bloqueos in resultados_lectura)
+        segundos = options['segundos']
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'Perfil {perfil}: {options["escritores"]} escritores, {options["lectores"]} lectores, {segundos:g} s'
+        ))
+        if latencias:
+            ordenadas = sorted(latencias)
+            self.stdout.write(
+                f'  escrituras: {len(latencias)} confirmadas ({len(latencias) / segundos:.0f}/s), '
+                f'{bloqueos} fallidas por bloqueo, '
+                f'p50 {statistics.median(ordenadas):.2f} ms, p95 {ordenadas[int(len(ordenadas) * 0.95) - 1]:.2f} ms'
+            )
+        else:
+            self.stdout.write(f'  escrituras: ninguna confirmada, {bloqueos} fallidas por bloqueo')
+        self.stdout.write(
+            f'  lecturas: {total_lecturas} ({total_lecturas / segundos:.0f}/s), {bloqueos_lectura} fallidas por bloqueo'
+        )
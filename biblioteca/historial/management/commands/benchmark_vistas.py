@@ -0,0 +1,190 @@
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, resolve, reverse
+from historial.models import Historial
+from libros.models import Categoria, Libro
+from prestamos.models import Prestamo
+from usuarios.models import Usuario
+
+ROLES = ['CLIENTE', 'ADMINISTRADOR', 'SUPERADMINISTRADOR']
+
+# Rutas que no tiene sentido medir por GET (el admin de Django se omite aparte).
+EXCLUIDAS = {'usuarios:logout', 'prestamos:operar_en_lote'}
+
+# Variantes adicionales con parámetros de consulta.
+VARIANTES = {
+    'libros:buscar': ['?q=sombra', '?q=garcia&categoria={categoria_id}', '?categoria={categoria_id}'],
+    'historial:lista_historial': ['?tipo_accion=ELIMINACION', '?tipo_entidad=PRESTAMO&desde=2020-01-01'],
+    'historial:exportar': ['?formato=jsonl&gzip=1'],
+}
+
+LINEA_BASE = Path(settings.BASE_DIR) / 'benchmarks' / 'linea_base.json'
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def recorrer_rutas(patrones=None, espacio=''):
+    """Devuelve (nombre con namespace, nombres de parámetros) de cada ruta con nombre."""
+    if patrones is None:
+        patrones = get_resolver().url_patterns
+    for patron in patrones:
+        if isinstance(patron, URLResolver):
+            if patron.namespace == 'admin':
+                continue
+            prefijo = f'{espacio}{patron.namespace}:' if patron.namespace else espacio
+            yield from recorrer_rutas(patron.url_patterns, prefijo)
+        elif isinstance(patron, URLPattern) and patron.name:
+            yield f'{espacio}{patron.name}', list(patron.pattern.converters)
+
+
+def escribe_en_get(url):
+    """Si la vista modifica datos también en GET (transaccion_por_peticion(incluir_get=True))."""
+    return getattr(resolve(urlsplit(url).path).func, 'escribe_en_get', False)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide latencia (p50/p95/p99), consultas y memoria pico de cada ruta para cada rol '
+        'sobre los datos actuales y compara con una línea base'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--calentamiento', type=int, default=2)
+        parser.add_argument('--linea-base', default=str(LINEA_BASE))
+        parser.add_argument('--guardar', action='store_true', help='Guarda los resultados como nueva línea base')
+        parser.add_argument('--umbral', type=float, default=0.25, help='Regresión tolerada en p95 (0.25 = 25 %%)')
+        parser.add_argument('--margen-ms', type=float, default=5.0, help='Diferencia absoluta de p95 que se ignora')
+        parser.add_argument('--rutas', nargs='*', help='Limitar a estas rutas (p. ej. libros:lista)')
+
+    def handle(self, *args, **options):
+        muestras = self.valores_de_ejemplo()
+        usuarios = {}
+        for rol in ROLES:
+            usuarios[rol] = Usuario.objects.filter(rol=rol, is_active=True).order_by('id').first()
+            if usuarios[rol] is None:
+                raise CommandError(f'No hay usuarios con rol {rol}; genera datos con "manage.py generar_datos".')
+
+        casos = []
+        for nombre, parametros in recorrer_rutas():
+            if nombre in EXCLUIDAS or (options['rutas'] and nombre not in options['rutas']):
+                continue
+            url = reverse(nombre, kwargs={parametro: muestras[parametro] for parametro in parametros})
+            casos.append((nombre, url))
+            for variante in VARIANTES.get(nombre, []):
+                casos.append((nombre, url + variante.format(**muestras)))
+
+        resultados = {}
+        with override_settings(ALLOWED_HOSTS=['*']):
+            for rol, usuario in usuarios.items():
+                cliente = Client()
+                cliente.force_login(usuario)
+                for nombre, url in casos:
+                    clave = f'{rol} GET {url}'
+                    resultados[clave] = self.medir(cliente, url, options['repeticiones'], options['calentamiento'])
+                    resultados[clave]['ruta'] = nombre
+                    self.stdout.write(self.formatear(clave, resultados[clave]))
+
+        ruta = Path(options['linea_base'])
+        if options['guardar']:
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            ruta.write_text(json.dumps(resultados, indent=2, ensure_ascii=False, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f'Línea base guardada en {ruta}'))
+            return
+        if ruta.exists():
+            self.comparar(resultados, json.loads(ruta.read_text()), options['umbral'], options['margen_ms'])
+
+    def valores_de_ejemplo(self):
+        libro = Libro.objects.order_by('id').first()
+        prestamo = Prestamo.objects.order_by('id').first()
+        categoria = Categoria.objects.order_by('id').first()
+        historial = Historial.objects.filter(tipo_entidad='LIBRO').order_by('id').first()
+        if not (libro and prestamo and categoria):
+            raise CommandError('La base de datos está vacía; genera datos con "manage.py generar_datos".')
+        return {
+            'libro_id': libro.id,
+            'prestamo_id': prestamo.id,
+            'categoria_id': categoria.id,
+            'tipo_entidad': 'LIBRO',
+            'entidad_id': historial.entidad_id if historial else libro.id,
+            'entidad': 'prestamos',
+        }
+
+    def peticion(self, cliente, url):
+        # Solo las vistas con efectos (p. ej. aprobar por GET) van en una
+        # transacción que se revierte: las lecturas se miden como en producción,
+        # sin tomar el bloqueo de escritura (BEGIN IMMEDIATE).
+        if not escribe_en_get(url):
+            return self.leer(cliente.get(url))
+        with transaction.atomic():
+            respuesta = self.leer(cliente.get(url))
+            transaction.set_rollback(True)
+        return respuesta
+
+    def leer(self, respuesta):
+        # En las respuestas en streaming (exportaciones) el trabajo ocurre al leer el cuerpo.
+        if respuesta.streaming:
+            for _ in respuesta.streaming_content:
+                pass
+            respuesta.close()
+        return respuesta
+
+    def medir(self, cliente, url, repeticiones, calentamiento):
+        for _ in range(calentamiento):
+            self.peticion(cliente, url)
+
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            respuesta = self.peticion(cliente, url)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+
+        # Consultas y memoria en una pasada aparte para no distorsionar la latencia.
+        with CaptureQueriesContext(connection) as consultas:
+            tracemalloc.start()
+            self.peticion(cliente, url)
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        return {
+            'estado': respuesta.status_code,
+            'p50_ms': round(statistics.median(tiempos), 2),
+            'p95_ms': round(percentil(tiempos, 95), 2),
+            'p99_ms': round(percentil(tiempos, 99), 2),
+            'consultas': len(consultas.captured_queries),
+            'memoria_pico_kb': round(pico / 1024, 1),
+        }
+
+    def formatear(self, clave, r):
+        return (
+            f'{clave:<70} {r["estado"]:>3}  p50 {r["p50_ms"]:>8.2f}  p95 {r["p95_ms"]:>8.2f}  '
+            f'p99 {r["p99_ms"]:>8.2f} ms  {r["consultas"]:>4} consultas  {r["memoria_pico_kb"]:>9.1f} KB'
+        )
+
+    def comparar(self, actuales, base, umbral, margen_ms):
+        regresiones = []
+        for clave, actual in actuales.items():
+            previo = base.get(clave)
+            if previo is None:
+                continue
+            limite = max(previo['p95_ms'] * (1 + umbral), previo['p95_ms'] + margen_ms)
+            if actual['p95_ms'] > limite:
+                regresiones.append(f'{clave}: p95 {previo["p95_ms"]} -> {actual["p95_ms"]} ms')
+            if actual['consultas'] > previo['consultas']:
+                regresiones.append(f'{clave}: consultas {previo["consultas"]} -> {actual["consultas"]}')
+        if regresiones:
+            raise CommandError('Regresiones respecto a la línea base:\n' + '\n'.join(regresiones))
+        self.stdout.write(self.style.SUCCESS('Sin regresiones respecto a la línea base.'))
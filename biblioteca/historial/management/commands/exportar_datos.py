@@ -0,0 +1,46 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from biblioteca import exportacion
+
+
+class Command(BaseCommand):
+    help = 'Exporta libros, préstamos o historial a CSV o JSONL en streaming, sin cargar las filas en memoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument('entidad', choices=exportacion.entidades())
+        parser.add_argument('--formato', choices=list(exportacion.FORMATOS), default='csv')
+        parser.add_argument('--desde', help='Fecha inicial incluida (AAAA-MM-DD)')
+        parser.add_argument('--hasta', help='Fecha final incluida (AAAA-MM-DD)')
+        parser.add_argument(
+            '--filtro', action='append', default=[], metavar='CLAVE=VALOR',
+            help='Filtro adicional (p. ej. estado=DEVUELTO o tipo_accion=APROBACION); se puede repetir',
+        )
+        parser.add_argument('--gzip', action='store_true', help='Comprime la salida con gzip')
+        parser.add_argument('--salida', help='Archivo de destino (por defecto la salida estándar)')
+
+    def handle(self, *args, **options):
+        parametros = {'desde': options['desde'], 'hasta': options['hasta']}
+        for filtro in options['filtro']:
+            clave, separador, valor = filtro.partition('=')
+            if not separador:
+                raise CommandError(f'Filtro "{filtro}" no válido; usa CLAVE=VALOR.')
+            if clave not in exportacion.filtros(options['entidad']):
+                raise CommandError(
+                    f'Filtro "{clave}" no disponible; usa {", ".join(exportacion.filtros(options["entidad"]))}.'
+                )
+            parametros[clave] = valor
+        try:
+            campos, filas = exportacion.consulta(options['entidad'], parametros)
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        bloques = exportacion.codificar(exportacion.lineas(campos, filas, options['formato']), options['gzip'])
+        if options['salida']:
+            with open(options['salida'], 'wb') as destino:
+                for bloque in bloques:
+                    destino.write(bloque)
+        else:
+            destino = sys.stdout.buffer
+            for bloque in bloques:
+                destino.write(bloque)
+            destino.flush()
@@ -0,0 +1,251 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.dateparse import parse_date
+from biblioteca.cache_versionada import incrementar_version
+from historial.models import Historial
+from libros.models import Categoria, Libro
+from prestamos import circulacion
+from prestamos.models import Prestamo, PrestamoArchivado
+from usuarios.models import Usuario
+
+PALABRAS = (
+    'sombra viento casa noche mar ciudad tiempo memoria fuego río jardín silencio '
+    'camino luna historia secreto olvido invierno sol palabra isla puerta niebla espejo'
+).split()
+NOMBRES = 'Ana Luis María Jorge Lucía Pedro Sofía Carlos Elena Tomás Julia Andrés Marta Diego'.split()
+APELLIDOS = 'García Pérez Gómez Núñez Díaz Muñoz Álvarez Rojas Torres Ramírez Castaño Peña'.split()
+EDITORIALES = ['Sudamericana', 'Planeta', 'Alfaguara', 'Anagrama', 'Norma', 'Seix Barral', 'Tusquets']
+
+
+CAMPOS_PRESTAMO = (
+    'id', 'usuario', 'libro', 'fecha_solicitud', 'fecha_aprobacion', 'fecha_devolucion_esperada',
+    'fecha_devolucion_real', 'estado', 'aprobado_por', 'notas',
+)
+CAMPOS_HISTORIAL = (
+    'fecha', 'usuario', 'tipo_entidad', 'tipo_accion', 'entidad_id', 'detalles', 'estado_anterior', 'estado_nuevo',
+)
+
+
+def insertar_filas(modelo, campos, filas):
+    """
+    Inserta tuplas ya preparadas para la base de datos con executemany.
+    Para préstamos e historial (millones de filas) el costo de compilar cada
+    valor en bulk_create domina el tiempo de carga; las tablas pequeñas sí
+    usan bulk_create.
+    """
+    if not filas:
+        return
+    qn = connection.ops.quote_name
+    columnas = ', '.join(qn(modelo._meta.get_field(campo).column) for campo in campos)
+    marcadores = ', '.join(['%s'] * len(campos))
+    with connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {qn(modelo._meta.db_table)} ({columnas}) VALUES ({marcadores})', filas)
+
+
+class Command(BaseCommand):
+    help = 'Genera un conjunto de datos sintético y reproducible para pruebas de carga'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categorias', type=int, default=20)
+        parser.add_argument('--libros', type=int, default=10000)
+        parser.add_argument('--usuarios', type=int, default=1000)
+        parser.add_argument('--prestamos', type=int, default=100000)
+        parser.add_argument('--dias', type=int, default=365, help='Antigüedad máxima de los préstamos')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--lote', type=int, default=5000, help='Filas por bulk_create')
+        parser.add_argument('--prefijo', default='gen', help='Prefijo de usuarios y categorías generados')
+        parser.add_argument(
+            '--referencia', default=None,
+            help='Fecha AAAA-MM-DD que se toma como "hoy" (por defecto, hoy); fija para reproducir datos',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['semilla'])
+        self.lote = options['lote']
+        self.prefijo = options['prefijo']
+        referencia = parse_date(options['referencia']) if options['referencia'] else datetime.now(dt_timezone.utc).date()
+        if referencia is None:
+            raise CommandError('La fecha de referencia debe tener formato AAAA-MM-DD.')
+        self.ahora = datetime(referencia.year, referencia.month, referencia.day, tzinfo=dt_timezone.utc)
+        self.historial = 0
+        self.fecha_sql = connection.ops.adapt_datetimefield_value
+
+        inicio = time.monotonic()
+        categorias = self.generar_categorias(options['categorias'])
+        administradores, clientes = self.generar_usuarios(options['usuarios'])
+        libros = self.generar_libros(options['libros'], categorias, administradores)
+        self.generar_prestamos(options['prestamos'], options['dias'], libros, administradores, clientes)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generados {len(categorias)} categorías, {len(libros)} libros, '
+            f'{len(administradores) + len(clientes)} usuarios, {options["prestamos"]} préstamos y '
+            f'{self.historial} registros de historial en {time.monotonic() - inicio:.1f} s.'
+        ))
+
+    def guardar_historial(self, registros):
+        Historial.objects.bulk_create(registros, batch_size=self.lote)
+        self.historial += len(registros)
+
+    def generar_categorias(self, cantidad):
+        with transaction.atomic():
+            return Categoria.objects.bulk_create([
+                Categoria(nombre=f'{self.prefijo} Categoría {i}', descripcion=f'Categoría generada {i}')
+                for i in range(cantidad)
+            ], batch_size=self.lote)
+
+    def generar_usuarios(self, cantidad):
+        # Hashear una vez: PBKDF2 por usuario dominaría el tiempo de carga.
+        clave = make_password('clave')
+        superadmins = max(1, cantidad // 500)
+        admins = max(1, cantidad // 50)
+        usuarios = []
+        for i in range(cantidad):
+            rol = 'SUPERADMINISTRADOR' if i < superadmins else 'ADMINISTRADOR' if i < superadmins + admins else 'CLIENTE'
+            usuarios.append(Usuario(
+                username=f'{self.prefijo}_{rol.lower()}_{i:07d}',
+                email=f'{self.prefijo}{i}@ejemplo.com',
+                password=clave,
+                first_name=self.rng.choice(NOMBRES),
+                last_name=self.rng.choice(APELLIDOS),
+                rol=rol,
+                date_joined=self.ahora - timedelta(days=self.rng.randint(400, 2000)),
+            ))
+        with transaction.atomic():
+            usuarios = Usuario.objects.bulk_create(usuarios, batch_size=self.lote)
+            self.guardar_historial([
+                Historial(
+                    fecha=usuario.date_joined, usuario=usuario, tipo_entidad='USUARIO', tipo_accion='CREACION',
+                    entidad_id=usuario.id, detalles=f'Registro de nuevo usuario: {usuario.username}',
+                )
+                for usuario in usuarios
+            ])
+        administradores = [u.id for u in usuarios if u.rol != 'CLIENTE']
+        clientes = [u.id for u in usuarios if u.rol == 'CLIENTE']
+        return administradores, clientes
+
+    def generar_libros(self, cantidad, categorias, administradores):
+        """Devuelve, por cada libro, [id, ejemplares libres, título, ejemplares iniciales]."""
+        libros = []
+        for desde in range(0, cantidad, self.lote):
+            lote = []
+            for i in range(desde, min(desde + self.lote, cantidad)):
+                palabras = self.rng.sample(PALABRAS, self.rng.randint(2, 4))
+                lote.append(Libro(
+                    titulo=' '.join(palabras).capitalize() + f' {i}',
+                    autor=f'{self.rng.choice(NOMBRES)} {self.rng.choice(APELLIDOS)}',
+                    editorial=self.rng.choice(EDITORIALES),
+                    año_publicacion=self.rng.randint(1900, self.ahora.year),
+                    descripcion=' '.join(self.rng.choices(PALABRAS, k=20)),
+                    estado='DISPONIBLE',
+                    cantidad_total=self.rng.randint(1, 5),
+                    registrado_por_id=self.rng.choice(administradores),
+                    categoria=self.rng.choice(categorias) if categorias else None,
+                ))
+            with transaction.atomic():
+                lote = Libro.objects.bulk_create(lote, batch_size=self.lote)
+                self.guardar_historial([
+                    Historial(
+                        fecha=self.ahora - timedelta(days=self.rng.randint(400, 1000)),
+                        usuario_id=libro.registrado_por_id, tipo_entidad='LIBRO', tipo_accion='CREACION',
+                        entidad_id=libro.id, detalles=f'Creación del libro: {libro.titulo}',
+                    )
+                    for libro in lote
+                ])
+            libros.extend([libro.id, libro.cantidad_total, libro.titulo, libro.cantidad_total] for libro in lote)
+        return libros
+
+    def ciclo_de_vida(self, prestamo_id, libro, usuario_id, dias, administradores, activos):
+        """
+        Devuelve la fila del préstamo y las de su historial (o None si el
+        cliente ya tiene ese libro pedido); ajusta los ejemplares libres.
+        """
+        rng = self.rng
+        fecha = self.fecha_sql
+        libro_id, libres, titulo, _ = libro
+        solicitud = self.ahora - timedelta(seconds=rng.randint(60, dias * 86400))
+        eventos = [(fecha(solicitud), usuario_id, 'PRESTAMO', 'CREACION', prestamo_id,
+                    f'Solicitud de préstamo para {titulo}', None, None)]
+
+        resolucion = solicitud + timedelta(seconds=rng.randint(600, 2 * 86400))
+        sorteo = rng.random()
+        abierto = (usuario_id, libro_id) in activos
+        if resolucion > self.ahora or (sorteo < 0.05 and not abierto):
+            if abierto:
+                return None, []
+            activos.add((usuario_id, libro_id))
+            return (prestamo_id, usuario_id, libro_id, fecha(solicitud), None, None, None,
+                    'PENDIENTE', None, ''), eventos
+
+        admin_id = rng.choice(administradores)
+        if sorteo < 0.15 or libres <= 0 or abierto:
+            notas = 'Sin ejemplares disponibles' if libres <= 0 else 'Solicitud duplicada' if abierto else 'No especificado'
+            eventos.append((fecha(resolucion), admin_id, 'PRESTAMO', 'CAMBIO_ESTADO', prestamo_id,
+                            f'Rechazado préstamo para {titulo} ({notas})', 'PENDIENTE', 'RECHAZADO'))
+            return (prestamo_id, usuario_id, libro_id, fecha(solicitud), None, None, None,
+                    'RECHAZADO', admin_id, notas), eventos
+
+        estado = 'APROBADO'
+        esperada = resolucion + timedelta(days=15)
+        eventos.append((fecha(resolucion), admin_id, 'PRESTAMO', 'CAMBIO_ESTADO', prestamo_id,
+                        f'Aprobado préstamo para {titulo}', 'PENDIENTE', 'APROBADO'))
+
+        devolucion = resolucion + timedelta(seconds=rng.randint(86400, 25 * 86400))
+        if esperada < min(devolucion, self.ahora):
+            estado = 'VENCIDO'
+            eventos.append((fecha(esperada), None, 'PRESTAMO', 'CAMBIO_ESTADO', prestamo_id,
+                            f'Vencido préstamo para {titulo}', 'APROBADO', 'VENCIDO'))
+        real = None
+        if devolucion <= self.ahora:
+            eventos.append((fecha(devolucion), rng.choice(administradores), 'PRESTAMO', 'CAMBIO_ESTADO', prestamo_id,
+                            f'Devuelto préstamo para {titulo}', estado, 'DEVUELTO'))
+            estado = 'DEVUELTO'
+            real = fecha(devolucion)
+        else:
+            libro[1] -= 1
+            activos.add((usuario_id, libro_id))
+        return (prestamo_id, usuario_id, libro_id, fecha(solicitud), fecha(resolucion), fecha(esperada), real,
+                estado, admin_id, ''), eventos
+
+    def generar_prestamos(self, cantidad, dias, libros, administradores, clientes):
+        if not libros or not clientes:
+            return
+        activos = set()
+        # Los ids de préstamos archivados tampoco se reutilizan.
+        siguiente_id = max(
+            modelo.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            for modelo in (Prestamo, PrestamoArchivado)
+        ) + 1
+        for desde in range(0, cantidad, self.lote):
+            prestamos, historial = [], []
+            for _ in range(min(self.lote, cantidad - desde)):
+                prestamo, eventos = self.ciclo_de_vida(
+                    siguiente_id, self.rng.choice(libros), self.rng.choice(clientes), dias, administradores, activos
+                )
+                if prestamo is not None:
+                    siguiente_id += 1
+                    prestamos.append(prestamo)
+                    historial.extend(eventos)
+            with transaction.atomic():
+                insertar_filas(Prestamo, CAMPOS_PRESTAMO, prestamos)
+                insertar_filas(Historial, CAMPOS_HISTORIAL, historial)
+            self.historial += len(historial)
+        # insertar_filas no pasa por el ORM: invalidar a mano lo cacheado
+        # y rehacer los resúmenes de circulación.
+        incrementar_version(Prestamo)
+        circulacion.reconstruir()
+
+        # Sólo los libros con préstamos abiertos cambian de existencias.
+        prestados = [
+            Libro(id=libro_id, cantidad_total=libres, estado='DISPONIBLE' if libres > 0 else 'NO_DISPONIBLE')
+            for libro_id, libres, _, iniciales in libros
+            if libres != iniciales
+        ]
+        with transaction.atomic():
+            Libro.objects.bulk_update(prestados, ['cantidad_total', 'estado'], batch_size=500)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from biblioteca.mantenimiento_sqlite import mantener
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta PRAGMA optimize y un checkpoint del WAL de la base de datos SQLite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base', default='default', help='Alias de la base de datos')
+        parser.add_argument(
+            '--modo', default='TRUNCATE', choices=['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'],
+            help='Modo de wal_checkpoint (TRUNCATE espera a los escritores y deja el WAL vacío)',
+        )
+
+    def handle(self, *args, **options):
+        resultado = mantener(options['base'], options['modo'])
+        if resultado is None:
+            self.stdout.write('La base de datos no es SQLite; nada que hacer.')
+            return
+        bloqueado, paginas, copiadas = resultado
+        estilo = self.style.WARNING if bloqueado else self.style.SUCCESS
+        self.stdout.write(estilo(f'PRAGMA optimize ejecutado; checkpoint: {copiadas} de {paginas} páginas del WAL copiadas.'))
@@ -0,0 +1,48 @@
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from biblioteca.cache_versionada import invalidar_todo
+
+
+class Command(BaseCommand):
+    help = 'Copia la base de datos principal a las réplicas SQLite con la API de copia de seguridad de SQLite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('replicas', nargs='*', help='Alias a sincronizar (por defecto, todas las de REPLICAS)')
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Si es mayor que cero, repite la copia cada N segundos hasta interrumpirla',
+        )
+
+    def handle(self, *args, **options):
+        replicas = options['replicas'] or settings.REPLICAS
+        if not replicas:
+            raise CommandError('No hay réplicas configuradas (define SQLITE_REPLICA).')
+        origen = connections['default'].settings_dict
+        for alias in replicas:
+            if alias not in connections or connections[alias].vendor != 'sqlite' or connections['default'].vendor != 'sqlite':
+                raise CommandError(f'"{alias}" no es una réplica SQLite configurada.')
+
+        while True:
+            for alias in replicas:
+                inicio = time.monotonic()
+                fuente = sqlite3.connect(origen['NAME'])
+                destino = sqlite3.connect(connections[alias].settings_dict['NAME'], timeout=30)
+                try:
+                    # Copia consistente de una sola vez: los lectores de la réplica
+                    # esperan (busy_timeout) mientras se reemplazan las páginas.
+                    fuente.backup(destino)
+                finally:
+                    destino.close()
+                    fuente.close()
+                self.stdout.write(self.style.SUCCESS(
+                    f'Réplica "{alias}" sincronizada en {time.monotonic() - inicio:.2f} s.'
+                ))
+            # Lo cacheado (y los ETag) calculados desde la réplica desactualizada
+            # quedan obsoletos ahora que la réplica está al día.
+            invalidar_todo()
+            if options['intervalo'] <= 0:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('historial', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='historial',
+            name='fecha',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
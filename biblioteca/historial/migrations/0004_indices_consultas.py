@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('historial', '0003_historial_fecha_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historial',
+            index=models.Index(fields=['-fecha', '-id'], name='historial_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historial',
+            index=models.Index(fields=['tipo_entidad', 'entidad_id', '-fecha'], name='historial_entidad_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historial',
+            index=models.Index(fields=['usuario', 'tipo_entidad', '-fecha'], name='historial_usr_tipo_fecha_idx'),
+        ),
+    ]
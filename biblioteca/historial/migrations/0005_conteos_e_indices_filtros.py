@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+SUMAR = '''
+        INSERT INTO historial_conteos (dia, tipo_entidad, tipo_accion, total)
+        VALUES (date(new.fecha), new.tipo_entidad, new.tipo_accion, 1)
+        ON CONFLICT (dia, tipo_entidad, tipo_accion) DO UPDATE SET total = total + 1;
+'''
+
+RESTAR = '''
+        UPDATE historial_conteos SET total = total - 1
+        WHERE dia = date(old.fecha) AND tipo_entidad = old.tipo_entidad AND tipo_accion = old.tipo_accion;
+'''
+
+CREAR = [
+    f'CREATE TRIGGER IF NOT EXISTS historial_conteos_insert AFTER INSERT ON historial BEGIN {SUMAR} END',
+    f'CREATE TRIGGER IF NOT EXISTS historial_conteos_delete AFTER DELETE ON historial BEGIN {RESTAR} END',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS historial_conteos_update
+    AFTER UPDATE OF fecha, tipo_entidad, tipo_accion ON historial BEGIN {RESTAR} {SUMAR} END
+    ''',
+    '''
+    INSERT INTO historial_conteos (dia, tipo_entidad, tipo_accion, total)
+    SELECT date(fecha), tipo_entidad, tipo_accion, COUNT(*) FROM historial
+    GROUP BY date(fecha), tipo_entidad, tipo_accion
+    ''',
+]
+
+ELIMINAR = [
+    'DROP TRIGGER IF EXISTS historial_conteos_update',
+    'DROP TRIGGER IF EXISTS historial_conteos_delete',
+    'DROP TRIGGER IF EXISTS historial_conteos_insert',
+]
+
+
+def ejecutar(sentencias):
+    def operacion(apps, schema_editor):
+        # Los conteos sólo se mantienen en SQLite; otros motores cuentan con un límite.
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sentencia in sentencias:
+            schema_editor.execute(sentencia)
+    return operacion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('historial', '0004_indices_consultas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoHistorial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('tipo_entidad', models.CharField(max_length=20)),
+                ('tipo_accion', models.CharField(max_length=20)),
+                ('total', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'historial_conteos',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='historial',
+            index=models.Index(fields=['tipo_entidad', '-fecha', '-id'], name='historial_tipo_ent_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historial',
+            index=models.Index(fields=['tipo_accion', '-fecha', '-id'], name='historial_tipo_acc_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historial',
+            index=models.Index(fields=['usuario', '-fecha', '-id'], name='historial_usr_fecha_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conteohistorial',
+            constraint=models.UniqueConstraint(fields=('dia', 'tipo_entidad', 'tipo_accion'), name='historial_conteos_unico'),
+        ),
+        migrations.RunPython(ejecutar(CREAR), ejecutar(ELIMINAR)),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('historial', '0005_conteos_e_indices_filtros'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentoHistorial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('archivo', models.CharField(max_length=100, unique=True)),
+                ('registros', models.IntegerField()),
+                ('id_minimo', models.IntegerField()),
+                ('id_maximo', models.IntegerField()),
+                ('fecha_minima', models.DateTimeField()),
+                ('fecha_maxima', models.DateTimeField()),
+                ('sha256', models.CharField(max_length=64)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'historial_segmentos',
+                'ordering': ['-mes', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EntidadArchivada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_entidad', models.CharField(max_length=20)),
+                ('entidad_id', models.IntegerField()),
+                ('registros', models.IntegerField()),
+                ('segmento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entidades', to='historial.segmentohistorial')),
+            ],
+            options={
+                'db_table': 'historial_entidades_archivadas',
+                'indexes': [models.Index(fields=['tipo_entidad', 'entidad_id'], name='historial_arch_entidad_idx')],
+            },
+        ),
+    ]
@@ -1,9 +1,12 @@
-from django.db import models
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from django.db import connection, models
+from django.db.models import Sum
+from django.utils import timezone
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text
 from aldjemy.meta import AldjemyMeta
 from usuarios.models import Usuario
 from libros.models import Libro
 from prestamos.models import Prestamo
+from .escritura import escritor
 
 class Historial(models.Model, metaclass=AldjemyMeta):
     TIPOS_ENTIDAD = [
@@ -19,7 +22,7 @@ class Historial(models.Model, metaclass=AldjemyMeta):
         ('CAMBIO_ESTADO', 'Cambio de Estado'),
     ]
 
-    fecha = models.DateTimeField(auto_now_add=True)
+    fecha = models.DateTimeField(default=timezone.now, editable=False)
     usuario = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, related_name='acciones_historial')
     tipo_entidad = models.CharField(max_length=20, choices=TIPOS_ENTIDAD)
     tipo_accion = models.CharField(max_length=20, choices=TIPOS_ACCION)
@@ -44,13 +47,26 @@ class Historial(models.Model, metaclass=AldjemyMeta):
         verbose_name = 'Registro de Historial'
         verbose_name_plural = 'Registros de Historial'
         ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['-fecha', '-id'], name='historial_fecha_idx'),
+            # historial_por_entidad
+            models.Index(fields=['tipo_entidad', 'entidad_id', '-fecha'], name='historial_entidad_fecha_idx'),
+            # cliente_historial_prestamos
+            models.Index(fields=['usuario', 'tipo_entidad', '-fecha'], name='historial_usr_tipo_fecha_idx'),
+            # Filtros de lista_historial
+            models.Index(fields=['tipo_entidad', '-fecha', '-id'], name='historial_tipo_ent_fecha_idx'),
+            models.Index(fields=['tipo_accion', '-fecha', '-id'], name='historial_tipo_acc_fecha_idx'),
+            models.Index(fields=['usuario', '-fecha', '-id'], name='historial_usr_fecha_idx'),
+        ]
 
     def __str__(self):
         return f'{self.get_tipo_accion_display()} de {self.get_tipo_entidad_display()} - {self.fecha}'
 
     @classmethod
     def registrar_cambio(cls, usuario, tipo_entidad, tipo_accion, entidad_id, detalles, estado_anterior=None, estado_nuevo=None):
-        return cls.objects.create(
+        # La fecha se fija al registrar el cambio, no cuando se escribe el lote.
+        return escritor.registrar(cls(
+            fecha=timezone.now(),
             usuario=usuario,
             tipo_entidad=tipo_entidad,
             tipo_accion=tipo_accion,
@@ -58,4 +74,105 @@ class Historial(models.Model, metaclass=AldjemyMeta):
             detalles=detalles,
             estado_anterior=estado_anterior,
             estado_nuevo=estado_nuevo
-        )
+        ))
+
+    @classmethod
+    def registrar_lote(cls, registros):
+        """Registra varios cambios ya construidos con una sola inserción."""
+        return escritor.registrar_lote(registros)
+
+
+class ConteoHistorial(models.Model, metaclass=AldjemyMeta):
+    """
+    Registros de historial por día, tipo de entidad y tipo de acción. En SQLite
+    lo mantienen los triggers de la migración 0005; sirve para mostrar totales
+    aproximados sin ejecutar COUNT(*) sobre todo el historial.
+    """
+    dia = models.DateField()
+    tipo_entidad = models.CharField(max_length=20)
+    tipo_accion = models.CharField(max_length=20)
+    total = models.IntegerField(default=0)
+
+    __sa_columns__ = [
+        Column('dia', Date),
+        Column('tipo_entidad', String(20)),
+        Column('tipo_accion', String(20)),
+        Column('total', Integer),
+    ]
+
+    class Meta:
+        db_table = 'historial_conteos'
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'tipo_entidad', 'tipo_accion'], name='historial_conteos_unico'),
+        ]
+
+    @classmethod
+    def disponible(cls):
+        return connection.vendor == 'sqlite'
+
+    @classmethod
+    def estimar(cls, desde=None, hasta=None, tipo_entidad=None, tipo_accion=None):
+        """Total de registros entre los días `desde` y `hasta` (incluidos) con los tipos indicados."""
+        conteos = cls.objects.all()
+        if desde:
+            conteos = conteos.filter(dia__gte=desde)
+        if hasta:
+            conteos = conteos.filter(dia__lte=hasta)
+        if tipo_entidad:
+            conteos = conteos.filter(tipo_entidad=tipo_entidad)
+        if tipo_accion:
+            conteos = conteos.filter(tipo_accion=tipo_accion)
+        return conteos.aggregate(total=Sum('total'))['total'] or 0
+
+
+class SegmentoHistorial(models.Model, metaclass=AldjemyMeta):
+    """Archivo gzip JSONL inmutable con los registros de historial de un mes (ver historial.archivo)."""
+    mes = models.DateField()
+    archivo = models.CharField(max_length=100, unique=True)
+    registros = models.IntegerField()
+    id_minimo = models.IntegerField()
+    id_maximo = models.IntegerField()
+    fecha_minima = models.DateTimeField()
+    fecha_maxima = models.DateTimeField()
+    sha256 = models.CharField(max_length=64)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    __sa_columns__ = [
+        Column('mes', Date),
+        Column('archivo', String(100)),
+        Column('registros', Integer),
+        Column('id_minimo', Integer),
+        Column('id_maximo', Integer),
+        Column('fecha_minima', DateTime),
+        Column('fecha_maxima', DateTime),
+        Column('sha256', String(64)),
+        Column('fecha_creacion', DateTime),
+    ]
+
+    class Meta:
+        db_table = 'historial_segmentos'
+        ordering = ['-mes', '-id']
+
+    def __str__(self):
+        return self.archivo
+
+
+class EntidadArchivada(models.Model, metaclass=AldjemyMeta):
+    """Índice de las entidades que aparecen en cada segmento y cuántos registros tienen en él."""
+    segmento = models.ForeignKey(SegmentoHistorial, on_delete=models.CASCADE, related_name='entidades')
+    tipo_entidad = models.CharField(max_length=20)
+    entidad_id = models.IntegerField()
+    registros = models.IntegerField()
+
+    __sa_columns__ = [
+        Column('segmento_id', Integer, ForeignKey('historial_segmentos.id')),
+        Column('tipo_entidad', String(20)),
+        Column('entidad_id', Integer),
+        Column('registros', Integer),
+    ]
+
+    class Meta:
+        db_table = 'historial_entidades_archivadas'
+        indexes = [
+            models.Index(fields=['tipo_entidad', 'entidad_id'], name='historial_arch_entidad_idx'),
+        ]
@@ -1,3 +1,516 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import sqlite3
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from biblioteca.instrumentacion import RegistroConsultas, normalizar_sql
+from biblioteca.mantenimiento_sqlite import mantener
+from biblioteca.paginacion import codificar_cursor
+from biblioteca.pruebas import PlanDeConsultaMixin
+from libros.models import Libro
+from prestamos.models import Prestamo, ResumenCirculacion
+from usuarios.models import Usuario
+from . import archivo
+from .management.commands.benchmark_vistas import escribe_en_get
+from .escritura import escritor
+from .models import ConteoHistorial, Historial, SegmentoHistorial
 
-# Create your tests here.
+
+class PlanDeConsultaHistorialTests(PlanDeConsultaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        cls.libro = Libro.objects.create(
+            titulo='Rayuela', autor='Cortázar', editorial='Sudamericana',
+            año_publicacion=1963, descripcion='',
+        )
+        Historial.objects.bulk_create([
+            Historial(
+                usuario=cls.admin, tipo_entidad='LIBRO', tipo_accion='MODIFICACION',
+                entidad_id=cls.libro.id, detalles=f'Cambio {i}',
+            )
+            for i in range(50)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_lista_historial(self):
+        self.assertSinEscaneoCompleto(reverse('historial:lista_historial'))
+
+    def test_historial_por_entidad(self):
+        self.assertSinEscaneoCompleto(reverse('historial:historial_por_entidad', args=['LIBRO', self.libro.id]))
+
+    def test_consultas_no_dependen_de_los_registros(self):
+        url = reverse('historial:lista_historial') + '?por_pagina=100'
+
+        def consultas():
+            with CaptureQueriesContext(connection) as capturadas:
+                respuesta = self.client.get(url)
+            return len(capturadas), respuesta
+
+        antes, _ = consultas()
+        prestamo = Prestamo.objects.create(usuario=self.admin, libro=self.libro)
+        otro = Usuario.objects.create_user('otro', password='clave', rol='CLIENTE')
+        Historial.objects.bulk_create([
+            Historial(usuario=otro, tipo_entidad=tipo, tipo_accion='CREACION', entidad_id=entidad_id, detalles='')
+            for tipo, entidad_id in [('PRESTAMO', prestamo.id), ('USUARIO', otro.id), ('USUARIO', self.admin.id)] * 5
+        ])
+        despues, respuesta = consultas()
+        # Una consulta más por cada tipo de entidad nuevo, no por registro.
+        self.assertEqual(despues, antes + 2)
+        registros = respuesta.context['registros']
+        self.assertEqual(len(registros), 65)
+        self.assertEqual(registros[0]['entidad'], self.admin)
+        self.assertEqual(registros[2]['prestamo'], prestamo)
+        self.assertEqual(registros[-1]['entidad'], self.libro)
+
+    def test_filtros_usan_indices(self):
+        url = reverse('historial:lista_historial')
+        for filtro in ('?tipo_accion=MODIFICACION', '?tipo_entidad=LIBRO&desde=2020-01-01', '?actor=bibliotecario'):
+            self.assertSinEscaneoCompleto(url + filtro)
+
+
+class PaginacionHistorialTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        cls.otro = Usuario.objects.create_user('otro', password='clave', rol='ADMINISTRADOR')
+        ahora = timezone.now()
+        Historial.objects.bulk_create([
+            Historial(
+                fecha=ahora - datetime.timedelta(days=i % 3), usuario=cls.admin if i % 2 else cls.otro,
+                tipo_entidad='LIBRO', tipo_accion='CREACION' if i % 5 else 'ELIMINACION',
+                entidad_id=i, detalles=f'Cambio {i}',
+            )
+            for i in range(30)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def recorrer(self, parametros):
+        url = reverse('historial:lista_historial')
+        siguiente = '?' + parametros
+        entidades = []
+        while siguiente:
+            respuesta = self.client.get(url + siguiente)
+            entidades += [registro['entidad_id'] for registro in respuesta.context['registros']]
+            siguiente = respuesta.context['url_siguiente']
+        return respuesta, entidades
+
+    def test_cursor_manipulado_se_ignora(self):
+        url = reverse('historial:lista_historial')
+        primera = self.client.get(url).context['registros']
+        for valores in (['notadate', 1], ['2026-01-01T00:00:00+00:00', 'x'], ['2026-13-45', 1]):
+            respuesta = self.client.get(url, {'despues': codificar_cursor(valores)})
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual(respuesta.context['registros'], primera)
+
+    def test_conteos_mantenidos_por_triggers(self):
+        self.assertEqual(ConteoHistorial.estimar(), 30)
+        self.assertEqual(ConteoHistorial.estimar(tipo_accion='ELIMINACION'), 6)
+        self.assertEqual(ConteoHistorial.estimar(desde=timezone.now().date()), 10)
+        Historial.objects.filter(tipo_accion='ELIMINACION').delete()
+        self.assertEqual(ConteoHistorial.estimar(), 24)
+
+    def test_recorrido_por_cursor_con_filtros(self):
+        respuesta, entidades = self.recorrer('por_pagina=4&tipo_accion=creacion&actor=bibliotecario')
+        esperadas = list(
+            Historial.objects.filter(tipo_accion='CREACION', usuario=self.admin)
+            .order_by('-fecha', '-id').values_list('entidad_id', flat=True)
+        )
+        self.assertEqual(entidades, esperadas)
+        self.assertEqual(respuesta.context['total_registros'], len(esperadas))
+        self.assertFalse(respuesta.context['total_aproximado'])
+
+    def test_total_aproximado_por_rango_de_fechas(self):
+        hoy = timezone.now().date().isoformat()
+        respuesta, entidades = self.recorrer(f'desde={hoy}&hasta={hoy}')
+        self.assertEqual(len(entidades), 10)
+        self.assertEqual(respuesta.context['total_registros'], 10)
+        self.assertTrue(respuesta.context['total_aproximado'])
+
+    @override_settings(HISTORIAL_CONTEO_MAXIMO=5)
+    def test_total_acotado(self):
+        respuesta = self.client.get(reverse('historial:lista_historial'), {'actor': 'otro'})
+        self.assertEqual(respuesta.context['total_registros'], 5)
+        self.assertTrue(respuesta.context['total_acotado'])
+        respuesta = self.client.get(reverse('historial:lista_historial'), {'actor': 'nadie'})
+        self.assertEqual(list(respuesta.context['registros']), [])
+
+class ArchivoHistorialTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        ahora = timezone.now()
+        Historial.objects.bulk_create([
+            Historial(
+                fecha=ahora - datetime.timedelta(days=dias), usuario=cls.admin, tipo_entidad='LIBRO',
+                tipo_accion='MODIFICACION', entidad_id=entidad_id, detalles=f'Cambio hace {dias} días',
+            )
+            for dias, entidad_id in ((400, 1), (400, 2), (200, 1), (5, 1))
+        ])
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        ajustes = self.settings(HISTORIAL_ARCHIVO_DIRECTORIO=self.directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_archivar_y_consultar(self):
+        call_command('archivar_historial', dias=30, stdout=StringIO())
+        self.assertEqual(list(Historial.objects.values_list('detalles', flat=True)), ['Cambio hace 5 días'])
+        self.assertEqual(ConteoHistorial.estimar(), 1)
+        self.assertEqual(SegmentoHistorial.objects.count(), 2)
+        for segmento in SegmentoHistorial.objects.all():
+            self.assertTrue(archivo.verificar_segmento(segmento))
+
+        self.assertEqual(archivo.total_archivado('LIBRO', 1), 2)
+        self.assertEqual(
+            [registro.detalles for registro in archivo.registros_archivados('LIBRO', 1)],
+            ['Cambio hace 200 días', 'Cambio hace 400 días'],
+        )
+
+        self.client.force_login(self.admin)
+        url = reverse('historial:historial_por_entidad', args=['LIBRO', 1])
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.context['total_archivados'], 2)
+        self.assertNotIn('registros_archivados', respuesta.context)
+        respuesta = self.client.get(url, {'archivo': '1'})
+        self.assertEqual(len(respuesta.context['registros_archivados']), 2)
+        self.assertEqual(respuesta.context['registros_archivados'][0]['usuario'], self.admin)
+
+    def test_simular_no_modifica(self):
+        call_command('archivar_historial', dias=30, simular=True, stdout=StringIO())
+        self.assertEqual(Historial.objects.count(), 4)
+        self.assertFalse(SegmentoHistorial.objects.exists())
+
+class InstrumentacionSQLTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        cls.libros = Libro.objects.bulk_create([
+            Libro(titulo=f'Libro {i}', autor='Autor', editorial='Editorial', año_publicacion=2000, descripcion='')
+            for i in range(6)
+        ])
+
+    def test_normalizar_sql(self):
+        self.assertEqual(
+            normalizar_sql('SELECT * FROM libros WHERE id IN (%s, %s, %s) AND titulo = \'x\' LIMIT 21'),
+            'SELECT * FROM libros WHERE id IN (?, ...) AND titulo = ? LIMIT ?',
+        )
+
+    def test_detecta_consultas_repetidas(self):
+        registro = RegistroConsultas()
+        with connection.execute_wrapper(registro):
+            for libro in self.libros:
+                Libro.objects.get(id=libro.id)
+        resumen = registro.resumen(umbral=5)
+        self.assertEqual(resumen['consultas'], 6)
+        self.assertEqual([veces for _, veces, _ in resumen['repetidas']], [6])
+
+    @override_settings(SQL_INSTRUMENTACION_MUESTREO=1.0)
+    def test_cabecera_server_timing(self):
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('historial:consultas_sql'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('db;dur=', respuesta['Server-Timing'])
+
+    def test_perfilado_con_cabecera(self):
+        with tempfile.TemporaryDirectory() as directorio, self.settings(PERFILADO_DIRECTORIO=directorio):
+            self.client.force_login(self.admin)
+            self.client.get(reverse('historial:lista_historial'), HTTP_X_PERFILAR='0')
+            perfiles = list(Path(directorio).glob('historial.lista_historial__*.collapsed'))
+            self.assertEqual(len(perfiles), 1)
+
+
+class ExportacionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        cls.cliente = Usuario.objects.create_user('lector', password='clave', rol='CLIENTE')
+        Historial.objects.bulk_create([
+            Historial(
+                usuario=cls.admin, tipo_entidad='LIBRO', tipo_accion='CREACION' if i % 2 else 'MODIFICACION',
+                entidad_id=i, detalles=f'Cambio, "{i}"',
+            )
+            for i in range(5)
+        ])
+
+    def test_exportar_csv_en_streaming(self):
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('historial:exportar', args=['historial']), {'tipo_accion': 'creacion'})
+        self.assertTrue(respuesta.streaming)
+        lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertTrue(lineas[0].startswith('id,fecha,usuario_id'))
+        self.assertEqual(len(lineas), 3)
+        self.assertIn('"Cambio, ""1"""', lineas[1])
+
+    def test_exportacion_conserva_el_actor(self):
+        self.client.force_login(self.admin)
+        url = reverse('historial:exportar', args=['historial'])
+        for actor, filas in (('bibliotecario', 5), ('nadie', 0)):
+            respuesta = self.client.get(reverse('historial:lista_historial'), {'actor': actor})
+            parametros = respuesta.context['parametros_exportacion']
+            self.assertIn(f'actor={actor}', parametros)
+            lineas = b''.join(self.client.get(f'{url}?{parametros}').streaming_content).decode().splitlines()
+            self.assertEqual(len(lineas), filas + 1)
+
+    def test_exportar_jsonl_comprimido(self):
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(
+            reverse('historial:exportar', args=['historial']), {'formato': 'jsonl', 'gzip': '1', 'desde': '2000-01-01'}
+        )
+        self.assertEqual(respuesta['Content-Type'], 'application/gzip')
+        self.assertFalse(respuesta.has_header('Content-Encoding'))
+        self.assertRegex(respuesta['Content-Disposition'], r'filename="historial-\d{8}\.jsonl\.gz"')
+        filas = [json.loads(linea) for linea in gzip.decompress(b''.join(respuesta.streaming_content)).splitlines()]
+        self.assertEqual([fila['entidad_id'] for fila in filas], list(range(5)))
+
+    def test_parametros_no_validos(self):
+        self.client.force_login(self.admin)
+        url = reverse('historial:exportar', args=['historial'])
+        self.assertEqual(self.client.get(url, {'desde': '31/12/2024'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'formato': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('historial:exportar', args=['usuarios'])).status_code, 400)
+
+    def test_solo_administradores(self):
+        self.client.force_login(self.cliente)
+        respuesta = self.client.get(reverse('historial:exportar', args=['prestamos']))
+        self.assertRedirects(respuesta, reverse('usuarios:perfil'), fetch_redirect_response=False)
+
+
+class EscrituraHistorialTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+
+    def tearDown(self):
+        escritor.vaciar()
+
+    def registrar(self, detalles):
+        return Historial.registrar_cambio(self.admin, 'LIBRO', 'CREACION', 1, detalles)
+
+    def test_sincrona_inserta_al_momento(self):
+        registro = self.registrar('Inmediato')
+        self.assertIsNotNone(registro.pk)
+        self.assertEqual(escritor.pendientes(), 0)
+        Historial.registrar_lote([Historial(usuario=self.admin, tipo_entidad='LIBRO', tipo_accion='CREACION', entidad_id=2, detalles='Lote')])
+        self.assertEqual(Historial.objects.count(), 2)
+
+    @override_settings(HISTORIAL_ESCRITURA='diferida', HISTORIAL_BUFFER_MAXIMO=100, HISTORIAL_BUFFER_SEGUNDOS=60)
+    def test_diferida_encola_tras_el_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.registrar('Confirmado')
+            with transaction.atomic():
+                self.registrar('Revertido')
+                transaction.set_rollback(True)
+            # Nada se encola antes del commit.
+            self.assertEqual(escritor.pendientes(), 0)
+        self.assertEqual(escritor.pendientes(), 1)
+        self.assertFalse(Historial.objects.exists())
+        self.assertEqual(escritor.vaciar(), 1)
+        self.assertEqual(list(Historial.objects.values_list('detalles', flat=True)), ['Confirmado'])
+
+    @override_settings(HISTORIAL_ESCRITURA='diferida', HISTORIAL_BUFFER_MAXIMO=3, HISTORIAL_BUFFER_SEGUNDOS=60)
+    def test_diferida_vacia_al_llenarse(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Historial.registrar_lote([
+                Historial(usuario=self.admin, tipo_entidad='LIBRO', tipo_accion='CREACION', entidad_id=i, detalles='Lote')
+                for i in range(2)
+            ])
+        self.assertEqual(escritor.pendientes(), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.registrar('Tercero')
+        self.assertEqual(escritor.pendientes(), 0)
+        self.assertEqual(Historial.objects.count(), 3)
+
+    @override_settings(HISTORIAL_ESCRITURA='diferida', HISTORIAL_BUFFER_MAXIMO=100, HISTORIAL_BUFFER_SEGUNDOS=60)
+    def test_diferida_vacia_al_terminar_la_peticion(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.registrar('Pendiente')
+        self.assertEqual(escritor.pendientes(), 1)
+        self.client.get(reverse('usuarios:login'))
+        self.assertEqual(escritor.pendientes(), 0)
+        self.assertTrue(Historial.objects.filter(detalles='Pendiente').exists())
+
+    def encolar(self, *detalles):
+        with self.captureOnCommitCallbacks(execute=True):
+            Historial.registrar_lote([
+                Historial(usuario=self.admin, tipo_entidad='LIBRO', tipo_accion='CREACION', entidad_id=i, detalles=detalle)
+                for i, detalle in enumerate(detalles)
+            ])
+
+    @override_settings(
+        HISTORIAL_ESCRITURA='diferida', HISTORIAL_BUFFER_MAXIMO=100, HISTORIAL_BUFFER_SEGUNDOS=60, HISTORIAL_REINTENTOS=2,
+    )
+    def test_registro_invalido_no_bloquea_la_cola(self):
+        # detalles es NOT NULL: ese registro no podrá escribirse nunca.
+        self.encolar('Bueno', None)
+        with self.assertLogs('historial.escritura', 'ERROR'):
+            self.assertEqual(escritor.vaciar(), 1)
+        self.assertEqual(escritor.pendientes(), 1)
+        self.encolar('Siguiente')
+        with self.assertLogs('historial.escritura', 'ERROR') as registros:
+            self.assertEqual(escritor.vaciar(), 1)
+        self.assertIn('Registro de historial descartado', registros.output[-1])
+        self.assertEqual(escritor.pendientes(), 0)
+        self.assertEqual(sorted(Historial.objects.values_list('detalles', flat=True)), ['Bueno', 'Siguiente'])
+
+    @override_settings(
+        HISTORIAL_ESCRITURA='diferida', HISTORIAL_BUFFER_MAXIMO=100, HISTORIAL_BUFFER_SEGUNDOS=60,
+        HISTORIAL_REINTENTOS=10, HISTORIAL_BUFFER_LIMITE=2,
+    )
+    def test_cola_acotada(self):
+        self.encolar(None, None, None)
+        with self.assertLogs('historial.escritura', 'ERROR') as registros:
+            self.assertEqual(escritor.vaciar(), 0)
+        self.assertEqual(escritor.pendientes(), 2)
+        self.assertEqual(sum('descartado' in linea for linea in registros.output), 1)
+        # Se descartan para no dejarlos en la cola de las demás pruebas.
+        with self.settings(HISTORIAL_REINTENTOS=1), self.assertLogs('historial.escritura', 'ERROR'):
+            escritor.vaciar()
+
+
+class DatosSinteticosTests(TestCase):
+    def generar(self, prefijo):
+        salida = StringIO()
+        call_command(
+            'generar_datos', '--categorias', '2', '--libros', '8', '--usuarios', '6', '--prestamos', '40',
+            '--dias', '60', '--semilla', '7', '--referencia', '2026-03-01', '--prefijo', prefijo, stdout=salida,
+        )
+        return salida.getvalue()
+
+    def test_generar_datos_reproducible(self):
+        self.assertIn('Generados 2 categorías, 8 libros, 6 usuarios', self.generar('uno'))
+        primeros = list(Prestamo.objects.order_by('id').values_list('estado', 'fecha_solicitud'))
+        self.assertTrue(primeros)
+        self.assertEqual(Usuario.objects.filter(username__startswith='uno_superadministrador').count(), 1)
+        self.assertFalse(Libro.objects.filter(cantidad_total__lt=0).exists())
+        self.assertEqual(
+            ResumenCirculacion.objects.filter(dimension='DIA').aggregate(total=Sum('solicitudes'))['total'],
+            len(primeros),
+        )
+
+        self.generar('dos')
+        segundos = list(Prestamo.objects.order_by('id').values_list('estado', 'fecha_solicitud'))[len(primeros):]
+        self.assertEqual(segundos, primeros)
+
+    def test_benchmark_vistas(self):
+        self.generar('gen')
+        with tempfile.TemporaryDirectory() as directorio:
+            linea_base = str(Path(directorio) / 'linea_base.json')
+            opciones = ['--repeticiones', '2', '--calentamiento', '0', '--linea-base', linea_base,
+                        '--rutas', 'libros:lista', 'prestamos:lista_prestamos', 'historial:lista_historial']
+            salida = StringIO()
+            call_command('benchmark_vistas', *opciones, '--guardar', stdout=salida)
+            resultados = json.loads(Path(linea_base).read_text())
+            # Tres rutas más dos variantes del historial, para cada uno de los tres roles.
+            self.assertEqual(len(resultados), 15)
+            self.assertTrue(all(resultado['p95_ms'] >= resultado['p50_ms'] for resultado in resultados.values()))
+
+            salida = StringIO()
+            call_command('benchmark_vistas', *opciones, '--umbral', '100', '--margen-ms', '1000', stdout=salida)
+            self.assertIn('Sin regresiones', salida.getvalue())
+
+            for resultado in resultados.values():
+                resultado['consultas'] = 0
+            Path(linea_base).write_text(json.dumps(resultados))
+            with self.assertRaises(CommandError):
+                call_command('benchmark_vistas', *opciones, '--margen-ms', '1000', stdout=StringIO())
+
+    def test_benchmark_lecturas_y_escrituras(self):
+        self.generar('gen')
+        self.assertTrue(escribe_en_get(reverse('prestamos:aprobar_prestamo', args=[1])))
+        self.assertFalse(escribe_en_get(reverse('historial:exportar', args=['prestamos'])))
+        prestamo = Prestamo.objects.order_by('id').first()
+        historial = Historial.objects.count()
+        admin = Usuario.objects.filter(rol='ADMINISTRADOR').order_by('id').first()
+        self.client.force_login(admin)
+        url = reverse('historial:exportar', args=['prestamos'])
+        with CaptureQueriesContext(connection) as sin_leer:
+            self.client.get(url)
+
+        with tempfile.TemporaryDirectory() as directorio:
+            linea_base = Path(directorio) / 'linea_base.json'
+            call_command(
+                'benchmark_vistas', '--repeticiones', '1', '--calentamiento', '0', '--linea-base', str(linea_base),
+                '--rutas', 'historial:exportar', 'prestamos:aprobar_prestamo', '--guardar', stdout=StringIO(),
+            )
+            resultados = json.loads(linea_base.read_text())
+        # La exportación se lee entera: se mide también la consulta que genera el cuerpo.
+        self.assertGreater(resultados[f'ADMINISTRADOR GET {url}']['consultas'], len(sin_leer))
+        # Las vistas que escriben en GET se revierten.
+        self.assertEqual(Prestamo.objects.get(pk=prestamo.pk).estado, prestamo.estado)
+        self.assertEqual(Historial.objects.count(), historial)
+
+
+@skipUnless(settings.SQLITE_PERFIL == 'optimizado', 'Solo con el perfil optimizado de SQLite')
+class PerfilSQLiteTests(SimpleTestCase):
+    alias = 'sqlite_prueba'
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = Path(directorio.name) / 'prueba.sqlite3'
+        configuracion = {**settings.DATABASES['default'], 'NAME': str(self.ruta)}
+        self.conexion = connections[self.alias] = DatabaseWrapper(configuracion, self.alias)
+        self.addCleanup(connections.__delitem__, self.alias)
+        self.addCleanup(self.conexion.close)
+        with self.conexion.cursor() as cursor:
+            cursor.execute('CREATE TABLE prueba (id INTEGER PRIMARY KEY, valor TEXT)')
+
+    def pragma(self, nombre):
+        with self.conexion.cursor() as cursor:
+            cursor.execute(f'PRAGMA {nombre}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma('mmap_size'), settings.SQLITE_PRAGMAS['mmap_size'])
+        self.assertEqual(self.pragma('cache_size'), settings.SQLITE_PRAGMAS['cache_size'])
+        self.assertEqual(self.pragma('temp_store'), 2)
+
+    def test_transacciones_inmediatas(self):
+        # BEGIN IMMEDIATE toma el bloqueo de escritura al abrir la transacción,
+        # antes de la primera escritura.
+        otra = sqlite3.connect(self.ruta, timeout=0)
+        self.addCleanup(otra.close)
+        with transaction.atomic(using=self.alias):
+            self.assertEqual(self.pragma('user_version'), 0)
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+                otra.execute("INSERT INTO prueba (valor) VALUES ('otra')")
+        otra.execute("INSERT INTO prueba (valor) VALUES ('otra')")
+        otra.commit()
+
+    def test_mantener(self):
+        with self.conexion.cursor() as cursor:
+            cursor.executemany('INSERT INTO prueba (valor) VALUES (%s)', [('x' * 100,)] * 500)
+        wal = Path(f'{self.ruta}-wal')
+        self.assertGreater(wal.stat().st_size, 0)
+
+        bloqueado, paginas, copiadas = mantener(self.alias, 'PASSIVE')
+        self.assertEqual(bloqueado, 0)
+        self.assertEqual(paginas, copiadas)
+
+        salida = StringIO()
+        call_command('mantener_sqlite', '--base', self.alias, stdout=salida)
+        self.assertIn('PRAGMA optimize ejecutado', salida.getvalue())
+        self.assertEqual(wal.stat().st_size, 0)
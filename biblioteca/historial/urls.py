@@ -5,5 +5,7 @@ app_name = 'historial'
 
 urlpatterns = [
     path('', views.lista_historial, name='lista_historial'),
+    path('exportar/<str:entidad>/', views.exportar, name='exportar'),
+    path('consultas/', views.consultas_sql, name='consultas_sql'),
     path('<str:tipo_entidad>/<int:entidad_id>/', views.historial_por_entidad, name='historial_por_entidad'),
 ]
\ No newline at end of file
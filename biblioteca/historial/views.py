@@ -1,43 +1,51 @@
+import datetime
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
-from .models import Historial
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.http import urlencode
+from . import archivo
+from .models import ConteoHistorial, Historial
 from libros.models import Libro
 from usuarios.models import Usuario
-from prestamos.models import Prestamo
+from prestamos.archivo import prestamos_en_bloque
+from biblioteca import exportacion
+from biblioteca.instrumentacion import estadisticas
+from biblioteca.paginacion import paginar_por_cursor, tamano_de_pagina
+
+# Carga de las entidades de una página por tipo_entidad (ids -> {id: objeto})
+CARGAR_ENTIDADES = {
+    'LIBRO': Libro.objects.in_bulk,
+    'PRESTAMO': prestamos_en_bloque,
+    'USUARIO': Usuario.objects.in_bulk,
+}
+
+def resolver_registros(historial):
+    """
+    Convierte los registros de una página en diccionarios para la plantilla,
+    resolviendo las entidades con una sola consulta por tipo_entidad.
+    """
+    ids_por_tipo = {}
+    for registro in historial:
+        if registro.tipo_entidad in CARGAR_ENTIDADES:
+            ids_por_tipo.setdefault(registro.tipo_entidad, set()).add(registro.entidad_id)
+
+    entidades = {
+        tipo: CARGAR_ENTIDADES[tipo](ids)
+        for tipo, ids in ids_por_tipo.items()
+    }
 
-@login_required
-def lista_historial(request):
-    if not request.user.rol in ['ADMINISTRADOR', 'SUPERADMINISTRADOR']:
-        messages.error(request, 'No tienes permisos para ver el historial.')
-        return redirect('usuarios:perfil')
-    
-    historial = Historial.objects.all().order_by('-fecha')
     registros = []
     for registro in historial:
-        # Obtener la entidad relacionada según tipo_entidad y entidad_id
-        entidad = None
-        if registro.tipo_entidad == 'LIBRO':
-            try:
-                entidad = Libro.objects.get(id=registro.entidad_id)
-            except Libro.DoesNotExist:
-                entidad = None
-        elif registro.tipo_entidad == 'PRESTAMO':
-            try:
-                entidad = Prestamo.objects.get(id=registro.entidad_id)
-            except Prestamo.DoesNotExist:
-                entidad = None
-        elif registro.tipo_entidad == 'USUARIO':
-            try:
-                entidad = Usuario.objects.get(id=registro.entidad_id)
-            except Usuario.DoesNotExist:
-                entidad = None
-        
+        entidad = entidades.get(registro.tipo_entidad, {}).get(registro.entidad_id)
         registros.append({
             'fecha': registro.fecha,
             'usuario': registro.usuario,
             'tipo_entidad': registro.tipo_entidad,
+            'entidad_id': registro.entidad_id,
             'entidad': entidad,
             'tipo_accion': registro.tipo_accion.lower(),
             'estado_anterior': registro.estado_anterior,
@@ -45,17 +53,105 @@ def lista_historial(request):
             'detalles': registro.detalles,
             'prestamo': entidad if registro.tipo_entidad == 'PRESTAMO' else None,
         })
+    return registros
+
+def filtros_historial(request):
+    """Lee los filtros de la petición; los valores no válidos se ignoran."""
+    filtros = {}
+    for campo in ('desde', 'hasta'):
+        try:
+            dia = parse_date(request.GET.get(campo) or '')
+        except ValueError:
+            dia = None
+        if dia:
+            filtros[campo] = dia
+    for campo, opciones in (('tipo_entidad', Historial.TIPOS_ENTIDAD), ('tipo_accion', Historial.TIPOS_ACCION)):
+        valor = (request.GET.get(campo) or '').upper()
+        if valor in dict(opciones):
+            filtros[campo] = valor
+    actor = (request.GET.get('actor') or '').strip()
+    if actor:
+        filtros['actor'] = actor
+        filtros['usuario'] = Usuario.objects.filter(username=actor).values_list('id', flat=True).first()
+    return filtros
+
+def filtrar_historial(historial, filtros):
+    """Aplica los filtros; cada combinación tiene un índice que termina en (-fecha, -id)."""
+    if 'desde' in filtros:
+        historial = historial.filter(fecha__gte=timezone.make_aware(datetime.datetime.combine(filtros['desde'], datetime.time.min)))
+    if 'hasta' in filtros:
+        hasta = datetime.datetime.combine(filtros['hasta'] + datetime.timedelta(days=1), datetime.time.min)
+        historial = historial.filter(fecha__lt=timezone.make_aware(hasta))
+    if 'tipo_entidad' in filtros:
+        historial = historial.filter(tipo_entidad=filtros['tipo_entidad'])
+    if 'tipo_accion' in filtros:
+        historial = historial.filter(tipo_accion=filtros['tipo_accion'])
+    if 'actor' in filtros:
+        if filtros['usuario'] is None:
+            return historial.none()
+        historial = historial.filter(usuario_id=filtros['usuario'])
+    return historial
+
+def contar_historial(historial, filtros, por_entidad=False):
+    """
+    Total para la cabecera sin COUNT(*) sobre todo el historial: se suman los
+    conteos diarios si los filtros lo permiten y, si no, se cuenta como mucho
+    hasta HISTORIAL_CONTEO_MAXIMO.
+    """
+    if not por_entidad and 'actor' not in filtros and ConteoHistorial.disponible():
+        total = ConteoHistorial.estimar(
+            filtros.get('desde'), filtros.get('hasta'), filtros.get('tipo_entidad'), filtros.get('tipo_accion')
+        )
+        return {'total_registros': total, 'total_aproximado': True, 'total_acotado': False}
+    limite = settings.HISTORIAL_CONTEO_MAXIMO
+    total = historial[:limite + 1].count()
+    return {'total_registros': min(total, limite), 'total_aproximado': False, 'total_acotado': total > limite}
 
-    paginator = Paginator(registros, 20)  # 20 registros por página
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def archivados_filtrados(registros, filtros):
+    """Aplica los filtros a registros archivados y carga sus usuarios con una sola consulta."""
+    desde, hasta = filtros.get('desde'), filtros.get('hasta')
+    registros = [
+        registro for registro in registros
+        if (not desde or timezone.localdate(registro.fecha) >= desde)
+        and (not hasta or timezone.localdate(registro.fecha) <= hasta)
+        and registro.tipo_accion == filtros.get('tipo_accion', registro.tipo_accion)
+        and ('actor' not in filtros or registro.usuario_id == filtros['usuario'])
+    ]
+    usuarios = Usuario.objects.in_bulk({registro.usuario_id for registro in registros if registro.usuario_id})
+    for registro in registros:
+        registro.usuario = usuarios.get(registro.usuario_id)
+    return registros
+
+def paginar_historial(request, historial, filtros, por_entidad=False):
+    tamano = tamano_de_pagina(request, settings.HISTORIAL_POR_PAGINA, settings.HISTORIAL_POR_PAGINA_MAXIMO)
+    pagina = paginar_por_cursor(historial.select_related('usuario'), ('-fecha', '-id'), request, tamano)
+    url_anterior, url_siguiente = pagina.enlaces(request)
+
+    exportar = {'formato': 'csv'}
+    # El actor se exporta por nombre: si no existe, la exportación también sale vacía.
+    for campo in ('desde', 'hasta', 'tipo_entidad', 'tipo_accion', 'actor'):
+        if campo in filtros:
+            exportar[campo] = filtros[campo]
+    return {
+        'registros': resolver_registros(pagina.object_list),
+        'url_anterior': url_anterior,
+        'url_siguiente': url_siguiente,
+        'filtros': filtros,
+        'tipos_entidad': Historial.TIPOS_ENTIDAD,
+        'tipos_accion': Historial.TIPOS_ACCION,
+        'parametros_exportacion': urlencode(exportar),
+        **contar_historial(historial, filtros, por_entidad),
+    }
+
+@login_required
+def lista_historial(request):
+    if not request.user.rol in ['ADMINISTRADOR', 'SUPERADMINISTRADOR']:
+        messages.error(request, 'No tienes permisos para ver el historial.')
+        return redirect('usuarios:perfil')
     
-    return render(request, 'historial/lista_historial.html', {
-        'registros': page_obj,
-        'page_obj': page_obj,
-        'total_registros': len(registros),
-        'is_paginated': page_obj.has_previous() or page_obj.has_next(),
-    })
+    filtros = filtros_historial(request)
+    historial = filtrar_historial(Historial.objects.all(), filtros)
+    return render(request, 'historial/lista_historial.html', paginar_historial(request, historial, filtros))
 
 @login_required
 def historial_por_entidad(request, tipo_entidad, entidad_id):
@@ -69,52 +165,75 @@ def historial_por_entidad(request, tipo_entidad, entidad_id):
         messages.error(request, 'Tipo de entidad no válido.')
         return redirect('historial:lista_historial')
 
-    historial = Historial.objects.filter(
+    filtros = filtros_historial(request)
+    filtros.pop('tipo_entidad', None)
+    historial = filtrar_historial(Historial.objects.filter(
         tipo_entidad=tipo_entidad,
         entidad_id=entidad_id
-    ).order_by('-fecha')
-
-    registros = []
-    for registro in historial:
-        # Obtener la entidad relacionada
-        entidad = None
-        if registro.tipo_entidad == 'LIBRO':
-            try:
-                entidad = Libro.objects.get(id=registro.entidad_id)
-            except Libro.DoesNotExist:
-                entidad = None
-        elif registro.tipo_entidad == 'PRESTAMO':
-            try:
-                entidad = Prestamo.objects.get(id=registro.entidad_id)
-            except Prestamo.DoesNotExist:
-                entidad = None
-        elif registro.tipo_entidad == 'USUARIO':
-            try:
-                entidad = Usuario.objects.get(id=registro.entidad_id)
-            except Usuario.DoesNotExist:
-                entidad = None
-        
-        registros.append({
-            'fecha': registro.fecha,
-            'usuario': registro.usuario,
-            'tipo_entidad': registro.tipo_entidad,
-            'entidad': entidad,
-            'tipo_accion': registro.tipo_accion.lower(),
-            'estado_anterior': registro.estado_anterior,
-            'estado_nuevo': registro.estado_nuevo,
-            'detalles': registro.detalles,
-            'prestamo': entidad if registro.tipo_entidad == 'PRESTAMO' else None,
-        })
+    ), filtros)
 
-    paginator = Paginator(registros, 20)  # 20 registros por página
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    return render(request, 'historial/lista_historial.html', {
-        'registros': page_obj,
-        'page_obj': page_obj,
-        'total_registros': len(registros),
+    contexto = {
+        **paginar_historial(request, historial, filtros, por_entidad=True),
         'tipo_entidad': tipo_entidad,
         'entidad_id': entidad_id,
-        'is_paginated': page_obj.has_previous() or page_obj.has_next(),
-    })
\ No newline at end of file
+        'total_archivados': archivo.total_archivado(tipo_entidad, entidad_id),
+    }
+    # Los segmentos archivados solo se leen cuando se piden.
+    if contexto['total_archivados'] and request.GET.get('archivo') == '1':
+        contexto['mostrar_archivados'] = True
+        contexto['registros_archivados'] = resolver_registros(
+            archivados_filtrados(archivo.registros_archivados(tipo_entidad, entidad_id), filtros)
+        )
+    return render(request, 'historial/lista_historial.html', contexto)
+
+@login_required
+def consultas_sql(request):
+    """Vistas y formas de consulta repetidas más costosas en las peticiones muestreadas."""
+    if not request.user.rol in ['ADMINISTRADOR', 'SUPERADMINISTRADOR']:
+        messages.error(request, 'No tienes permisos para ver el diagnóstico de consultas.')
+        return redirect('usuarios:perfil')
+
+    if request.method == 'POST':
+        estadisticas.reiniciar()
+        messages.success(request, 'Estadísticas de consultas reiniciadas.')
+        return redirect('historial:consultas_sql')
+
+    return render(request, 'historial/consultas_sql.html', {
+        'vistas': estadisticas.peores_vistas(),
+        'repetidas': estadisticas.peores_repetidas(),
+        'desde': datetime.datetime.fromtimestamp(estadisticas.desde, tz=datetime.timezone.utc),
+        'muestreo': settings.SQL_INSTRUMENTACION_MUESTREO,
+        'umbral': settings.SQL_N_MAS_UNO_UMBRAL,
+    })
+
+@login_required
+def exportar(request, entidad):
+    """
+    Descarga en streaming de libros, préstamos o historial en CSV o JSONL.
+    Acepta desde/hasta (AAAA-MM-DD), los filtros de cada entidad y gzip=1.
+    """
+    if not request.user.rol in ['ADMINISTRADOR', 'SUPERADMINISTRADOR']:
+        messages.error(request, 'No tienes permisos para exportar datos.')
+        return redirect('usuarios:perfil')
+
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportacion.FORMATOS:
+        return HttpResponseBadRequest(f'Formato desconocido "{formato}".')
+    comprimir = request.GET.get('gzip') == '1'
+    try:
+        campos, filas = exportacion.consulta(entidad, request.GET)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+
+    # Comprimida se sirve como archivo .gz (sin Content-Encoding, que los
+    # navegadores deshacen al descargar).
+    respuesta = StreamingHttpResponse(
+        exportacion.codificar(exportacion.lineas(campos, filas, formato), comprimir),
+        content_type='application/gzip' if comprimir else f'{exportacion.FORMATOS[formato]}; charset=utf-8',
+    )
+    nombre = exportacion.nombre_de_archivo(entidad, formato, comprimir)
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    # Sin buffer en el proxy para que el primer bloque llegue al cliente en cuanto se genera.
+    respuesta['X-Accel-Buffering'] = 'no'
+    respuesta['Cache-Control'] = 'private, no-store'
+    return respuesta
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class LibrosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'libros'
+
+    def ready(self):
+        from biblioteca.cache_versionada import conectar_invalidacion
+        from .models import Categoria, Libro
+
+        conectar_invalidacion(Categoria, Libro)
@@ -0,0 +1,68 @@
+import re
+from django.db import connection
+from django.db.models import Q, Value, FloatField
+from django.db.models.expressions import RawSQL
+
+# Tabla virtual FTS5 con contenido externo sobre la tabla `libros`.
+# Los triggers creados en la migración 0005 la mantienen sincronizada.
+TABLA_FTS = 'libros_fts'
+
+# Pesos de bm25 por columna: titulo, autor, editorial, descripcion.
+PESOS = (10.0, 5.0, 2.0, 1.0)
+
+_TERMINO = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_disponible():
+    return connection.vendor == 'sqlite'
+
+
+def construir_expresion(consulta):
+    """
+    Convierte el texto del usuario en una expresión MATCH de FTS5.
+    Cada palabra se busca como prefijo y todas deben aparecer.
+    """
+    terminos = _TERMINO.findall(consulta or '')
+    return ' '.join(f'"{termino}"*' for termino in terminos)
+
+
+def filtrar_por_texto(libros, consulta):
+    """
+    Restringe el queryset a los libros que coinciden con la consulta y lo
+    anota con `relevancia` (bm25: valores menores son más relevantes).
+    """
+    expresion = construir_expresion(consulta)
+    if not expresion:
+        return libros.annotate(relevancia=Value(0.0, output_field=FloatField()))
+
+    if not fts_disponible():
+        filtro = Q()
+        for termino in _TERMINO.findall(consulta):
+            filtro &= (
+                Q(titulo__icontains=termino) |
+                Q(autor__icontains=termino) |
+                Q(editorial__icontains=termino) |
+                Q(descripcion__icontains=termino)
+            )
+        return libros.filter(filtro).annotate(relevancia=Value(0.0, output_field=FloatField()))
+
+    pesos = ', '.join(str(peso) for peso in PESOS)
+    return libros.filter(
+        id__in=RawSQL(f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s', (expresion,))
+    ).annotate(
+        relevancia=RawSQL(
+            f'SELECT bm25({TABLA_FTS}, {pesos}) FROM {TABLA_FTS} '
+            f'WHERE {TABLA_FTS} MATCH %s AND {TABLA_FTS}.rowid = libros.id',
+            (expresion,),
+            output_field=FloatField(),
+        )
+    )
+
+
+def reconstruir_indice():
+    """Regenera el índice completo a partir de la tabla `libros`."""
+    if not fts_disponible():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('optimize')")
@@ -35,4 +35,8 @@ class LibroForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         for field in self.fields:
             if field not in ['descripcion']:
-                self.fields[field].widget.attrs.update({'class': 'form-control'})
\ No newline at end of file
+                self.fields[field].widget.attrs.update({'class': 'form-control'})
+        # Las opciones se pintan desde la caché; la validación sigue usando el queryset.
+        self.fields['categoria'].choices = [('', self.fields['categoria'].empty_label)] + [
+            (categoria.pk, str(categoria)) for categoria in Categoria.listado()
+        ]
\ No newline at end of file
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from libros.busqueda import reconstruir_indice, fts_disponible
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde cero el índice de búsqueda de texto completo del catálogo'
+
+    def handle(self, *args, **options):
+        if not fts_disponible():
+            self.stdout.write(self.style.WARNING('El motor de base de datos no soporta FTS5; no hay índice que reconstruir.'))
+            return
+        reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS('Índice de búsqueda reconstruido.'))
@@ -0,0 +1,61 @@
+from django.db import migrations
+
+CREAR = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS libros_fts USING fts5(
+        titulo, autor, editorial, descripcion,
+        content='libros', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS libros_fts_insert AFTER INSERT ON libros BEGIN
+        INSERT INTO libros_fts(rowid, titulo, autor, editorial, descripcion)
+        VALUES (new.id, new.titulo, new.autor, new.editorial, new.descripcion);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS libros_fts_delete AFTER DELETE ON libros BEGIN
+        INSERT INTO libros_fts(libros_fts, rowid, titulo, autor, editorial, descripcion)
+        VALUES ('delete', old.id, old.titulo, old.autor, old.editorial, old.descripcion);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS libros_fts_update
+    AFTER UPDATE OF titulo, autor, editorial, descripcion ON libros BEGIN
+        INSERT INTO libros_fts(libros_fts, rowid, titulo, autor, editorial, descripcion)
+        VALUES ('delete', old.id, old.titulo, old.autor, old.editorial, old.descripcion);
+        INSERT INTO libros_fts(rowid, titulo, autor, editorial, descripcion)
+        VALUES (new.id, new.titulo, new.autor, new.editorial, new.descripcion);
+    END
+    """,
+    "INSERT INTO libros_fts(libros_fts) VALUES ('rebuild')",
+]
+
+ELIMINAR = [
+    'DROP TRIGGER IF EXISTS libros_fts_update',
+    'DROP TRIGGER IF EXISTS libros_fts_delete',
+    'DROP TRIGGER IF EXISTS libros_fts_insert',
+    'DROP TABLE IF EXISTS libros_fts',
+]
+
+
+def ejecutar(sentencias):
+    def operacion(apps, schema_editor):
+        # El índice FTS5 sólo existe en SQLite; otros motores usan icontains.
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sentencia in sentencias:
+            schema_editor.execute(sentencia)
+    return operacion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0004_categoria_libro_categoria'),
+    ]
+
+    operations = [
+        migrations.RunPython(ejecutar(CREAR), ejecutar(ELIMINAR)),
+    ]
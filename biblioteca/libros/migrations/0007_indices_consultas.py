@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0006_libro_titulo_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['categoria', 'titulo', 'id'], name='libros_cat_titulo_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0007_indices_consultas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(condition=models.Q(('cantidad_total__gt', 0)), fields=['cantidad_total'], name='libros_disponibles_idx'),
+        ),
+    ]
@@ -1,13 +1,17 @@
 from django.db import models
+from django.db.models import F, Q, Case, When, Value
 from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
 from aldjemy.meta import AldjemyMeta
 from usuarios.models import Usuario
+from biblioteca.cache_versionada import QuerySetVersionado, cacheado
 
 class Categoria(models.Model, metaclass=AldjemyMeta):
     nombre = models.CharField(max_length=100, unique=True)
     descripcion = models.TextField(blank=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
 
+    objects = QuerySetVersionado.as_manager()
+
     __sa_columns__ = [
         Column('nombre', String(100)),
         Column('descripcion', Text),
@@ -23,6 +27,11 @@ class Categoria(models.Model, metaclass=AldjemyMeta):
     def __str__(self):
         return self.nombre
 
+    @classmethod
+    def listado(cls):
+        """Todas las categorías ordenadas por nombre, desde la caché mientras no cambien."""
+        return cacheado('categorias', (cls,), (), lambda: list(cls.objects.order_by('nombre')))
+
 class Libro(models.Model, metaclass=AldjemyMeta):
     ESTADOS = [
         ('DISPONIBLE', 'Disponible'),
@@ -41,6 +50,8 @@ class Libro(models.Model, metaclass=AldjemyMeta):
     registrado_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True)
     categoria = models.ForeignKey(Categoria, on_delete=models.PROTECT, related_name='libros', null=True, default=None)
 
+    objects = QuerySetVersionado.as_manager()
+
     __sa_columns__ = [
         Column('titulo', String(200)),
         Column('autor', String(100)),
@@ -59,10 +70,39 @@ class Libro(models.Model, metaclass=AldjemyMeta):
         verbose_name = 'Libro'
         verbose_name_plural = 'Libros'
         ordering = ['titulo']
+        indexes = [
+            models.Index(fields=['titulo', 'id'], name='libros_titulo_id_idx'),
+            models.Index(fields=['categoria', 'titulo', 'id'], name='libros_cat_titulo_idx'),
+            # métricas: títulos con ejemplares disponibles
+            models.Index(fields=['cantidad_total'], name='libros_disponibles_idx', condition=Q(cantidad_total__gt=0)),
+        ]
 
     def __str__(self):
         return f'{self.titulo} - {self.autor}'
 
     def actualizar_disponibilidad(self):
         self.estado = 'DISPONIBLE' if self.cantidad_total > 0 else 'NO_DISPONIBLE'
-        self.save()
\ No newline at end of file
+        self.save()
+
+    @classmethod
+    def prestar_ejemplar(cls, libro_id):
+        """
+        Descuenta un ejemplar con un único UPDATE condicional.
+        Devuelve False si ya no quedaban ejemplares.
+        """
+        return cls.objects.filter(id=libro_id, cantidad_total__gt=0).update(
+            cantidad_total=F('cantidad_total') - 1,
+            # En el SET se evalúa el valor previo a la resta.
+            estado=Case(
+                When(cantidad_total__lte=1, then=Value('NO_DISPONIBLE')),
+                default=Value('DISPONIBLE'),
+            ),
+        ) == 1
+
+    @classmethod
+    def devolver_ejemplar(cls, libro_id):
+        """Repone un ejemplar con un único UPDATE."""
+        return cls.objects.filter(id=libro_id).update(
+            cantidad_total=F('cantidad_total') + 1,
+            estado='DISPONIBLE',
+        ) == 1
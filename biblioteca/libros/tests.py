@@ -1,3 +1,231 @@
-from django.test import TestCase
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from biblioteca.paginacion import codificar_cursor
+from biblioteca.pruebas import PlanDeConsultaMixin
+from biblioteca.transacciones import transaccion_por_peticion
+from historial.models import Historial
+from prestamos.models import Prestamo
+from usuarios.models import Usuario
+from .busqueda import construir_expresion, filtrar_por_texto
+from .models import Libro, Categoria
 
-# Create your tests here.
+
+class PlanDeConsultaLibrosTests(PlanDeConsultaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cliente = Usuario.objects.create_user('lector', password='clave', rol='CLIENTE')
+        cls.categoria = Categoria.objects.create(nombre='Novela')
+        cls.libros = [
+            Libro.objects.create(
+                titulo=f'Libro {i}', autor='García Márquez', editorial='Sudamericana',
+                año_publicacion=1967, descripcion='Macondo', categoria=cls.categoria,
+            )
+            for i in range(30)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.cliente)
+
+    def test_lista_libros(self):
+        self.assertSinEscaneoCompleto(reverse('libros:lista'))
+
+    def test_buscar_libros_por_texto(self):
+        self.assertSinEscaneoCompleto(reverse('libros:buscar') + '?q=garcia')
+
+    def test_buscar_libros_por_categoria(self):
+        self.assertSinEscaneoCompleto(reverse('libros:buscar') + f'?categoria={self.categoria.id}')
+
+    def test_detalle_libro(self):
+        self.assertSinEscaneoCompleto(reverse('libros:detalle', args=[self.libros[0].id]))
+
+    def test_cursor_manipulado_se_ignora(self):
+        primera = self.client.get(reverse('libros:lista'))
+        for valores in (['Libro 1', 'abc'], ['Libro 1'], [None, 1], [['x'], 1], {'id': 1}):
+            respuesta = self.client.get(reverse('libros:lista'), {'despues': codificar_cursor(valores)})
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual(list(respuesta.context['libros']), list(primera.context['libros']))
+        respuesta = self.client.get(reverse('libros:buscar'), {'q': 'libro', 'antes': codificar_cursor(['mucho', 'Libro 1', 2])})
+        self.assertEqual(respuesta.status_code, 200)
+
+
+class CacheCatalogoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cliente = Usuario.objects.create_user('lector', password='clave', rol='CLIENTE')
+        cls.libro = Libro.objects.create(
+            titulo='Pedro Páramo', autor='Rulfo', editorial='FCE', año_publicacion=1955, descripcion='',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.cliente)
+
+    def test_catalogo_servido_desde_cache(self):
+        self.client.get(reverse('libros:lista'))
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('libros:lista'))
+        tablas = ' '.join(consulta['sql'] for consulta in consultas.captured_queries)
+        self.assertNotIn('"libros"', tablas)
+        self.assertNotIn('"categorias"', tablas)
+
+    def test_cambios_invalidan_catalogo(self):
+        self.client.get(reverse('libros:lista'))
+        Libro.objects.filter(id=self.libro.id).update(titulo='El llano en llamas')
+        self.assertContains(self.client.get(reverse('libros:lista')), 'El llano en llamas')
+        Categoria.objects.create(nombre='Cuento')
+        self.assertContains(self.client.get(reverse('libros:lista')), 'Cuento')
+
+    def test_cache_separada_por_vista(self):
+        categoria = Categoria.objects.create(nombre='Novela')
+        Libro.objects.create(
+            titulo='Aura', autor='Fuentes', editorial='Era', año_publicacion=1962, descripcion='', categoria=categoria,
+        )
+        parametros = {'categoria': categoria.id}
+        lista = self.client.get(reverse('libros:lista'), parametros)
+        self.assertEqual([libro.titulo for libro in lista.context['libros']], ['Aura', 'Pedro Páramo'])
+        busqueda = self.client.get(reverse('libros:buscar'), parametros)
+        self.assertEqual([libro.titulo for libro in busqueda.context['libros']], ['Aura'])
+        lista = self.client.get(reverse('libros:lista'), parametros)
+        self.assertEqual([libro.titulo for libro in lista.context['libros']], ['Aura', 'Pedro Páramo'])
+
+    def test_peticion_condicional(self):
+        url = reverse('libros:detalle', args=[self.libro.id])
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Libro.objects.filter(id=self.libro.id).update(cantidad_total=0)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class BusquedaTextoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cliente = Usuario.objects.create_user('lector', password='clave', rol='CLIENTE')
+        cls.cien_años = Libro.objects.create(
+            titulo='Cien años de soledad', autor='García Márquez', editorial='Sudamericana',
+            año_publicacion=1967, descripcion='Macondo',
+        )
+        cls.mencion = Libro.objects.create(
+            titulo='Vivir para contarla', autor='García Márquez', editorial='Mondadori',
+            año_publicacion=2002, descripcion='Memorias de la época en que escribió Cien años de soledad',
+        )
+        cls.otro = Libro.objects.create(
+            titulo='Rayuela', autor='Cortázar', editorial='Sudamericana', año_publicacion=1963, descripcion='',
+        )
+
+    def buscar(self, consulta):
+        return list(filtrar_por_texto(Libro.objects.all(), consulta).order_by('relevancia', 'titulo', 'id'))
+
+    def test_construir_expresion(self):
+        self.assertEqual(construir_expresion('cien "años" OR -soledad'), '"cien"* "años"* "OR"* "soledad"*')
+        self.assertEqual(construir_expresion('  ¿? '), '')
+
+    def test_prefijos_sin_acentos_y_relevancia(self):
+        self.assertEqual(self.buscar('garcia'), [self.cien_años, self.mencion])
+        # El título pesa más que la descripción.
+        self.assertEqual(self.buscar('soled cien'), [self.cien_años, self.mencion])
+        self.assertEqual(self.buscar('cortazar rayu'), [self.otro])
+
+    def test_indice_sincronizado_por_triggers(self):
+        Libro.objects.filter(id=self.otro.id).update(titulo='Los premios')
+        self.assertEqual(self.buscar('rayuela'), [])
+        self.assertEqual(self.buscar('premios'), [self.otro])
+        self.otro.delete()
+        self.assertEqual(self.buscar('premios'), [])
+
+    def test_reconstruir_indice(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO libros_fts(libros_fts) VALUES ('delete-all')")
+        self.assertEqual(self.buscar('rayuela'), [])
+        call_command('reconstruir_indice_libros', stdout=StringIO())
+        self.assertEqual(self.buscar('rayuela'), [self.otro])
+
+    def test_vista_buscar(self):
+        self.client.force_login(self.cliente)
+        respuesta = self.client.get(reverse('libros:buscar') + '?q=soledad')
+        self.assertEqual(list(respuesta.context['libros']), [self.cien_años, self.mencion])
+
+
+class TransaccionPorPeticionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        cls.categoria = Categoria.objects.create(nombre='Novela')
+        cls.libro = Libro.objects.create(
+            titulo='Rayuela', autor='Cortázar', editorial='Sudamericana',
+            año_publicacion=1963, descripcion='', categoria=cls.categoria,
+        )
+
+    def setUp(self):
+        self.fabrica = RequestFactory()
+
+    def test_revierte_si_la_vista_falla(self):
+        @transaccion_por_peticion
+        def vista(request):
+            Categoria.objects.create(nombre='Ensayo')
+            raise ValueError('fallo')
+
+        with self.assertRaises(ValueError):
+            vista(self.fabrica.post('/'))
+        self.assertFalse(Categoria.objects.filter(nombre='Ensayo').exists())
+
+    def test_solo_metodos_que_escriben(self):
+        profundidades = []
+
+        def vista(request):
+            profundidades.append(len(connection.savepoint_ids))
+            return HttpResponse()
+
+        envuelta = transaccion_por_peticion(vista)
+        con_get = transaccion_por_peticion(incluir_get=True)(vista)
+        base = len(connection.savepoint_ids)
+        envuelta(self.fabrica.get('/'))
+        envuelta(self.fabrica.post('/'))
+        con_get(self.fabrica.get('/'))
+        self.assertEqual(profundidades, [base, base + 1, base + 1])
+
+    def test_punto_de_guardado_conserva_la_peticion(self):
+        @transaccion_por_peticion
+        def vista(request):
+            Categoria.objects.create(nombre='Antes')
+            try:
+                with transaction.atomic():
+                    Categoria.objects.create(nombre='Novela')
+            except IntegrityError:
+                pass
+            Categoria.objects.create(nombre='Después')
+            return HttpResponse()
+
+        vista(self.fabrica.post('/'))
+        self.assertTrue(Categoria.objects.filter(nombre='Antes').exists())
+        self.assertTrue(Categoria.objects.filter(nombre='Después').exists())
+
+    def test_eliminar_libro_fallido(self):
+        prestamo = Prestamo.objects.create(usuario=self.admin, libro=self.libro)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TRIGGER libros_no_borrar BEFORE DELETE ON libros "
+                "BEGIN SELECT RAISE(ABORT, 'borrado bloqueado'); END"
+            )
+        self.client.force_login(self.admin)
+        respuesta = self.client.post(
+            reverse('libros:gestionar', args=[self.libro.id]), {'accion': 'eliminar'}, follow=True,
+        )
+        self.assertContains(respuesta, 'borrado bloqueado')
+        # El borrado en cascada del préstamo se revierte con el punto de guardado.
+        self.assertTrue(Prestamo.objects.filter(pk=prestamo.pk).exists())
+        self.assertTrue(Libro.objects.filter(pk=self.libro.pk).exists())
+        self.assertFalse(Historial.objects.filter(tipo_entidad='LIBRO', tipo_accion='ELIMINACION').exists())
+
+    def test_eliminar_categoria_con_libros(self):
+        self.client.force_login(self.admin)
+        respuesta = self.client.post(reverse('libros:eliminar_categoria', args=[self.categoria.id]), follow=True)
+        self.assertContains(respuesta, 'hay libros asociados')
+        self.assertTrue(Categoria.objects.filter(pk=self.categoria.pk).exists())
+        self.assertFalse(Historial.objects.filter(tipo_entidad='CATEGORIA', tipo_accion='ELIMINACION').exists())
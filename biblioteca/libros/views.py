@@ -1,35 +1,96 @@
+import hashlib
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
+from django.conf import settings
+from django.db import transaction
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from biblioteca.cache_versionada import cacheado, ultima_modificacion, versiones
+from biblioteca.paginacion import paginar_por_cursor, tamano_de_pagina
+from biblioteca.transacciones import transaccion_por_peticion
 from .models import Libro, Categoria
 from .forms import LibroForm, CategoriaForm
+from .busqueda import filtrar_por_texto
 from historial.models import Historial
 
+def paginar_catalogo(request, libros, ordenamiento=('titulo', 'id'), filtros=()):
+    """
+    Pagina el catálogo. La página se guarda en caché por vista, filtros
+    aplicados (`filtros`) y parámetros de la petición (cursor y tamaño) hasta
+    que cambie algún libro o categoría.
+    """
+    tamano = tamano_de_pagina(request, settings.CATALOGO_POR_PAGINA, settings.CATALOGO_POR_PAGINA_MAXIMO)
+    partes = (request.resolver_match.view_name, tuple(filtros), ordenamiento, tamano, sorted(request.GET.lists()))
+    pagina = cacheado(
+        'catalogo', (Libro, Categoria), partes,
+        lambda: paginar_por_cursor(libros, ordenamiento, request, tamano),
+    )
+    url_anterior, url_siguiente = pagina.enlaces(request)
+    return {
+        'libros': pagina,
+        'url_anterior': url_anterior,
+        'url_siguiente': url_siguiente,
+    }
+
+def _validable(request):
+    # Con mensajes pendientes la página no es la misma que vio el navegador.
+    return request.user.is_authenticated and not len(messages.get_messages(request))
+
+def _etag(request, *partes):
+    """
+    Validador de la página: los datos mostrados (versiones de los modelos y
+    parámetros) más lo que depende de quién la mira (usuario, rol, sesión y
+    token CSRF de los formularios).
+    """
+    usuario = request.user
+    partes += (usuario.pk, usuario.rol, usuario.last_login, request.META.get('CSRF_COOKIE'))
+    return hashlib.md5(repr(partes).encode()).hexdigest()
+
+def etag_catalogo(request):
+    if not _validable(request):
+        return None
+    return _etag(request, versiones(Libro, Categoria), sorted(request.GET.lists()))
+
+def etag_detalle(request, libro_id):
+    if not _validable(request):
+        return None
+    return _etag(request, versiones(Libro, Categoria), libro_id)
+
+def modificacion_catalogo(request, *args, **kwargs):
+    if not _validable(request):
+        return None
+    fecha = ultima_modificacion(Libro, Categoria)
+    # Un inicio de sesión (otro usuario en el mismo equipo) también cambia la página.
+    return max(fecha, request.user.last_login) if request.user.last_login else fecha
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_catalogo, last_modified_func=modificacion_catalogo)
 def lista_libros(request):
     libros = Libro.objects.all()
-    categorias = Categoria.objects.all().order_by('nombre')
+    categorias = Categoria.listado()
     return render(request, 'libros/lista_libros.html', {
-        'libros': libros,
+        **paginar_catalogo(request, libros),
         'categorias': categorias,
         'query': '',
         'categoria_seleccionada': ''
     })
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_catalogo, last_modified_func=modificacion_catalogo)
 def buscar_libros(request):
     query = request.GET.get('q', '')
     categoria_id = request.GET.get('categoria', '')
     
     libros = Libro.objects.all()
-    categorias = Categoria.objects.all().order_by('nombre')
+    categorias = Categoria.listado()
     
+    ordenamiento = ('titulo', 'id')
     if query:
-        libros = libros.filter(
-            Q(titulo__icontains=query) |
-            Q(autor__icontains=query)
-        )
+        libros = filtrar_por_texto(libros, query)
+        ordenamiento = ('relevancia', 'titulo', 'id')
     
     if categoria_id:
         try:
@@ -39,18 +100,21 @@ def buscar_libros(request):
             messages.error(request, 'Categoría no válida.')
     
     return render(request, 'libros/lista_libros.html', {
-        'libros': libros,
+        **paginar_catalogo(request, libros, ordenamiento, (query, categoria_id)),
         'query': query,
         'categorias': categorias,
         'categoria_seleccionada': categoria_id
     })
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_detalle, last_modified_func=modificacion_catalogo)
 def detalle_libro(request, libro_id):
     libro = get_object_or_404(Libro, id=libro_id)
     return render(request, 'libros/detalle_libro.html', {'libro': libro})
 
 @login_required
+@transaccion_por_peticion
 def gestionar_categorias(request):
     if not (request.user.is_admin or request.user.is_superadmin):
         messages.error(request, 'No tienes permisos para gestionar categorías.')
@@ -72,13 +136,14 @@ def gestionar_categorias(request):
     else:
         form = CategoriaForm()
 
-    categorias = Categoria.objects.all().order_by('nombre')
+    categorias = Categoria.listado()
     return render(request, 'libros/gestionar_categorias.html', {
         'form': form,
         'categorias': categorias
     })
 
 @login_required
+@transaccion_por_peticion
 def editar_categoria(request, categoria_id):
     if not (request.user.is_admin or request.user.is_superadmin):
         messages.error(request, 'No tienes permisos para editar categorías.')
@@ -101,6 +166,7 @@ def editar_categoria(request, categoria_id):
     return redirect('libros:gestionar_categorias')
 
 @login_required
+@transaccion_por_peticion
 def eliminar_categoria(request, categoria_id):
     if not (request.user.is_admin or request.user.is_superadmin):
         messages.error(request, 'No tienes permisos para eliminar categorías.')
@@ -109,7 +175,9 @@ def eliminar_categoria(request, categoria_id):
     categoria = get_object_or_404(Categoria, id=categoria_id)
     if request.method == 'POST':
         try:
-            categoria.delete()
+            # Punto de guardado: un error capturado no invalida la transacción de la petición.
+            with transaction.atomic():
+                categoria.delete()
             Historial.registrar_cambio(
                 usuario=request.user,
                 tipo_entidad='CATEGORIA',
@@ -123,6 +191,7 @@ def eliminar_categoria(request, categoria_id):
     return redirect('libros:gestionar_categorias')
 
 @login_required
+@transaccion_por_peticion
 def gestionar_libro(request, libro_id=None):
     if not (request.user.is_admin or request.user.is_superadmin):
         messages.error(request, 'No tienes permisos para gestionar libros.')
@@ -148,7 +217,8 @@ def gestionar_libro(request, libro_id=None):
             elif accion == 'eliminar':
                 try:
                     titulo_libro = libro.titulo
-                    libro.delete()
+                    with transaction.atomic():
+                        libro.delete()
                     Historial.registrar_cambio(
                         usuario=request.user,
                         tipo_entidad='LIBRO',
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class PrestamosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'prestamos'
+
+
+    def ready(self):
+        from biblioteca.cache_versionada import conectar_invalidacion
+        from .models import Prestamo
+
+        # TareaVencimientos se arranca en biblioteca/wsgi.py: sólo en los
+        # procesos web, no en migrate, test, shell ni en los comandos.
+        conectar_invalidacion(Prestamo)
@@ -0,0 +1,84 @@
+"""
+Separación de préstamos activos y cerrados.
+
+`archivar_cerrados` mueve los préstamos DEVUELTO y RECHAZADO cerrados hace más
+de PRESTAMOS_ARCHIVO_DIAS de `prestamos` a `prestamos_archivados`, por lotes:
+cada lote es una transacción corta con un INSERT ... SELECT y un DELETE, así
+que la tabla caliente solo conserva los préstamos en curso y los cerrados
+recientes. Los estados cerrados son definitivos, de modo que un préstamo
+archivado no vuelve a cambiar.
+
+El id se conserva, así que `buscar_prestamo` y `prestamos_en_bloque` resuelven
+indistintamente préstamos de una u otra tabla (detalle_prestamo, historial).
+"""
+import datetime
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.http import Http404
+from django.utils import timezone
+from biblioteca.cache_versionada import incrementar_version
+from .models import Prestamo, PrestamoArchivado
+
+TAMANO_LOTE = 1000
+
+
+def limite_de_archivo(dias=None):
+    if dias is None:
+        dias = settings.PRESTAMOS_ARCHIVO_DIAS
+    return timezone.now() - datetime.timedelta(days=dias)
+
+
+def cerrados_antes_de(limite):
+    # Los rechazados no guardan fecha de cierre; se resuelven poco después de la solicitud.
+    return Prestamo.objects.filter(
+        Q(estado='DEVUELTO', fecha_devolucion_real__lt=limite) |
+        Q(estado='RECHAZADO', fecha_solicitud__lt=limite)
+    )
+
+
+def archivar_cerrados(limite, tamano_lote=TAMANO_LOTE):
+    """Devuelve el número de préstamos movidos a la tabla de archivo."""
+    nombre = connection.ops.quote_name
+    columnas = ', '.join(nombre(campo.column) for campo in Prestamo._meta.concrete_fields)
+    origen = nombre(Prestamo._meta.db_table)
+    destino = nombre(PrestamoArchivado._meta.db_table)
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(cerrados_antes_de(limite).order_by().values_list('id', flat=True)[:tamano_lote])
+            if not ids:
+                break
+            marcadores = ', '.join(['%s'] * len(ids))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {destino} ({columnas}, {nombre("fecha_archivado")}) '
+                    f'SELECT {columnas}, %s FROM {origen} WHERE {nombre("id")} IN ({marcadores})',
+                    [timezone.now(), *ids],
+                )
+                copiados = cursor.rowcount
+                cursor.execute(f'DELETE FROM {origen} WHERE {nombre("id")} IN ({marcadores})', ids)
+                if cursor.rowcount != copiados:
+                    raise RuntimeError(f'Se copiaron {copiados} préstamos pero se borrarían {cursor.rowcount}.')
+            # Las escrituras con SQL directo no emiten señales.
+            incrementar_version(Prestamo)
+        total += len(ids)
+    return total
+
+
+def buscar_prestamo(prestamo_id):
+    """Préstamo activo o archivado con ese id; Http404 si no existe en ninguna tabla."""
+    for modelo in (Prestamo, PrestamoArchivado):
+        prestamo = modelo.objects.select_related('libro', 'usuario').filter(id=prestamo_id).first()
+        if prestamo is not None:
+            return prestamo
+    raise Http404('No existe el préstamo.')
+
+
+def prestamos_en_bloque(ids):
+    """Como in_bulk, pero busca en la tabla de archivo los ids que no están en la activa."""
+    prestamos = Prestamo.objects.in_bulk(ids)
+    faltantes = set(ids) - set(prestamos)
+    if faltantes:
+        prestamos.update(PrestamoArchivado.objects.in_bulk(faltantes))
+    return prestamos
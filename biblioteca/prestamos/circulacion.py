@@ -0,0 +1,185 @@
+"""
+Resúmenes diarios de circulación.
+
+Cada cambio de estado de un préstamo suma sus contadores en ResumenCirculacion
+dentro de la misma transacción que el cambio: para el total del día, para la
+categoría del libro y para el usuario. Las páginas de estadísticas sólo leen
+estos resúmenes, así que su coste depende del periodo consultado y no del
+número de préstamos.
+
+El día de cada evento sale de las fechas del propio préstamo (solicitud,
+aprobación, devolución esperada para el vencimiento y devolución real; los
+rechazos, que no guardan fecha, cuentan el día de la solicitud). Así
+`reconstruir` obtiene exactamente los mismos contadores con una sola lectura
+de `prestamos` y `prestamos_archivados`.
+"""
+import datetime
+from collections import Counter, defaultdict
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .models import Prestamo, PrestamoArchivado, ResumenCirculacion
+
+CONTADORES = (
+    'solicitudes', 'aprobaciones', 'rechazos', 'vencimientos',
+    'devoluciones', 'devoluciones_tardias', 'segundos_prestados',
+)
+
+CAMPOS = (
+    'usuario_id', 'libro__categoria_id', 'estado', 'fecha_solicitud',
+    'fecha_aprobacion', 'fecha_devolucion_esperada', 'fecha_devolucion_real',
+)
+
+EVENTOS = ('SOLICITUD', 'APROBACION', 'RECHAZO', 'VENCIMIENTO', 'DEVOLUCION')
+
+# Días del periodo -> agrupación de la tabla por fechas
+PERIODOS = {7: 'DIA', 30: 'DIA', 90: 'SEMANA', 365: 'MES'}
+
+TAMANO_BLOQUE = 2000
+
+
+def _tardio(prestamo):
+    return (
+        prestamo['fecha_devolucion_real'] is not None and prestamo['fecha_devolucion_esperada'] is not None
+        and prestamo['fecha_devolucion_real'] > prestamo['fecha_devolucion_esperada']
+    )
+
+
+def _contadores(evento, prestamo):
+    """(fecha, contadores) del evento, o None si el préstamo no lo ha tenido."""
+    if evento == 'SOLICITUD':
+        return prestamo['fecha_solicitud'], {'solicitudes': 1}
+    if evento == 'APROBACION':
+        if prestamo['fecha_aprobacion'] is None:
+            return None
+        return prestamo['fecha_aprobacion'], {'aprobaciones': 1}
+    if evento == 'RECHAZO':
+        if prestamo['estado'] != 'RECHAZADO':
+            return None
+        return prestamo['fecha_solicitud'], {'rechazos': 1}
+    if evento == 'VENCIMIENTO':
+        # Un préstamo devuelto con retraso venció aunque no llegara a marcarse.
+        if prestamo['estado'] != 'VENCIDO' and not (prestamo['estado'] == 'DEVUELTO' and _tardio(prestamo)):
+            return None
+        return prestamo['fecha_devolucion_esperada'], {'vencimientos': 1}
+    if evento == 'DEVOLUCION':
+        if prestamo['estado'] != 'DEVUELTO' or prestamo['fecha_devolucion_real'] is None:
+            return None
+        inicio = prestamo['fecha_aprobacion'] or prestamo['fecha_solicitud']
+        return prestamo['fecha_devolucion_real'], {
+            'devoluciones': 1,
+            'devoluciones_tardias': int(_tardio(prestamo)),
+            'segundos_prestados': int((prestamo['fecha_devolucion_real'] - inicio).total_seconds()),
+        }
+    raise ValueError(f'Evento desconocido "{evento}".')
+
+
+def _acumular(prestamos, eventos, resumen):
+    """Suma en `resumen` ({(dimension, dia, clave): Counter}) los eventos de cada préstamo."""
+    for prestamo in prestamos:
+        for evento in eventos:
+            contado = _contadores(evento, prestamo)
+            if contado is None:
+                continue
+            fecha, valores = contado
+            dia = timezone.localdate(fecha)
+            resumen[('DIA', dia, 0)].update(valores)
+            resumen[('CATEGORIA', dia, prestamo['libro__categoria_id'] or 0)].update(valores)
+            resumen[('USUARIO', dia, prestamo['usuario_id'])].update(valores)
+    return resumen
+
+
+def _sumar(resumen):
+    """Suma los contadores a las filas existentes, creándolas si no existen."""
+    if not resumen:
+        return
+    nombre = connection.ops.quote_name
+    tabla = nombre(ResumenCirculacion._meta.db_table)
+    columnas = [nombre(campo) for campo in ('dimension', 'dia', 'clave', *CONTADORES)]
+    actualizar = ', '.join(f'{columna} = {tabla}.{columna} + excluded.{columna}' for columna in columnas[3:])
+    sentencia = (
+        f'INSERT INTO {tabla} ({", ".join(columnas)}) VALUES ({", ".join(["%s"] * len(columnas))}) '
+        f'ON CONFLICT ({", ".join(columnas[:3])}) DO UPDATE SET {actualizar}'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sentencia, [
+            [dimension, connection.ops.adapt_datefield_value(dia), clave, *(valores[c] for c in CONTADORES)]
+            for (dimension, dia, clave), valores in sorted(resumen.items())
+        ])
+
+
+def registrar(evento, ids):
+    """
+    Suma `evento` de los préstamos `ids` a los resúmenes. Se llama después de
+    aplicar el cambio de estado y dentro de la misma transacción.
+    """
+    if not ids:
+        return
+    prestamos = Prestamo.objects.filter(id__in=ids).order_by().values(*CAMPOS)
+    _sumar(_acumular(prestamos, (evento,), defaultdict(Counter)))
+
+
+def reconstruir(tamano_bloque=TAMANO_BLOQUE):
+    """Rehace todos los resúmenes desde los préstamos. Devuelve el número de filas."""
+    with transaction.atomic():
+        # Borrar primero toma el bloqueo de escritura, así que ningún cambio de
+        # estado puede colarse entre la lectura y la escritura de los resúmenes.
+        ResumenCirculacion.objects.all().delete()
+        resumen = defaultdict(Counter)
+        for modelo in (Prestamo, PrestamoArchivado):
+            _acumular(modelo.objects.order_by().values(*CAMPOS).iterator(chunk_size=tamano_bloque), EVENTOS, resumen)
+        _sumar(resumen)
+    return len(resumen)
+
+
+def _indicadores(fila):
+    """Añade la duración media en días y el porcentaje de devoluciones con retraso."""
+    devoluciones = fila['devoluciones']
+    fila['duracion_media'] = fila['segundos_prestados'] / devoluciones / 86400 if devoluciones else None
+    fila['tasa_retraso'] = 100 * fila['devoluciones_tardias'] / devoluciones if devoluciones else None
+    return fila
+
+
+def _del_periodo(dimension, desde, hasta):
+    return ResumenCirculacion.objects.filter(dimension=dimension, dia__gte=desde, dia__lte=hasta)
+
+
+def por_dia(desde, hasta):
+    """Contadores de cada día con actividad entre `desde` y `hasta`, incluidos."""
+    return [
+        _indicadores(fila)
+        for fila in _del_periodo('DIA', desde, hasta).order_by('dia').values('dia', *CONTADORES)
+    ]
+
+
+def totales(dias):
+    """Suma de las filas devueltas por `por_dia`."""
+    suma = {contador: sum(dia[contador] for dia in dias) for contador in CONTADORES}
+    return _indicadores(suma)
+
+
+def agrupar(dias, agrupacion):
+    """Agrupa las filas de `por_dia` por SEMANA (desde el lunes) o MES; `dia` pasa a ser el inicio."""
+    if agrupacion == 'DIA':
+        return dias
+    grupos = {}
+    for fila in dias:
+        if agrupacion == 'SEMANA':
+            inicio = fila['dia'] - datetime.timedelta(days=fila['dia'].weekday())
+        else:
+            inicio = fila['dia'].replace(day=1)
+        grupos.setdefault(inicio, []).append(fila)
+    return [{'dia': inicio, **totales(filas)} for inicio, filas in grupos.items()]
+
+
+def principales(dimension, desde, hasta, limite=10):
+    """Las `limite` claves de la dimensión con más solicitudes en el periodo."""
+    filas = (
+        _del_periodo(dimension, desde, hasta).values('clave')
+        .annotate(**{f'suma_{contador}': Sum(contador) for contador in CONTADORES})
+        .order_by('-suma_solicitudes', 'clave')[:limite]
+    )
+    return [
+        _indicadores({'clave': fila['clave'], **{contador: fila[f'suma_{contador}'] for contador in CONTADORES}})
+        for fila in filas
+    ]
@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from prestamos.archivo import TAMANO_LOTE, archivar_cerrados, cerrados_antes_de, limite_de_archivo
+
+
+class Command(BaseCommand):
+    help = 'Mueve a prestamos_archivados los préstamos devueltos o rechazados hace más de PRESTAMOS_ARCHIVO_DIAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help='Antigüedad mínima en días (por defecto PRESTAMOS_ARCHIVO_DIAS)')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Préstamos por transacción')
+        parser.add_argument('--simular', action='store_true', help='Solo cuenta los préstamos que se moverían')
+
+    def handle(self, *args, **options):
+        limite = limite_de_archivo(options['dias'])
+        if options['simular']:
+            self.stdout.write(f'{cerrados_antes_de(limite).count()} préstamos cerrados antes de {limite:%Y-%m-%d %H:%M}.')
+            return
+        inicio = time.monotonic()
+        archivados = archivar_cerrados(limite, tamano_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{archivados} préstamos archivados en {time.monotonic() - inicio:.2f} s.'
+        ))
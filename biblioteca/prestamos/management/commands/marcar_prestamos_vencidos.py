@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from prestamos.vencimientos import marcar_vencidos, TAMANO_LOTE
+
+
+class Command(BaseCommand):
+    help = 'Marca como VENCIDO los préstamos aprobados cuya fecha de devolución ya pasó'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Préstamos por transacción')
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Si es mayor que cero, repite la tarea cada N segundos hasta interrumpirla',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            inicio = time.monotonic()
+            marcados = marcar_vencidos(tamano_lote=options['lote'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{marcados} préstamos marcados como vencidos en {time.monotonic() - inicio:.2f} s.'
+            ))
+            if options['intervalo'] <= 0:
+                break
+            time.sleep(options['intervalo'])
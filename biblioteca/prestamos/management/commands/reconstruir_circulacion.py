@@ -0,0 +1,17 @@
+import time
+from django.core.management.base import BaseCommand
+from prestamos.circulacion import TAMANO_BLOQUE, reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Rehace los resúmenes diarios de circulación leyendo una vez los préstamos activos y archivados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bloque', type=int, default=TAMANO_BLOQUE, help='Préstamos leídos por consulta')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        filas = reconstruir(tamano_bloque=options['bloque'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{filas} filas de resumen reconstruidas en {time.monotonic() - inicio:.2f} s.'
+        ))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0007_indices_consultas'),
+        ('prestamos', '0003_alter_prestamo_options'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['usuario', 'libro', 'estado'], name='prestamos_usr_libro_est_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['estado', '-fecha_aprobacion'], name='prestamos_est_aprob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(condition=models.Q(('estado', 'APROBADO')), fields=['usuario', '-fecha_aprobacion'], name='prestamos_activos_usr_idx'),
+        ),
+    ]
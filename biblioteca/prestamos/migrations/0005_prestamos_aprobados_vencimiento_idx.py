@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0007_indices_consultas'),
+        ('prestamos', '0004_indices_consultas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(condition=models.Q(('estado', 'APROBADO')), fields=['fecha_devolucion_esperada'], name='prestamos_aprob_venc_idx'),
+        ),
+    ]
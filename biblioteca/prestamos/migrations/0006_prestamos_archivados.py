@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0007_indices_consultas'),
+        ('prestamos', '0005_prestamos_aprobados_vencimiento_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrestamoArchivado',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('fecha_solicitud', models.DateTimeField()),
+                ('fecha_aprobacion', models.DateTimeField(blank=True, null=True)),
+                ('fecha_devolucion_esperada', models.DateTimeField(blank=True, null=True)),
+                ('fecha_devolucion_real', models.DateTimeField(blank=True, null=True)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente de Aprobación'), ('APROBADO', 'Aprobado'), ('RECHAZADO', 'Rechazado'), ('DEVUELTO', 'Devuelto'), ('VENCIDO', 'Vencido')], max_length=20)),
+                ('notas', models.TextField(blank=True)),
+                ('fecha_archivado', models.DateTimeField()),
+                ('aprobado_por', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prestamos_archivados', to='libros.libro')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prestamos_archivados', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Préstamo archivado',
+                'verbose_name_plural': 'Préstamos archivados',
+                'db_table': 'prestamos_archivados',
+                'ordering': ['-fecha_solicitud'],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prestamos', '0006_prestamos_archivados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCirculacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('DIA', 'Total del día'), ('CATEGORIA', 'Por categoría'), ('USUARIO', 'Por usuario')], max_length=10)),
+                ('dia', models.DateField()),
+                ('clave', models.IntegerField(default=0)),
+                ('solicitudes', models.IntegerField(default=0)),
+                ('aprobaciones', models.IntegerField(default=0)),
+                ('rechazos', models.IntegerField(default=0)),
+                ('vencimientos', models.IntegerField(default=0)),
+                ('devoluciones', models.IntegerField(default=0)),
+                ('devoluciones_tardias', models.IntegerField(default=0)),
+                ('segundos_prestados', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Resumen de circulación',
+                'verbose_name_plural': 'Resúmenes de circulación',
+                'db_table': 'prestamos_circulacion',
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'dia', 'clave'), name='prestamos_circulacion_unico')],
+            },
+        ),
+    ]
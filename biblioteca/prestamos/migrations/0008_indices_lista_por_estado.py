@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0008_libros_disponibles_idx'),
+        ('prestamos', '0007_resumen_circulacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='prestamo',
+            name='prestamos_est_aprob_idx',
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['estado', 'fecha_aprobacion', 'id'], name='prestamos_est_aprob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['estado', 'fecha_devolucion_esperada', 'id'], name='prestamos_est_devol_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['estado', 'fecha_solicitud', 'id'], name='prestamos_est_solic_idx'),
+        ),
+    ]
@@ -1,7 +1,9 @@
-from django.db import models
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from django.db import models, transaction
+from django.db.models import Q
+from sqlalchemy import Column, BigInteger, Integer, String, Date, DateTime, ForeignKey
 from aldjemy.meta import AldjemyMeta
 from usuarios.models import Usuario
+from biblioteca.cache_versionada import QuerySetVersionado
 from libros.models import Libro
 from django.utils import timezone
 from datetime import timedelta
@@ -25,6 +27,8 @@ class Prestamo(models.Model, metaclass=AldjemyMeta):
     aprobado_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, related_name='prestamos_aprobados')
     notas = models.TextField(blank=True)
 
+    objects = QuerySetVersionado.as_manager()
+
     __sa_columns__ = [
         Column('usuario_id', Integer, ForeignKey('usuarios.id')),
         Column('libro_id', Integer, ForeignKey('libros.id')),
@@ -42,39 +46,180 @@ class Prestamo(models.Model, metaclass=AldjemyMeta):
         verbose_name = 'Préstamo'
         verbose_name_plural = 'Préstamos'
         ordering = ['-fecha_aprobacion']
+        indexes = [
+            # solicitar_prestamo: préstamo abierto del usuario para el libro
+            models.Index(fields=['usuario', 'libro', 'estado'], name='prestamos_usr_libro_est_idx'),
+            # lista_prestamos: préstamos de un estado en cada orden de la tabla
+            # (id incluido para que el índice dé también el desempate).
+            models.Index(fields=['estado', 'fecha_aprobacion', 'id'], name='prestamos_est_aprob_idx'),
+            models.Index(fields=['estado', 'fecha_devolucion_esperada', 'id'], name='prestamos_est_devol_idx'),
+            models.Index(fields=['estado', 'fecha_solicitud', 'id'], name='prestamos_est_solic_idx'),
+            # marcar_vencidos: préstamos aprobados por fecha de devolución
+            models.Index(
+                fields=['fecha_devolucion_esperada'],
+                name='prestamos_aprob_venc_idx',
+                condition=Q(estado='APROBADO'),
+            ),
+            # perfil_usuario: préstamos activos del cliente
+            models.Index(
+                fields=['usuario', '-fecha_aprobacion'],
+                name='prestamos_activos_usr_idx',
+                condition=Q(estado='APROBADO'),
+            ),
+        ]
 
     def __str__(self):
         return f'Préstamo de {self.libro.titulo} a {self.usuario.username}'
 
     def aprobar(self, administrador):
-        if self.estado == 'PENDIENTE' and self.libro.cantidad_total > 0:
-            self.estado = 'APROBADO'
-            self.aprobado_por = administrador
-            self.fecha_aprobacion = timezone.now()
-            self.fecha_devolucion_esperada = self.fecha_aprobacion + timedelta(days=15)
+        from .circulacion import registrar
+        ahora = timezone.now()
+        cambios = {
+            'estado': 'APROBADO',
+            'aprobado_por': administrador,
+            'fecha_aprobacion': ahora,
+            'fecha_devolucion_esperada': ahora + timedelta(days=15),
+        }
+        with transaction.atomic():
+            if not Libro.prestar_ejemplar(self.libro_id):
+                return False
+            if not Prestamo.objects.filter(id=self.id, estado='PENDIENTE').update(**cambios):
+                # Otro administrador lo resolvió antes: se deshace el descuento.
+                transaction.set_rollback(True)
+                return False
+            registrar('APROBACION', [self.id])
+        for campo, valor in cambios.items():
+            setattr(self, campo, valor)
+        if Prestamo.libro.is_cached(self):
             self.libro.cantidad_total -= 1
-            self.libro.actualizar_disponibilidad()
-            self.libro.save()
-            self.save()
-            return True
-        return False
+            self.libro.estado = 'DISPONIBLE' if self.libro.cantidad_total > 0 else 'NO_DISPONIBLE'
+        return True
 
     def rechazar(self, administrador, motivo):
-        if self.estado == 'PENDIENTE':
-            self.estado = 'RECHAZADO'
-            self.aprobado_por = administrador
-            self.notas = motivo
-            self.save()
-            return True
-        return False
+        from .circulacion import registrar
+        cambios = {
+            'estado': 'RECHAZADO',
+            'aprobado_por': administrador,
+            'notas': motivo,
+        }
+        with transaction.atomic():
+            # Condicional, como aprobar: la instancia puede estar desactualizada.
+            if not Prestamo.objects.filter(id=self.id, estado='PENDIENTE').update(**cambios):
+                return False
+            registrar('RECHAZO', [self.id])
+        for campo, valor in cambios.items():
+            setattr(self, campo, valor)
+        return True
 
     def devolver(self):
-        if self.estado == 'APROBADO':
-            self.estado = 'DEVUELTO'
-            self.fecha_devolucion_real = timezone.now()
+        from .circulacion import registrar
+        cambios = {
+            'estado': 'DEVUELTO',
+            'fecha_devolucion_real': timezone.now(),
+        }
+        with transaction.atomic():
+            vencido = Prestamo.objects.filter(id=self.id, estado='VENCIDO').update(**cambios)
+            if not vencido and not Prestamo.objects.filter(id=self.id, estado='APROBADO').update(**cambios):
+                return False
+            Libro.devolver_ejemplar(self.libro_id)
+            registrar('DEVOLUCION', [self.id])
+            if not vencido:
+                # Devuelto con retraso antes de que marcar_vencidos lo marcara.
+                registrar('VENCIMIENTO', [self.id])
+        for campo, valor in cambios.items():
+            setattr(self, campo, valor)
+        if Prestamo.libro.is_cached(self):
             self.libro.cantidad_total += 1
-            self.libro.actualizar_disponibilidad()
-            self.libro.save()
-            self.save()
-            return True
-        return False
\ No newline at end of file
+            self.libro.estado = 'DISPONIBLE'
+        return True
+
+
+class PrestamoArchivado(models.Model, metaclass=AldjemyMeta):
+    """
+    Préstamo cerrado (DEVUELTO o RECHAZADO) movido fuera de la tabla `prestamos`
+    por prestamos.archivo. Conserva el id original, así que las referencias del
+    historial siguen resolviéndose (ver buscar_prestamo y prestamos_en_bloque).
+    """
+    ESTADOS = Prestamo.ESTADOS
+
+    id = models.IntegerField(primary_key=True)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='prestamos_archivados')
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='prestamos_archivados')
+    fecha_solicitud = models.DateTimeField()
+    fecha_aprobacion = models.DateTimeField(null=True, blank=True)
+    fecha_devolucion_esperada = models.DateTimeField(null=True, blank=True)
+    fecha_devolucion_real = models.DateTimeField(null=True, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS)
+    aprobado_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, related_name='+')
+    notas = models.TextField(blank=True)
+    fecha_archivado = models.DateTimeField()
+
+    __sa_columns__ = [
+        Column('usuario_id', Integer, ForeignKey('usuarios.id')),
+        Column('libro_id', Integer, ForeignKey('libros.id')),
+        Column('fecha_solicitud', DateTime),
+        Column('fecha_aprobacion', DateTime),
+        Column('fecha_devolucion_esperada', DateTime),
+        Column('fecha_devolucion_real', DateTime),
+        Column('estado', String(20)),
+        Column('aprobado_por_id', Integer, ForeignKey('usuarios.id')),
+        Column('notas', String),
+        Column('fecha_archivado', DateTime),
+    ]
+
+    class Meta:
+        db_table = 'prestamos_archivados'
+        verbose_name = 'Préstamo archivado'
+        verbose_name_plural = 'Préstamos archivados'
+        ordering = ['-fecha_solicitud']
+
+    def __str__(self):
+        return f'Préstamo de {self.libro.titulo} a {self.usuario.username}'
+
+
+class ResumenCirculacion(models.Model, metaclass=AldjemyMeta):
+    """
+    Contadores de circulación de un día: en total (dimensión DIA, clave 0), por
+    categoría del libro (clave categoria_id, 0 sin categoría) o por usuario. Los
+    mantiene prestamos.circulacion en la misma transacción que cada cambio de
+    estado; el comando reconstruir_circulacion los rehace desde los préstamos.
+    """
+    DIMENSIONES = [
+        ('DIA', 'Total del día'),
+        ('CATEGORIA', 'Por categoría'),
+        ('USUARIO', 'Por usuario'),
+    ]
+
+    dimension = models.CharField(max_length=10, choices=DIMENSIONES)
+    dia = models.DateField()
+    clave = models.IntegerField(default=0)
+    solicitudes = models.IntegerField(default=0)
+    aprobaciones = models.IntegerField(default=0)
+    rechazos = models.IntegerField(default=0)
+    vencimientos = models.IntegerField(default=0)
+    devoluciones = models.IntegerField(default=0)
+    devoluciones_tardias = models.IntegerField(default=0)
+    # Suma de la duración (aprobación a devolución) de los préstamos devueltos.
+    segundos_prestados = models.BigIntegerField(default=0)
+
+    __sa_columns__ = [
+        Column('dimension', String(10)),
+        Column('dia', Date),
+        Column('clave', Integer),
+        Column('solicitudes', Integer),
+        Column('aprobaciones', Integer),
+        Column('rechazos', Integer),
+        Column('vencimientos', Integer),
+        Column('devoluciones', Integer),
+        Column('devoluciones_tardias', Integer),
+        Column('segundos_prestados', BigInteger),
+    ]
+
+    class Meta:
+        db_table = 'prestamos_circulacion'
+        verbose_name = 'Resumen de circulación'
+        verbose_name_plural = 'Resúmenes de circulación'
+        constraints = [
+            # También sirve a las consultas por rango de días de cada dimensión.
+            models.UniqueConstraint(fields=['dimension', 'dia', 'clave'], name='prestamos_circulacion_unico'),
+        ]
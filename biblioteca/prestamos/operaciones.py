@@ -0,0 +1,185 @@
+"""
+Operaciones de circulación en lote.
+
+Cada operación valida los préstamos recibidos, aplica los cambios de estado y
+de inventario con UPDATEs por conjunto dentro de una sola transacción y escribe
+el historial en un único lote. Devuelve los IDs que se procesaron y, para los
+que no, el motivo.
+"""
+from collections import Counter
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Q, Case, When, Value, IntegerField
+from django.utils import timezone
+from historial.models import Historial
+from libros.models import Libro
+from . import circulacion
+from .models import Prestamo
+
+CONFLICTO = 'Otro usuario modificó el préstamo; inténtalo de nuevo.'
+
+
+class ResultadoLote:
+    def __init__(self):
+        self.exitosos = []
+        self.fallidos = {}
+
+    def fallar(self, prestamo_id, motivo):
+        self.fallidos[prestamo_id] = motivo
+
+    def como_dict(self):
+        return {
+            'exitosos': self.exitosos,
+            'fallidos': {str(prestamo_id): motivo for prestamo_id, motivo in self.fallidos.items()},
+        }
+
+
+def _cargar(ids, estados_validos, resultado):
+    """Devuelve los préstamos en un estado válido y registra el resto como fallidos."""
+    prestamos = Prestamo.objects.filter(id__in=ids).select_related('libro').only(
+        'id', 'estado', 'fecha_solicitud', 'libro__id', 'libro__titulo', 'libro__cantidad_total'
+    ).order_by('fecha_solicitud', 'id')
+    encontrados = {prestamo.id: prestamo for prestamo in prestamos}
+    validos = []
+    for prestamo_id in ids:
+        prestamo = encontrados.get(prestamo_id)
+        if prestamo is None:
+            resultado.fallar(prestamo_id, 'El préstamo no existe.')
+        elif prestamo.estado not in estados_validos:
+            resultado.fallar(prestamo_id, f'El préstamo está {prestamo.get_estado_display().lower()}.')
+        else:
+            validos.append(prestamo)
+    return validos
+
+
+def _ajustar_inventario(cantidades, signo):
+    """
+    Suma (signo=1) o resta (signo=-1) ejemplares a varios libros con un solo
+    UPDATE. Al restar, sólo toca los libros que aún tienen suficientes
+    ejemplares; devuelve cuántos libros se actualizaron.
+    """
+    if not cantidades:
+        return 0
+    delta = Case(
+        *[When(id=libro_id, then=Value(cantidad)) for libro_id, cantidad in cantidades.items()],
+        output_field=IntegerField(),
+    )
+    libros = Libro.objects.filter(id__in=cantidades)
+    if signo < 0:
+        suficientes = Q()
+        for libro_id, cantidad in cantidades.items():
+            suficientes |= Q(id=libro_id, cantidad_total__gte=cantidad)
+        libros = libros.filter(suficientes)
+        return libros.update(
+            cantidad_total=F('cantidad_total') - delta,
+            estado=Case(
+                When(cantidad_total__lte=delta, then=Value('NO_DISPONIBLE')),
+                default=Value('DISPONIBLE'),
+            ),
+        )
+    return libros.update(cantidad_total=F('cantidad_total') + delta, estado='DISPONIBLE')
+
+
+def aprobar_en_lote(ids, administrador):
+    resultado = ResultadoLote()
+    ahora = timezone.now()
+    with transaction.atomic():
+        pendientes = _cargar(ids, ['PENDIENTE'], resultado)
+
+        # Se atienden primero las solicitudes más antiguas de cada libro.
+        disponibles = {prestamo.libro_id: prestamo.libro.cantidad_total for prestamo in pendientes}
+        aprobados = []
+        for prestamo in pendientes:
+            if disponibles[prestamo.libro_id] > 0:
+                disponibles[prestamo.libro_id] -= 1
+                aprobados.append(prestamo)
+            else:
+                resultado.fallar(prestamo.id, 'No quedan ejemplares disponibles.')
+
+        cantidades = Counter(prestamo.libro_id for prestamo in aprobados)
+        ids_aprobados = [prestamo.id for prestamo in aprobados]
+        if (_ajustar_inventario(cantidades, -1) != len(cantidades) or
+                Prestamo.objects.filter(id__in=ids_aprobados, estado='PENDIENTE').update(
+                    estado='APROBADO',
+                    aprobado_por=administrador,
+                    fecha_aprobacion=ahora,
+                    fecha_devolucion_esperada=ahora + timedelta(days=15),
+                ) != len(aprobados)):
+            transaction.set_rollback(True)
+            for prestamo in aprobados:
+                resultado.fallar(prestamo.id, CONFLICTO)
+            return resultado
+        circulacion.registrar('APROBACION', ids_aprobados)
+
+        Historial.registrar_lote([
+            Historial(
+                usuario=administrador, tipo_entidad='PRESTAMO', tipo_accion='CAMBIO_ESTADO',
+                entidad_id=prestamo.id, detalles=f'Aprobado préstamo para {prestamo.libro.titulo}',
+                estado_anterior='PENDIENTE', estado_nuevo='APROBADO',
+            )
+            for prestamo in aprobados
+        ])
+    resultado.exitosos = ids_aprobados
+    return resultado
+
+
+def rechazar_en_lote(ids, administrador, motivo):
+    resultado = ResultadoLote()
+    with transaction.atomic():
+        pendientes = _cargar(ids, ['PENDIENTE'], resultado)
+        ids_rechazados = [prestamo.id for prestamo in pendientes]
+        if Prestamo.objects.filter(id__in=ids_rechazados, estado='PENDIENTE').update(
+            estado='RECHAZADO', aprobado_por=administrador, notas=motivo,
+        ) != len(pendientes):
+            transaction.set_rollback(True)
+            for prestamo in pendientes:
+                resultado.fallar(prestamo.id, CONFLICTO)
+            return resultado
+        circulacion.registrar('RECHAZO', ids_rechazados)
+
+        Historial.registrar_lote([
+            Historial(
+                usuario=administrador, tipo_entidad='PRESTAMO', tipo_accion='CAMBIO_ESTADO',
+                entidad_id=prestamo.id, detalles=f'Rechazado préstamo para {prestamo.libro.titulo} ({motivo})',
+                estado_anterior='PENDIENTE', estado_nuevo='RECHAZADO',
+            )
+            for prestamo in pendientes
+        ])
+    resultado.exitosos = ids_rechazados
+    return resultado
+
+
+def devolver_en_lote(ids, administrador):
+    resultado = ResultadoLote()
+    with transaction.atomic():
+        activos = _cargar(ids, ['APROBADO', 'VENCIDO'], resultado)
+        ids_devueltos = [prestamo.id for prestamo in activos]
+        if Prestamo.objects.filter(id__in=ids_devueltos, estado__in=['APROBADO', 'VENCIDO']).update(
+            estado='DEVUELTO', fecha_devolucion_real=timezone.now(),
+        ) != len(activos):
+            transaction.set_rollback(True)
+            for prestamo in activos:
+                resultado.fallar(prestamo.id, CONFLICTO)
+            return resultado
+        _ajustar_inventario(Counter(prestamo.libro_id for prestamo in activos), 1)
+        circulacion.registrar('DEVOLUCION', ids_devueltos)
+        # Los aún APROBADO que se devuelven con retraso cuentan también como vencidos.
+        circulacion.registrar('VENCIMIENTO', [prestamo.id for prestamo in activos if prestamo.estado == 'APROBADO'])
+
+        Historial.registrar_lote([
+            Historial(
+                usuario=administrador, tipo_entidad='PRESTAMO', tipo_accion='CAMBIO_ESTADO',
+                entidad_id=prestamo.id, detalles=f'Devuelto préstamo para {prestamo.libro.titulo}',
+                estado_anterior=prestamo.estado, estado_nuevo='DEVUELTO',
+            )
+            for prestamo in activos
+        ])
+    resultado.exitosos = ids_devueltos
+    return resultado
+
+
+OPERACIONES = {
+    'aprobar': aprobar_en_lote,
+    'rechazar': rechazar_en_lote,
+    'devolver': devolver_en_lote,
+}
@@ -1,3 +1,570 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+from pathlib import Path
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Sum
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+from biblioteca.metricas import agregar_procesos
+from biblioteca.pruebas import PlanDeConsultaMixin
+from historial.models import Historial
+from libros.models import Categoria, Libro
+from usuarios.models import Usuario
+from .archivo import archivar_cerrados, limite_de_archivo
+from .circulacion import CONTADORES, reconstruir
+from .models import Prestamo, PrestamoArchivado, ResumenCirculacion
+from .operaciones import aprobar_en_lote, devolver_en_lote, rechazar_en_lote
+from .vencimientos import marcar_vencidos
+from .views import TABLAS_PRESTAMOS
 
-# Create your tests here.
+
+class PlanDeConsultaPrestamosTests(PlanDeConsultaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cliente = Usuario.objects.create_user('lector', password='clave', rol='CLIENTE')
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        cls.libros = [
+            Libro.objects.create(
+                titulo=f'Libro {i}', autor='Autor', editorial='Editorial',
+                año_publicacion=2000, descripcion='', cantidad_total=5,
+            )
+            for i in range(10)
+        ]
+        for libro in cls.libros:
+            prestamo = Prestamo.objects.create(usuario=cls.cliente, libro=libro)
+            Historial.objects.create(
+                usuario=cls.cliente, tipo_entidad='PRESTAMO', tipo_accion='CREACION',
+                entidad_id=prestamo.id, detalles='Solicitud',
+            )
+        for prestamo in Prestamo.objects.all()[:5]:
+            prestamo.aprobar(cls.admin)
+        cls.prestamo = Prestamo.objects.first()
+
+    def test_lista_prestamos(self):
+        self.client.force_login(self.admin)
+        self.assertSinEscaneoCompleto(reverse('prestamos:lista_prestamos'))
+
+    def test_detalle_prestamo(self):
+        self.client.force_login(self.admin)
+        self.assertSinEscaneoCompleto(reverse('prestamos:detalle_prestamo', args=[self.prestamo.id]))
+
+    def test_solicitar_prestamo(self):
+        otro = Usuario.objects.create_user('otro', password='clave', rol='CLIENTE')
+        self.client.force_login(otro)
+        self.assertSinEscaneoCompleto(reverse('prestamos:solicitar_prestamo', args=[self.libros[0].id]))
+
+    def test_mis_prestamos(self):
+        self.client.force_login(self.cliente)
+        self.assertSinEscaneoCompleto(reverse('prestamos:mis_prestamos'))
+
+    def test_mis_prestamos_sin_n_mas_uno(self):
+        self.client.force_login(self.cliente)
+        url = reverse('prestamos:mis_prestamos')
+        with CaptureQueriesContext(connection) as con_diez:
+            self.assertEqual(len(self.client.get(url).context['prestamos']), 10)
+        Prestamo.objects.filter(libro__in=self.libros[1:]).delete()
+        with CaptureQueriesContext(connection) as con_uno:
+            self.assertEqual(len(self.client.get(url).context['prestamos']), 1)
+        self.assertEqual(len(con_diez), len(con_uno))
+
+    def test_cliente_historial_prestamos(self):
+        self.client.force_login(self.cliente)
+        self.assertSinEscaneoCompleto(reverse('prestamos:cliente_historial_prestamos'))
+
+    def test_estadisticas(self):
+        self.client.force_login(self.admin)
+        self.assertSinEscaneoCompleto(reverse('prestamos:estadisticas') + '?dias=365')
+
+    def test_metricas(self):
+        self.assertSinEscaneoCompleto(reverse('metricas'))
+
+    def test_historial_cliente_paginado_por_cursor(self):
+        Prestamo.objects.filter(libro=self.libros[0]).delete()
+        self.client.force_login(self.cliente)
+        url = reverse('prestamos:cliente_historial_prestamos')
+        titulos = []
+        siguiente = '?por_pagina=4'
+        while siguiente:
+            # Sesión, usuario y página, sin COUNT: no depende del número de registros.
+            with self.assertNumQueries(3):
+                respuesta = self.client.get(url + siguiente)
+            titulos += [registro.libro_titulo for registro in respuesta.context['registros']]
+            siguiente = respuesta.context['url_siguiente']
+        self.assertEqual(titulos, [f'Libro {i}' for i in range(9, 0, -1)])
+
+
+@override_settings(METRICAS_DIRECTORIO=None)
+class MetricasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cliente = Usuario.objects.create_user('lector', password='clave', rol='CLIENTE')
+        libro = Libro.objects.create(
+            titulo='Libro', autor='Autor', editorial='Editorial', año_publicacion=2000, descripcion='', cantidad_total=3,
+        )
+        Prestamo.objects.create(usuario=cls.cliente, libro=libro)
+        Prestamo.objects.create(usuario=cls.cliente, libro=libro)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_exposicion(self):
+        self.client.force_login(self.cliente)
+        self.client.get(reverse('libros:lista'))
+        contenido = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('biblioteca_prestamos_pendientes 2', contenido)
+        self.assertIn('biblioteca_titulos_disponibles 1', contenido)
+        self.assertIn('biblioteca_peticion_duracion_segundos_bucket{vista="libros:lista",metodo="GET",le="+Inf"}', contenido)
+        self.assertIn('biblioteca_plantilla_duracion_segundos_count{plantilla="libros/lista_libros.html"}', contenido)
+
+    def test_solo_acceso_local(self):
+        respuesta = self.client.get(reverse('metricas'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(respuesta.status_code, 403)
+
+    @override_settings(METRICAS_CABECERA_IP='HTTP_X_FORWARDED_FOR')
+    def test_ip_detras_de_proxy(self):
+        url = reverse('metricas')
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='1.2.3.4, 127.0.0.1').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='127.0.0.1, 10.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_descarta_procesos_terminados(self):
+        proceso = subprocess.Popen([sys.executable, '-c', ''])
+        proceso.wait()
+        instantanea = {'contadores': [['biblioteca_peticiones_total', [['vista', 'libros:lista']], 7]], 'histogramas': []}
+        with tempfile.TemporaryDirectory() as directorio, override_settings(METRICAS_DIRECTORIO=directorio):
+            terminado = Path(directorio) / f'{proceso.pid}.json'
+            terminado.write_text(json.dumps(instantanea))
+            contadores, _ = agregar_procesos()
+            self.assertFalse(terminado.exists())
+            self.assertTrue((Path(directorio) / f'{os.getpid()}.json').exists())
+        self.assertNotIn(('biblioteca_peticiones_total', (('vista', 'libros:lista'),)), contadores)
+
+
+class ArchivoPrestamosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cliente = Usuario.objects.create_user('lector', password='clave', rol='CLIENTE')
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        cls.libro = Libro.objects.create(
+            titulo='Libro', autor='Autor', editorial='Editorial', año_publicacion=2000, descripcion='', cantidad_total=5,
+        )
+        hace_un_año = timezone.now() - datetime.timedelta(days=365)
+        cls.viejo = Prestamo.objects.create(usuario=cls.cliente, libro=cls.libro)
+        Prestamo.objects.filter(id=cls.viejo.id).update(
+            estado='DEVUELTO', fecha_solicitud=hace_un_año, fecha_devolucion_real=hace_un_año,
+        )
+        cls.rechazado = Prestamo.objects.create(usuario=cls.cliente, libro=cls.libro, estado='RECHAZADO')
+        Prestamo.objects.filter(id=cls.rechazado.id).update(fecha_solicitud=hace_un_año)
+        cls.reciente = Prestamo.objects.create(
+            usuario=cls.cliente, libro=cls.libro, estado='DEVUELTO', fecha_devolucion_real=timezone.now(),
+        )
+        cls.activo = Prestamo.objects.create(usuario=cls.cliente, libro=cls.libro, estado='APROBADO')
+        Prestamo.objects.filter(id=cls.activo.id).update(fecha_solicitud=hace_un_año)
+        for prestamo in (cls.viejo, cls.reciente):
+            Historial.objects.create(
+                usuario=cls.cliente, tipo_entidad='PRESTAMO', tipo_accion='CREACION',
+                entidad_id=prestamo.id, detalles='Solicitud',
+            )
+
+    def archivar(self):
+        return archivar_cerrados(limite_de_archivo(180), tamano_lote=1)
+
+    def test_solo_mueve_cerrados_antiguos(self):
+        self.assertEqual(self.archivar(), 2)
+        self.assertEqual(set(Prestamo.objects.values_list('id', flat=True)), {self.reciente.id, self.activo.id})
+        archivado = PrestamoArchivado.objects.get(id=self.viejo.id)
+        self.assertEqual(archivado.estado, 'DEVUELTO')
+        self.assertEqual(archivado.libro, self.libro)
+        self.assertIsNotNone(archivado.fecha_archivado)
+        self.assertTrue(PrestamoArchivado.objects.filter(id=self.rechazado.id, estado='RECHAZADO').exists())
+        self.assertEqual(self.archivar(), 0)
+
+    def test_comando_simular(self):
+        salida = StringIO()
+        call_command('archivar_prestamos', '--simular', stdout=salida)
+        self.assertIn('2 préstamos cerrados', salida.getvalue())
+        self.assertEqual(Prestamo.objects.count(), 4)
+
+    def test_detalle_de_prestamo_archivado(self):
+        self.archivar()
+        self.client.force_login(self.cliente)
+        respuesta = self.client.get(reverse('prestamos:detalle_prestamo', args=[self.viejo.id]))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['prestamo'].id, self.viejo.id)
+        respuesta = self.client.get(reverse('prestamos:detalle_prestamo', args=[self.activo.id + 100]))
+        self.assertEqual(respuesta.status_code, 404)
+
+    def test_historial_resuelve_prestamos_archivados(self):
+        self.archivar()
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('historial:lista_historial'))
+        prestamos = {registro['entidad_id']: registro['prestamo'] for registro in respuesta.context['registros']}
+        self.assertIsInstance(prestamos[self.viejo.id], PrestamoArchivado)
+        self.assertIsInstance(prestamos[self.reciente.id], Prestamo)
+
+        self.client.force_login(self.cliente)
+        respuesta = self.client.get(reverse('prestamos:cliente_historial_prestamos'))
+        self.assertEqual([registro.libro_titulo for registro in respuesta.context['registros']], ['Libro', 'Libro'])
+
+
+class CirculacionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.clientes = [Usuario.objects.create_user(f'lector{i}', password='clave', rol='CLIENTE') for i in range(2)]
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        cls.categoria = Categoria.objects.create(nombre='Novela')
+        cls.libros = [
+            Libro.objects.create(
+                titulo=f'Libro {i}', autor='Autor', editorial='Editorial', año_publicacion=2000,
+                descripcion='', cantidad_total=5, categoria=categoria,
+            )
+            for i, categoria in enumerate([cls.categoria, None, cls.categoria])
+        ]
+
+    def solicitar(self, cliente, libro):
+        self.client.force_login(cliente)
+        self.client.post(reverse('prestamos:solicitar_prestamo', args=[libro.id]))
+        return Prestamo.objects.get(usuario=cliente, libro=libro)
+
+    def vencer(self, prestamo):
+        Prestamo.objects.filter(id=prestamo.id).update(fecha_devolucion_esperada=timezone.now() - datetime.timedelta(days=2))
+
+    def resumenes(self):
+        return sorted(ResumenCirculacion.objects.values_list('dimension', 'dia', 'clave', *CONTADORES))
+
+    def test_cambios_de_estado_coinciden_con_reconstruccion(self):
+        devuelto = self.solicitar(self.clientes[0], self.libros[0])
+        self.assertTrue(devuelto.aprobar(self.admin))
+        self.assertTrue(devuelto.devolver())
+
+        marcado = self.solicitar(self.clientes[0], self.libros[1])
+        aprobar_en_lote([marcado.id], self.admin)
+        self.vencer(marcado)
+        self.assertEqual(marcar_vencidos(), 1)
+        devolver_en_lote([marcado.id], self.admin)
+
+        # Vence sin llegar a marcarse: cuenta como vencido al devolverlo.
+        tardio = self.solicitar(self.clientes[1], self.libros[0])
+        aprobar_en_lote([tardio.id], self.admin)
+        self.vencer(tardio)
+        self.assertTrue(Prestamo.objects.get(id=tardio.id).devolver())
+
+        self.assertTrue(self.solicitar(self.clientes[1], self.libros[1]).rechazar(self.admin, 'Motivo'))
+        rechazar_en_lote([self.solicitar(self.clientes[1], self.libros[2]).id], self.admin, 'Motivo')
+
+        totales = ResumenCirculacion.objects.filter(dimension='DIA').aggregate(
+            **{f'suma_{contador}': Sum(contador) for contador in CONTADORES}
+        )
+        self.assertEqual(
+            [totales[f'suma_{contador}'] for contador in CONTADORES[:-1]],
+            [5, 3, 2, 2, 3, 2],
+        )
+        categorias = dict(ResumenCirculacion.objects.filter(dimension='CATEGORIA').values_list('clave').annotate(Sum('solicitudes')))
+        self.assertEqual(categorias, {self.categoria.id: 3, 0: 2})
+
+        incremental = self.resumenes()
+        reconstruir()
+        self.assertEqual(self.resumenes(), incremental)
+
+    def test_estadisticas(self):
+        prestamo = self.solicitar(self.clientes[0], self.libros[0])
+        prestamo.aprobar(self.admin)
+        prestamo.devolver()
+
+        respuesta = self.client.get(reverse('prestamos:estadisticas'))
+        self.assertRedirects(respuesta, reverse('usuarios:perfil'), fetch_redirect_response=False)
+
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('prestamos:estadisticas') + '?dias=7')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['totales']['solicitudes'], 1)
+        self.assertEqual(respuesta.context['totales']['tasa_retraso'], 0)
+        self.assertEqual(respuesta.context['categorias'][0]['nombre'], 'Novela')
+        self.assertEqual(respuesta.context['usuarios'][0]['usuario'], self.clientes[0])
+
+        respuesta = self.client.get(reverse('prestamos:estadisticas') + '?dias=365')
+        self.assertEqual(respuesta.context['agrupacion'], 'MES')
+        self.assertEqual([fila['dia'] for fila in respuesta.context['dias']], [timezone.localdate().replace(day=1)])
+
+
+class InventarioTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cliente = Usuario.objects.create_user('lector', password='clave', rol='CLIENTE')
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        cls.libro = Libro.objects.create(
+            titulo='Libro', autor='Autor', editorial='Editorial', año_publicacion=2000, descripcion='', cantidad_total=1,
+        )
+
+    def existencias(self):
+        return Libro.objects.values_list('cantidad_total', 'estado').get(id=self.libro.id)
+
+    def test_prestar_y_devolver_ejemplar(self):
+        self.assertTrue(Libro.prestar_ejemplar(self.libro.id))
+        self.assertEqual(self.existencias(), (0, 'NO_DISPONIBLE'))
+        self.assertFalse(Libro.prestar_ejemplar(self.libro.id))
+        self.assertEqual(self.existencias(), (0, 'NO_DISPONIBLE'))
+        self.assertTrue(Libro.devolver_ejemplar(self.libro.id))
+        self.assertEqual(self.existencias(), (1, 'DISPONIBLE'))
+
+    def test_doble_aprobacion(self):
+        prestamo = Prestamo.objects.create(usuario=self.cliente, libro=self.libro)
+        obsoleto = Prestamo.objects.get(id=prestamo.id)
+        self.assertTrue(prestamo.aprobar(self.admin))
+        Libro.devolver_ejemplar(self.libro.id)
+        # Aunque vuelva a haber ejemplares, el segundo intento no descuenta otro.
+        self.assertFalse(obsoleto.aprobar(self.admin))
+        self.assertEqual(self.existencias(), (1, 'DISPONIBLE'))
+        self.assertEqual(ResumenCirculacion.objects.get(dimension='DIA').aprobaciones, 1)
+
+    def test_aprobar_sin_ejemplares(self):
+        Libro.objects.filter(id=self.libro.id).update(cantidad_total=0, estado='NO_DISPONIBLE')
+        prestamo = Prestamo.objects.create(usuario=self.cliente, libro=self.libro)
+        self.assertFalse(prestamo.aprobar(self.admin))
+        self.assertEqual(Prestamo.objects.get(id=prestamo.id).estado, 'PENDIENTE')
+        self.assertEqual(self.existencias(), (0, 'NO_DISPONIBLE'))
+
+    def test_rechazar_prestamo_ya_aprobado(self):
+        prestamo = Prestamo.objects.create(usuario=self.cliente, libro=self.libro)
+        obsoleto = Prestamo.objects.get(id=prestamo.id)
+        prestamo.aprobar(self.admin)
+        self.assertFalse(obsoleto.rechazar(self.admin, 'Motivo'))
+        self.assertEqual(Prestamo.objects.get(id=prestamo.id).estado, 'APROBADO')
+        self.assertEqual(self.existencias(), (0, 'NO_DISPONIBLE'))
+        self.assertEqual(ResumenCirculacion.objects.get(dimension='DIA').rechazos, 0)
+
+        self.client.force_login(self.admin)
+        respuesta = self.client.post(reverse('prestamos:rechazar_prestamo', args=[prestamo.id]), {'motivo': 'Motivo'})
+        self.assertRedirects(respuesta, reverse('prestamos:lista_prestamos'), fetch_redirect_response=False)
+        self.assertEqual(Prestamo.objects.get(id=prestamo.id).estado, 'APROBADO')
+
+    def test_doble_devolucion(self):
+        prestamo = Prestamo.objects.create(usuario=self.cliente, libro=self.libro)
+        prestamo.aprobar(self.admin)
+        obsoleto = Prestamo.objects.get(id=prestamo.id)
+        self.assertTrue(prestamo.devolver())
+        self.assertFalse(obsoleto.devolver())
+        self.assertEqual(self.existencias(), (1, 'DISPONIBLE'))
+
+
+class VencimientosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cliente = Usuario.objects.create_user('lector', password='clave', rol='CLIENTE')
+        cls.libro = Libro.objects.create(
+            titulo='Libro', autor='Autor', editorial='Editorial', año_publicacion=2000, descripcion='', cantidad_total=5,
+        )
+        ahora = timezone.now()
+        cls.vencidos = [
+            Prestamo.objects.create(
+                usuario=cls.cliente, libro=cls.libro, estado='APROBADO',
+                fecha_devolucion_esperada=ahora - datetime.timedelta(days=dias),
+            )
+            for dias in (1, 2, 3)
+        ]
+        cls.al_dia = Prestamo.objects.create(
+            usuario=cls.cliente, libro=cls.libro, estado='APROBADO',
+            fecha_devolucion_esperada=ahora + datetime.timedelta(days=1),
+        )
+        cls.pendiente = Prestamo.objects.create(usuario=cls.cliente, libro=cls.libro)
+
+    def estados(self):
+        return dict(Prestamo.objects.values_list('id', 'estado'))
+
+    def test_marcar_vencidos_por_lotes(self):
+        self.assertEqual(marcar_vencidos(tamano_lote=2), 3)
+        estados = self.estados()
+        self.assertEqual({estados[prestamo.id] for prestamo in self.vencidos}, {'VENCIDO'})
+        self.assertEqual(estados[self.al_dia.id], 'APROBADO')
+        self.assertEqual(estados[self.pendiente.id], 'PENDIENTE')
+        self.assertEqual(
+            set(Historial.objects.filter(estado_nuevo='VENCIDO').values_list('entidad_id', flat=True)),
+            {prestamo.id for prestamo in self.vencidos},
+        )
+        # Volver a ejecutarlo no repite el marcado ni el historial.
+        self.assertEqual(marcar_vencidos(), 0)
+        self.assertEqual(Historial.objects.filter(estado_nuevo='VENCIDO').count(), 3)
+
+    def test_comando(self):
+        salida = StringIO()
+        call_command('marcar_prestamos_vencidos', '--lote', '1', stdout=salida)
+        self.assertIn('3 préstamos marcados como vencidos', salida.getvalue())
+        self.assertEqual(list(self.estados().values()).count('VENCIDO'), 3)
+
+    def test_no_se_solicita_de_nuevo_un_libro_vencido(self):
+        Prestamo.objects.exclude(id=self.vencidos[0].id).delete()
+        marcar_vencidos()
+        self.client.force_login(self.cliente)
+        respuesta = self.client.post(reverse('prestamos:solicitar_prestamo', args=[self.libro.id]))
+        self.assertRedirects(respuesta, reverse('libros:lista'), fetch_redirect_response=False)
+        self.assertEqual(Prestamo.objects.count(), 1)
+
+
+class ListaPrestamosTests(PlanDeConsultaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        cliente = Usuario.objects.create_user('lector', password='clave', rol='CLIENTE')
+        libro = Libro.objects.create(
+            titulo='Libro', autor='Autor', editorial='Editorial', año_publicacion=2000, descripcion='', cantidad_total=5,
+        )
+        inicio = timezone.make_aware(datetime.datetime(2026, 1, 1, 12))
+        cls.activos = []
+        for dia in range(6):
+            fecha = inicio + datetime.timedelta(days=dia)
+            cls.activos.append(Prestamo.objects.create(
+                usuario=cliente, libro=libro, estado='VENCIDO' if dia == 0 else 'APROBADO',
+                fecha_aprobacion=fecha, fecha_devolucion_esperada=fecha + datetime.timedelta(days=15 - 2 * dia),
+            ))
+        cls.pendientes = [Prestamo.objects.create(usuario=cliente, libro=libro) for _ in range(3)]
+        Prestamo.objects.create(usuario=cliente, libro=libro, estado='DEVUELTO', fecha_aprobacion=inicio)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def recorrer(self, tabla, **parametros):
+        """Ids de todas las páginas de una tabla siguiendo los enlaces de esa tabla."""
+        url = reverse('prestamos:lista_prestamos')
+        siguiente = '?' + urlencode({f'{tabla}_{clave}': valor for clave, valor in parametros.items()})
+        ids = []
+        while siguiente:
+            contexto = self.client.get(url + siguiente).context[tabla]
+            ids += [prestamo.id for prestamo in contexto['prestamos']]
+            siguiente = contexto['url_siguiente']
+        return ids
+
+    def test_ordenamientos(self):
+        self.assertEqual(self.recorrer('activos', por_pagina=4), [p.id for p in reversed(self.activos)])
+        self.assertEqual(self.recorrer('activos', por_pagina=4, orden='fecha_aprobacion'), [p.id for p in self.activos])
+        self.assertEqual(
+            self.recorrer('activos', por_pagina=4, orden='fecha_devolucion_esperada'),
+            [p.id for p in reversed(self.activos)],
+        )
+        # Un orden desconocido usa el primero de la tabla.
+        self.assertEqual(self.recorrer('activos', orden='notas'), [p.id for p in reversed(self.activos)])
+        self.assertEqual(self.recorrer('pendientes', por_pagina=2), [p.id for p in self.pendientes])
+
+    def test_filtro_por_fecha(self):
+        self.assertEqual(
+            self.recorrer('activos', desde='2026-01-02', hasta='2026-01-03', orden='fecha_aprobacion'),
+            [self.activos[1].id, self.activos[2].id],
+        )
+        self.assertEqual(len(self.recorrer('activos', desde='no-es-fecha')), 6)
+
+    def test_cursores_independientes_por_tabla(self):
+        url = reverse('prestamos:lista_prestamos')
+        respuesta = self.client.get(url + '?activos_por_pagina=2&pendientes_por_pagina=2')
+        siguiente = respuesta.context['activos']['url_siguiente']
+        self.assertIn('pestana=activos', siguiente)
+        respuesta = self.client.get(url + siguiente)
+        self.assertEqual([p.id for p in respuesta.context['activos']['prestamos']], [self.activos[3].id, self.activos[2].id])
+        # La tabla de pendientes sigue en su primera página.
+        self.assertEqual([p.id for p in respuesta.context['pendientes']['prestamos']], [p.id for p in self.pendientes[:2]])
+        self.assertIsNone(respuesta.context['pendientes']['url_anterior'])
+
+    def test_pagina_anterior(self):
+        url = reverse('prestamos:lista_prestamos')
+        primera = self.client.get(url + '?activos_por_pagina=2').context['activos']
+        segunda = self.client.get(url + primera['url_siguiente']).context['activos']
+        tercera = self.client.get(url + segunda['url_siguiente']).context['activos']
+        # La tercera página mezcla el préstamo vencido con los aprobados.
+        self.assertEqual([p.id for p in tercera['prestamos']], [self.activos[1].id, self.activos[0].id])
+        anterior = self.client.get(url + tercera['url_anterior']).context['activos']
+        self.assertEqual([p.id for p in anterior['prestamos']], [p.id for p in segunda['prestamos']])
+        anterior = self.client.get(url + anterior['url_anterior']).context['activos']
+        self.assertEqual([p.id for p in anterior['prestamos']], [p.id for p in primera['prestamos']])
+        self.assertIsNone(anterior['url_anterior'])
+
+    def test_orden_por_indice(self):
+        url = reverse('prestamos:lista_prestamos')
+        for tabla, configuracion in TABLAS_PRESTAMOS.items():
+            for orden in configuracion['ordenes']:
+                parametros = f'?{tabla}_por_pagina=2&{tabla}_orden={orden}'
+                siguiente = self.client.get(url + parametros).context[tabla]['url_siguiente']
+                for consulta in (parametros, siguiente):
+                    with CaptureQueriesContext(connection) as consultas:
+                        self.client.get(url + consulta)
+                    for capturada in consultas.captured_queries:
+                        if capturada['sql'].startswith('SELECT') and 'FROM "prestamos"' in capturada['sql']:
+                            plan = self.plan_de_consulta(capturada['sql'])
+                            self.assertFalse([paso for paso in plan if 'TEMP B-TREE' in paso], f'{consulta}: {plan}')
+
+
+class OperacionesEnLoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        cls.cliente = Usuario.objects.create_user('lector', password='clave', rol='CLIENTE')
+        cls.libro = Libro.objects.create(
+            titulo='Libro', autor='Autor', editorial='Editorial', año_publicacion=2000, descripcion='', cantidad_total=2,
+        )
+        cls.prestamos = [Prestamo.objects.create(usuario=cls.cliente, libro=cls.libro) for _ in range(3)]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def operar(self, accion, ids, **extra):
+        return self.client.post(
+            reverse('prestamos:operar_en_lote'), {'accion': accion, 'prestamos': ids, **extra},
+            HTTP_ACCEPT='application/json',
+        )
+
+    def pendientes(self):
+        return Prestamo.objects.filter(estado='PENDIENTE').count()
+
+    def test_aprobar_informa_cada_fallo(self):
+        ids = [prestamo.id for prestamo in self.prestamos]
+        respuesta = self.operar('aprobar', ids + [ids[0], 9999])
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        # Sólo hay dos ejemplares: se atienden las dos solicitudes más antiguas.
+        self.assertEqual(datos['exitosos'], ids[:2])
+        self.assertEqual(set(datos['fallidos']), {str(ids[2]), '9999'})
+        self.assertEqual(Libro.objects.get(id=self.libro.id).cantidad_total, 0)
+
+        datos = self.operar('devolver', ids).json()
+        self.assertEqual(datos['exitosos'], ids[:2])
+        self.assertEqual(list(datos['fallidos']), [str(ids[2])])
+
+    def test_identificadores_no_validos(self):
+        respuesta = self.operar('rechazar', [self.prestamos[0].id, 'abc'])
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('no válidos', respuesta.json()['error'])
+        self.assertEqual(self.pendientes(), 3)
+
+    @override_settings(PRESTAMOS_LOTE_MAXIMO=2)
+    def test_lote_demasiado_grande(self):
+        respuesta = self.operar('rechazar', [prestamo.id for prestamo in self.prestamos])
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('como máximo 2', respuesta.json()['error'])
+        self.assertEqual(self.pendientes(), 3)
+
+    def test_accion_no_valida(self):
+        self.assertEqual(self.operar('borrar', [self.prestamos[0].id]).status_code, 400)
+        self.assertEqual(self.operar('aprobar', []).status_code, 400)
+
+    def test_formulario(self):
+        respuesta = self.client.post(
+            reverse('prestamos:operar_en_lote'),
+            {'accion': 'rechazar', 'prestamos': [self.prestamos[0].id], 'motivo': 'Duplicado'},
+        )
+        self.assertRedirects(respuesta, reverse('prestamos:lista_prestamos') + '?pestana=pendientes', fetch_redirect_response=False)
+        self.assertEqual(Prestamo.objects.get(id=self.prestamos[0].id).notas, 'Duplicado')
+
+        respuesta = self.client.post(reverse('prestamos:operar_en_lote'), {'accion': 'rechazar', 'prestamos': ['x']})
+        self.assertRedirects(respuesta, reverse('prestamos:lista_prestamos'), fetch_redirect_response=False)
+        self.assertEqual(self.pendientes(), 2)
+
+    def test_solo_administradores(self):
+        self.client.force_login(self.cliente)
+        self.assertEqual(self.operar('aprobar', [self.prestamos[0].id]).status_code, 403)
@@ -5,6 +5,7 @@ app_name = 'prestamos'
 
 urlpatterns = [
     path('', views.lista_prestamos, name='lista_prestamos'),
+    path('lote/', views.operar_prestamos_en_lote, name='operar_en_lote'),
     path('<int:prestamo_id>/', views.detalle_prestamo, name='detalle_prestamo'),
     path('solicitar/<int:libro_id>/', views.solicitar_prestamo, name='solicitar_prestamo'),
     path('<int:prestamo_id>/aprobar/', views.aprobar_prestamo, name='aprobar_prestamo'),
@@ -12,4 +13,5 @@ urlpatterns = [
     path('<int:prestamo_id>/devolver/', views.devolver_prestamo, name='devolver_prestamo'),
     path('mis-prestamos/', views.mis_prestamos, name='mis_prestamos'),
     path('historial-prestamos/', views.cliente_historial_prestamos, name='cliente_historial_prestamos'),
+    path('estadisticas/', views.estadisticas_circulacion, name='estadisticas'),
 ]
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""
+Marcado masivo de préstamos vencidos.
+
+Los préstamos APROBADO cuya fecha de devolución esperada ya pasó se mueven a
+VENCIDO con un UPDATE por lote y sus registros de historial se insertan con un
+único bulk_create por lote. Cada lote es una transacción corta, así que puede
+ejecutarse mientras se atienden peticiones, y volver a ejecutarlo no tiene
+efecto sobre los préstamos ya marcados.
+"""
+import logging
+import threading
+from django.db import connections, transaction
+from django.utils import timezone
+from historial.models import Historial
+from . import circulacion
+from .models import Prestamo
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 2000
+
+
+def marcar_vencidos(ahora=None, tamano_lote=TAMANO_LOTE):
+    """Devuelve el número de préstamos marcados como VENCIDO."""
+    ahora = ahora or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            candidatos = dict(
+                Prestamo.objects.filter(estado='APROBADO', fecha_devolucion_esperada__lt=ahora)
+                .values_list('id', 'libro__titulo')[:tamano_lote]
+            )
+            if not candidatos:
+                break
+            marcados = Prestamo.objects.filter(id__in=candidatos, estado='APROBADO').update(estado='VENCIDO')
+            if marcados != len(candidatos):
+                # Alguno se devolvió entre la lectura y el UPDATE; ya tenemos el
+                # bloqueo de escritura, así que esta lectura es definitiva.
+                ids = set(Prestamo.objects.filter(id__in=candidatos, estado='VENCIDO').values_list('id', flat=True))
+                candidatos = {id: titulo for id, titulo in candidatos.items() if id in ids}
+            circulacion.registrar('VENCIMIENTO', list(candidatos))
+            Historial.objects.bulk_create([
+                Historial(
+                    fecha=ahora,
+                    usuario=None,
+                    tipo_entidad='PRESTAMO',
+                    tipo_accion='CAMBIO_ESTADO',
+                    entidad_id=prestamo_id,
+                    detalles=f'Vencido préstamo para {titulo}',
+                    estado_anterior='APROBADO',
+                    estado_nuevo='VENCIDO',
+                )
+                for prestamo_id, titulo in candidatos.items()
+            ], batch_size=500)
+        total += marcados
+    return total
+
+
+class TareaVencimientos(threading.Thread):
+    """Ejecuta marcar_vencidos cada `intervalo` segundos dentro del proceso."""
+
+    def __init__(self, intervalo):
+        super().__init__(name='marcar-vencidos', daemon=True)
+        self.intervalo = intervalo
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                marcados = marcar_vencidos()
+                if marcados:
+                    logger.info('Marcados %s préstamos como vencidos', marcados)
+            except Exception:
+                logger.exception('Falló el marcado de préstamos vencidos')
+            finally:
+                connections.close_all()
+
+    def detener(self):
+        self._detener.set()
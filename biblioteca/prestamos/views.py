@@ -1,35 +1,170 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.core.paginator import Paginator
-from .models import Prestamo
+from django.db.models import Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.conf import settings
+from django.utils.dateparse import parse_date
+from datetime import datetime, time, timedelta
+from biblioteca.paginacion import paginar_por_cursor, paginar_por_cursor_en_partes, tamano_de_pagina
+from biblioteca.transacciones import transaccion_por_peticion
+from . import circulacion
+from .archivo import buscar_prestamo
+from .models import Prestamo, PrestamoArchivado
 from .forms import PrestamoForm
-from libros.models import Libro
+from .operaciones import OPERACIONES
+from libros.models import Categoria, Libro
+from usuarios.models import Usuario
 from historial.models import Historial
 
+# Columnas que muestra lista_prestamos.html
+COLUMNAS_LISTA = (
+    'id', 'estado', 'fecha_solicitud', 'fecha_aprobacion', 'fecha_devolucion_esperada',
+    'libro__id', 'libro__titulo', 'usuario__id', 'usuario__username',
+)
+
+# Para cada tabla: estados, campo de fecha filtrable y ordenamientos permitidos
+TABLAS_PRESTAMOS = {
+    'activos': {
+        'estados': ['APROBADO', 'VENCIDO'],
+        'campo_fecha': 'fecha_aprobacion',
+        'ordenes': {
+            '-fecha_aprobacion': 'Aprobación (recientes primero)',
+            'fecha_aprobacion': 'Aprobación (antiguos primero)',
+            'fecha_devolucion_esperada': 'Devolución esperada (próximos primero)',
+            '-fecha_devolucion_esperada': 'Devolución esperada (lejanos primero)',
+        },
+    },
+    'pendientes': {
+        'estados': ['PENDIENTE'],
+        'campo_fecha': 'fecha_solicitud',
+        'ordenes': {
+            'fecha_solicitud': 'Solicitud (antiguas primero)',
+            '-fecha_solicitud': 'Solicitud (recientes primero)',
+        },
+    },
+}
+
+def _inicio_del_dia(texto):
+    try:
+        fecha = parse_date(texto or '')
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        return None
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+def tabla_prestamos(request, nombre):
+    """Filtra, ordena y pagina por cursor una de las tablas de lista_prestamos."""
+    tabla = TABLAS_PRESTAMOS[nombre]
+    prefijo = f'{nombre}_'
+    orden = request.GET.get(prefijo + 'orden')
+    if orden not in tabla['ordenes']:
+        orden = next(iter(tabla['ordenes']))
+
+    prestamos = Prestamo.objects.select_related('libro', 'usuario').only(*COLUMNAS_LISTA)
+
+    desde = _inicio_del_dia(request.GET.get(prefijo + 'desde'))
+    hasta = _inicio_del_dia(request.GET.get(prefijo + 'hasta'))
+    if desde:
+        prestamos = prestamos.filter(**{f"{tabla['campo_fecha']}__gte": desde})
+    if hasta:
+        prestamos = prestamos.filter(**{f"{tabla['campo_fecha']}__lt": hasta + timedelta(days=1)})
+
+    tamano = tamano_de_pagina(request, settings.PRESTAMOS_POR_PAGINA, settings.PRESTAMOS_POR_PAGINA_MAXIMO, prefijo)
+    # Una consulta por estado sobre su índice (estado, campo de orden, id); el
+    # desempate por id va en la misma dirección para que el índice dé el orden completo.
+    ordenamiento = (orden, '-id' if orden.startswith('-') else 'id')
+    pagina = paginar_por_cursor_en_partes(
+        [prestamos.filter(estado=estado) for estado in tabla['estados']], ordenamiento, request, tamano, prefijo,
+    )
+    url_anterior, url_siguiente = pagina.enlaces(request, pestana=nombre)
+    return {
+        'prestamos': pagina,
+        'orden': orden,
+        'ordenes': tabla['ordenes'].items(),
+        'desde': request.GET.get(prefijo + 'desde', ''),
+        'hasta': request.GET.get(prefijo + 'hasta', ''),
+        'url_anterior': url_anterior,
+        'url_siguiente': url_siguiente,
+    }
+
 @login_required
 def lista_prestamos(request):
     if not (request.user.is_admin or request.user.is_superadmin):
         messages.error(request, 'No tienes permisos para gestionar préstamos.')
         return redirect('libros:lista')
     
-    prestamos_activos = Prestamo.objects.filter(estado='APROBADO')
-    prestamos_pendientes = Prestamo.objects.filter(estado='PENDIENTE')
+    activos = tabla_prestamos(request, 'activos')
+    pendientes = tabla_prestamos(request, 'pendientes')
     return render(request, 'prestamos/lista_prestamos.html', {
-        'prestamos_activos': prestamos_activos,
-        'prestamos_pendientes': prestamos_pendientes
+        'activos': activos,
+        'pendientes': pendientes,
+        'prestamos_activos': activos['prestamos'],
+        'prestamos_pendientes': pendientes['prestamos'],
+        'pestana': 'pendientes' if request.GET.get('pestana') == 'pendientes' else 'activos',
     })
 
+@login_required
+@require_POST
+@transaccion_por_peticion
+def operar_prestamos_en_lote(request):
+    quiere_json = 'application/json' in request.headers.get('Accept', '')
+    if not (request.user.is_admin or request.user.is_superadmin):
+        if quiere_json:
+            return JsonResponse({'error': 'No tienes permisos para gestionar préstamos.'}, status=403)
+        messages.error(request, 'No tienes permisos para gestionar préstamos.')
+        return redirect('libros:lista')
+
+    accion = request.POST.get('accion')
+    # Un lote que no se puede procesar entero se rechaza entero: ningún id se
+    # descarta sin aparecer en la respuesta.
+    error = None
+    try:
+        ids = list(dict.fromkeys(int(valor) for valor in request.POST.getlist('prestamos')))
+    except ValueError:
+        ids = []
+        error = 'Hay identificadores de préstamo no válidos; no se procesó ninguno.'
+    if error is None and len(ids) > settings.PRESTAMOS_LOTE_MAXIMO:
+        error = f'Se pueden procesar como máximo {settings.PRESTAMOS_LOTE_MAXIMO} préstamos a la vez; no se procesó ninguno.'
+    if error is None and (accion not in OPERACIONES or not ids):
+        error = 'Selecciona al menos un préstamo y una acción válida.'
+
+    if error:
+        if quiere_json:
+            return JsonResponse({'error': error}, status=400)
+        messages.error(request, error)
+        return redirect('prestamos:lista_prestamos')
+
+    if accion == 'rechazar':
+        resultado = OPERACIONES[accion](ids, request.user, request.POST.get('motivo') or 'No especificado')
+    else:
+        resultado = OPERACIONES[accion](ids, request.user)
+
+    if quiere_json:
+        return JsonResponse(resultado.como_dict())
+
+    if resultado.exitosos:
+        messages.success(request, f'{len(resultado.exitosos)} préstamo(s) procesados: {", ".join(map(str, resultado.exitosos))}.')
+    for prestamo_id, motivo in resultado.fallidos.items():
+        messages.error(request, f'Préstamo #{prestamo_id}: {motivo}')
+    pestana = 'activos' if accion == 'devolver' else 'pendientes'
+    return redirect(f"{reverse('prestamos:lista_prestamos')}?pestana={pestana}")
+
 @login_required
 def detalle_prestamo(request, prestamo_id):
-    prestamo = get_object_or_404(Prestamo, id=prestamo_id)
+    prestamo = buscar_prestamo(prestamo_id)
     if not (request.user.is_admin or request.user.is_superadmin or request.user == prestamo.usuario):
         messages.error(request, 'No tienes permisos para ver este préstamo.')
         return redirect('libros:lista')
     return render(request, 'prestamos/detalle_prestamo.html', {'prestamo': prestamo})
 
 @login_required
+@transaccion_por_peticion
 def solicitar_prestamo(request, libro_id):
     libro = get_object_or_404(Libro, id=libro_id)
     if request.user.rol not in ['CLIENTE']:
@@ -40,7 +175,7 @@ def solicitar_prestamo(request, libro_id):
         messages.error(request, 'Este libro no está disponible para préstamo.')
         return redirect('libros:lista')
 
-    if Prestamo.objects.filter(usuario=request.user, libro=libro, estado__in=['PENDIENTE', 'APROBADO']).exists():
+    if Prestamo.objects.filter(usuario=request.user, libro=libro, estado__in=['PENDIENTE', 'APROBADO', 'VENCIDO']).exists():
         messages.error(request, 'Ya tienes un préstamo pendiente o activo para este libro.')
         return redirect('libros:lista')
 
@@ -54,6 +189,7 @@ def solicitar_prestamo(request, libro_id):
                 fecha_solicitud=timezone.now()
             )
             prestamo.save()
+            circulacion.registrar('SOLICITUD', [prestamo.id])
             Historial.registrar_cambio(request.user, 'PRESTAMO', 'CREACION', prestamo.id, f'Solicitud de préstamo para {libro.titulo}')
             messages.success(request, 'Solicitud de préstamo enviada exitosamente.')
             return redirect('prestamos:mis_prestamos')
@@ -63,6 +199,7 @@ def solicitar_prestamo(request, libro_id):
     return render(request, 'prestamos/solicitar_prestamo.html', {'form': form, 'libro': libro})
 
 @login_required
+@transaccion_por_peticion(incluir_get=True)
 def aprobar_prestamo(request, prestamo_id):
     if not (request.user.is_admin or request.user.is_superadmin):
         messages.error(request, 'No tienes permisos para aprobar préstamos.')
@@ -77,12 +214,15 @@ def aprobar_prestamo(request, prestamo_id):
         messages.error(request, 'No hay libros disponibles para aprobar este préstamo.')
         return redirect('prestamos:lista_prestamos')
 
-    prestamo.aprobar(administrador=request.user)
+    if not prestamo.aprobar(administrador=request.user):
+        messages.error(request, 'No se pudo aprobar el préstamo: ya no quedan ejemplares o ya fue resuelto.')
+        return redirect('prestamos:lista_prestamos')
     Historial.registrar_cambio(request.user, 'PRESTAMO', 'CAMBIO_ESTADO', prestamo.id, f'Aprobado préstamo para {prestamo.libro.titulo}', 'PENDIENTE', 'APROBADO')
     messages.success(request, 'Préstamo aprobado exitosamente.')
     return redirect('prestamos:lista_prestamos')
 
 @login_required
+@transaccion_por_peticion
 def rechazar_prestamo(request, prestamo_id):
     if not (request.user.is_admin or request.user.is_superadmin):
         messages.error(request, 'No tienes permisos para rechazar préstamos.')
@@ -95,7 +235,9 @@ def rechazar_prestamo(request, prestamo_id):
 
     if request.method == 'POST':
         motivo = request.POST.get('motivo', 'No especificado')
-        prestamo.rechazar(administrador=request.user, motivo=motivo)
+        if not prestamo.rechazar(administrador=request.user, motivo=motivo):
+            messages.error(request, 'No se pudo rechazar el préstamo: ya fue resuelto.')
+            return redirect('prestamos:lista_prestamos')
         Historial.registrar_cambio(request.user, 'PRESTAMO', 'CAMBIO_ESTADO', prestamo.id, f'Rechazado préstamo para {prestamo.libro.titulo} ({motivo})', 'PENDIENTE', 'RECHAZADO')
         messages.success(request, 'Préstamo rechazado exitosamente.')
         return redirect('prestamos:lista_prestamos')
@@ -103,25 +245,27 @@ def rechazar_prestamo(request, prestamo_id):
     return render(request, 'prestamos/rechazar_prestamo.html', {'prestamo': prestamo})
 
 @login_required
+@transaccion_por_peticion(incluir_get=True)
 def devolver_prestamo(request, prestamo_id):
     prestamo = get_object_or_404(Prestamo, id=prestamo_id)
     if not (request.user.is_admin or request.user.is_superadmin):
         messages.error(request, 'Solo los administradores pueden registrar devoluciones.')
         return redirect('libros:lista')
 
+    estado_anterior = prestamo.estado
     if prestamo.devolver():
-        Historial.registrar_cambio(request.user, 'PRESTAMO', 'CAMBIO_ESTADO', prestamo.id, f'Devuelto préstamo para {prestamo.libro.titulo}', 'APROBADO', 'DEVUELTO')
+        Historial.registrar_cambio(request.user, 'PRESTAMO', 'CAMBIO_ESTADO', prestamo.id, f'Devuelto préstamo para {prestamo.libro.titulo}', estado_anterior, 'DEVUELTO')
         messages.success(request, 'Préstamo devuelto exitosamente.')
     else:
-        messages.error(request, 'No se pudo devolver el préstamo. Asegúrate de que esté aprobado.')
+        messages.error(request, 'No se pudo devolver el préstamo. Asegúrate de que esté aprobado o vencido.')
     return redirect('prestamos:mis_prestamos')
 
 @login_required
 def mis_prestamos(request):
     prestamos = Prestamo.objects.filter(
         usuario=request.user,
-        estado__in=['PENDIENTE', 'APROBADO']
-    ).order_by('-fecha_solicitud')
+        estado__in=['PENDIENTE', 'APROBADO', 'VENCIDO']
+    ).select_related('libro').order_by('-fecha_solicitud')
     return render(request, 'prestamos/mis_prestamos.html', {'prestamos': prestamos})
 
 @login_required
@@ -130,36 +274,64 @@ def cliente_historial_prestamos(request):
         messages.error(request, 'Solo los clientes pueden ver este historial.')
         return redirect('libros:lista')
 
+    # Una sola consulta: el préstamo (activo o archivado) y su libro se leen con
+    # subconsultas por clave primaria, que solo se evalúan para las filas de la página.
+    prestamo = Prestamo.objects.filter(pk=OuterRef('entidad_id')).order_by()
+    archivado = PrestamoArchivado.objects.filter(pk=OuterRef('entidad_id')).order_by()
     historial = Historial.objects.filter(
         usuario=request.user,
         tipo_entidad='PRESTAMO'
-    ).order_by('-fecha')
-
-    registros = []
-    for registro in historial:
-        try:
-            entidad = Prestamo.objects.get(id=registro.entidad_id)
-            registros.append({
-                'fecha': registro.fecha,
-                'usuario': registro.usuario,
-                'tipo_entidad': registro.tipo_entidad,
-                'entidad': entidad,
-                'tipo_accion': registro.tipo_accion.lower(),
-                'estado_anterior': registro.estado_anterior,
-                'estado_nuevo': registro.estado_nuevo,
-                'detalles': registro.detalles,
-                'prestamo': entidad,
-            })
-        except Prestamo.DoesNotExist:
-            continue
-
-    paginator = Paginator(registros, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    ).filter(Exists(prestamo) | Exists(archivado)).annotate(
+        libro_titulo=Coalesce(
+            Subquery(prestamo.values('libro__titulo')[:1]),
+            Subquery(archivado.values('libro__titulo')[:1]),
+        ),
+    ).only('fecha', 'tipo_accion', 'estado_anterior', 'estado_nuevo', 'detalles')
+
+    tamano = tamano_de_pagina(request, settings.PRESTAMOS_POR_PAGINA, settings.PRESTAMOS_POR_PAGINA_MAXIMO)
+    pagina = paginar_por_cursor(historial, ('-fecha', '-id'), request, tamano)
+    url_anterior, url_siguiente = pagina.enlaces(request)
 
     return render(request, 'prestamos/cliente_historial_prestamos.html', {
-        'registros': page_obj,
-        'page_obj': page_obj,
-        'total_registros': len(registros),
-        'is_paginated': page_obj.has_previous() or page_obj.has_next(),
-    })
\ No newline at end of file
+        'registros': pagina,
+        'url_anterior': url_anterior,
+        'url_siguiente': url_siguiente,
+    })
+
+@login_required
+def estadisticas_circulacion(request):
+    """Circulación del periodo leída sólo de los resúmenes diarios (ver prestamos.circulacion)."""
+    if not request.user.rol in ['ADMINISTRADOR', 'SUPERADMINISTRADOR']:
+        messages.error(request, 'No tienes permisos para ver las estadísticas.')
+        return redirect('usuarios:perfil')
+
+    try:
+        periodo = int(request.GET.get('dias', 30))
+    except ValueError:
+        periodo = 30
+    if periodo not in circulacion.PERIODOS:
+        periodo = 30
+    hasta = timezone.localdate()
+    desde = hasta - timedelta(days=periodo - 1)
+
+    dias = circulacion.por_dia(desde, hasta)
+    categorias = circulacion.principales('CATEGORIA', desde, hasta)
+    usuarios = circulacion.principales('USUARIO', desde, hasta)
+    nombres_categorias = {categoria.id: categoria.nombre for categoria in Categoria.listado()}
+    for fila in categorias:
+        fila['nombre'] = nombres_categorias.get(fila['clave'], 'Sin categoría')
+    nombres_usuarios = Usuario.objects.in_bulk([fila['clave'] for fila in usuarios])
+    for fila in usuarios:
+        fila['usuario'] = nombres_usuarios.get(fila['clave'])
+
+    return render(request, 'prestamos/estadisticas.html', {
+        'periodo': periodo,
+        'periodos': circulacion.PERIODOS,
+        'desde': desde,
+        'hasta': hasta,
+        'totales': circulacion.totales(dias),
+        'agrupacion': circulacion.PERIODOS[periodo],
+        'dias': circulacion.agrupar(dias, circulacion.PERIODOS[periodo])[::-1],
+        'categorias': categorias,
+        'usuarios': usuarios,
+    })
@@ -1,3 +1,63 @@
-from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve, reverse
+from biblioteca.replicas import COOKIE_PRIMARIO, EnrutadorReplicas, ReplicasMiddleware
+from biblioteca.pruebas import PlanDeConsultaMixin
+from libros.models import Libro
+from prestamos.models import Prestamo
+from .models import Usuario
 
-# Create your tests here.
+
+class PlanDeConsultaUsuariosTests(PlanDeConsultaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cliente = Usuario.objects.create_user('lector', password='clave', rol='CLIENTE')
+        admin = Usuario.objects.create_user('bibliotecario', password='clave', rol='ADMINISTRADOR')
+        for i in range(5):
+            libro = Libro.objects.create(
+                titulo=f'Libro {i}', autor='Autor', editorial='Editorial',
+                año_publicacion=2000, descripcion='',
+            )
+            Prestamo.objects.create(usuario=cls.cliente, libro=libro).aprobar(admin)
+
+    def test_perfil_usuario(self):
+        self.client.force_login(self.cliente)
+        self.assertSinEscaneoCompleto(reverse('usuarios:perfil'))
+
+
+@override_settings(REPLICAS=['replica'])
+class EnrutadorReplicasTests(SimpleTestCase):
+    def ejecutar(self, url, vista):
+        request = RequestFactory().get(url)
+        request.resolver_match = resolve(url)
+        request.user = AnonymousUser()
+        middleware = ReplicasMiddleware(
+            lambda request: middleware.process_view(request, vista, (), {}) or vista(request)
+        )
+        return middleware(request)
+
+    def test_lecturas_en_replica_hasta_la_primera_escritura(self):
+        enrutador = EnrutadorReplicas()
+        destinos = []
+
+        def vista(request):
+            destinos.append(enrutador.db_for_read(Usuario))
+            enrutador.db_for_write(Usuario)
+            destinos.append(enrutador.db_for_read(Usuario))
+            return HttpResponse()
+
+        respuesta = self.ejecutar(reverse('usuarios:lista_usuarios'), vista)
+        self.assertEqual(destinos, ['replica', None])
+        self.assertIn(COOKIE_PRIMARIO, respuesta.cookies)
+
+    def test_vistas_no_listadas_leen_del_primario(self):
+        enrutador = EnrutadorReplicas()
+        destinos = []
+
+        def vista(request):
+            destinos.append(enrutador.db_for_read(Usuario))
+            return HttpResponse()
+
+        self.ejecutar(reverse('usuarios:perfil'), vista)
+        self.assertEqual(destinos, [None])
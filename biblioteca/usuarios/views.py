@@ -7,7 +7,9 @@ from .forms import RegistroUsuarioForm, ActualizarPerfilForm, LoginForm, Registr
 from historial.models import Historial
 from prestamos.models import Prestamo
 from django.utils import timezone
+from biblioteca.transacciones import transaccion_por_peticion
 
+@transaccion_por_peticion
 def registro_usuario(request):
     if request.method == 'POST':
         form = RegistroUsuarioForm(request.POST)
@@ -65,6 +67,7 @@ def logout_usuario(request):
     return redirect('usuarios:login')
 
 @login_required
+@transaccion_por_peticion
 def perfil_usuario(request):
     if request.method == 'POST':
         form = ActualizarPerfilForm(request.POST, instance=request.user)
@@ -103,6 +106,7 @@ def lista_usuarios(request):
     return render(request, 'usuarios/lista_usuarios.html', {'usuarios': usuarios})
 
 @login_required
+@transaccion_por_peticion
 def registrar_admin(request):
     if not request.user.is_superadmin and not request.user.is_admin:
         messages.error(request, 'No tienes permisos para registrar administradores.')